@@ -5,7 +5,10 @@ Simulador interativo de contratos DI futuro.
 
 import streamlit as st
 import plotly.graph_objects as go
+import numpy as np
+import pandas as pd
 import math
+import datetime
 
 
 # CSS customizado para melhorar o visual
@@ -101,6 +104,265 @@ def formatar_numero(valor):
     return f"{valor:,.0f}".replace(",", ".")
 
 
+# Feriados nacionais de data fixa (mês, dia) usados pela ANBIMA/B3
+FERIADOS_FIXOS = [(1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (12, 25)]
+
+# Dia da Consciência Negra é feriado nacional a partir de 2024 (Lei 14.759/2023)
+ANO_CONSCIENCIA_NEGRA = 2024
+
+# Carnaval (segunda e terça), Sexta-feira Santa e Corpus Christi em dias a partir da Páscoa
+FERIADOS_MOVEIS = [-48, -47, -2, 60]
+
+
+def calcular_pascoa(ano):
+    """Calcula a data da Páscoa (algoritmo de Meeus/Jones/Butcher)."""
+    a, b, c = ano % 19, ano // 100, ano % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return datetime.date(ano, mes, dia)
+
+
+def feriados_nacionais(ano_inicio, ano_fim):
+    """Lista ordenada dos feriados nacionais entre os anos informados (inclusive)."""
+    feriados = []
+    for ano in range(ano_inicio, ano_fim + 1):
+        fixos = FERIADOS_FIXOS + ([(11, 20)] if ano >= ANO_CONSCIENCIA_NEGRA else [])
+        feriados.extend(datetime.date(ano, mes, dia) for mes, dia in fixos)
+        pascoa = calcular_pascoa(ano)
+        feriados.extend(pascoa + datetime.timedelta(days=dias) for dias in FERIADOS_MOVEIS)
+    return sorted(set(feriados))
+
+
+def converter_datas(datas):
+    """Converte data(s) em ordinais int32 (dias desde 1970-01-01)."""
+    return np.asarray(datas, dtype='datetime64[D]').astype(np.int32)
+
+
+class CalendarioDiasUteis:
+    """
+    Calendário de dias úteis com índice acumulado pré-calculado.
+
+    Os feriados ficam em um array int32 ordenado de ordinais e o índice
+    acumulado guarda, para cada dia do intervalo coberto, quantos dias úteis
+    existem desde o início. Assim a contagem de dias úteis entre duas datas
+    é uma subtração de duas posições do índice, vetorizada sobre arrays.
+    """
+
+    def __init__(self, feriados, inicio, fim):
+        self.inicio = int(converter_datas(inicio))
+        self.fim = int(converter_datas(fim))
+        self.feriados = np.unique(converter_datas(feriados))
+        dias = np.arange(self.inicio, self.fim + 1, dtype=np.int32)
+        # 1970-01-01 foi uma quinta-feira: (ordinal + 3) % 7 dá 0 = segunda
+        dia_util = ((dias + 3) % 7 < 5) & ~np.isin(dias, self.feriados)
+        self.dias_uteis_acumulados = np.concatenate([[0], np.cumsum(dia_util, dtype=np.int32)])
+
+    def _posicoes(self, datas):
+        """Posição das datas no índice, validando o intervalo coberto."""
+        ordinais = converter_datas(datas)
+        if np.any(ordinais < self.inicio) or np.any(ordinais > self.fim):
+            raise ValueError("Data fora do intervalo coberto pelo calendário")
+        return ordinais - self.inicio
+
+    def eh_dia_util(self, datas):
+        """Indica se cada data é dia útil."""
+        posicoes = self._posicoes(datas)
+        return self.dias_uteis_acumulados[posicoes + 1] > self.dias_uteis_acumulados[posicoes]
+
+    def dias_uteis(self, data_inicio, data_fim):
+        """
+        Número de dias úteis entre as datas, incluindo a inicial e excluindo a
+        final (convenção ANBIMA/B3). Aceita datas únicas ou arrays de datas.
+        """
+        return (self.dias_uteis_acumulados[self._posicoes(data_fim)]
+                - self.dias_uteis_acumulados[self._posicoes(data_inicio)])
+
+    def somar_dias_uteis(self, datas, dias_uteis):
+        """Data que fica dias_uteis dias úteis após cada data (a partir do próximo dia útil)."""
+        alvo = self.dias_uteis_acumulados[self._posicoes(datas)] + np.asarray(dias_uteis)
+        if np.any(alvo < 0) or np.any(alvo >= self.dias_uteis_acumulados[-1]):
+            raise ValueError("Data fora do intervalo coberto pelo calendário")
+        posicoes = np.searchsorted(self.dias_uteis_acumulados, alvo + 1) - 1
+        return (posicoes + self.inicio).astype('datetime64[D]')
+
+    def ajustar_dia_util(self, datas):
+        """Próximo dia útil de cada data (a própria data se já for dia útil)."""
+        return self.somar_dias_uteis(datas, 0)
+
+
+@st.cache_resource
+def get_calendario_b3(ano_inicio=2000, ano_fim=2078):
+    """Calendário de dias úteis da B3 (feriados nacionais), construído uma vez por sessão do servidor."""
+    return CalendarioDiasUteis(
+        feriados_nacionais(ano_inicio, ano_fim),
+        datetime.date(ano_inicio, 1, 1),
+        datetime.date(ano_fim, 12, 31)
+    )
+
+
+# Letras de vencimento dos contratos futuros da B3 (janeiro a dezembro)
+LETRAS_VENCIMENTO = "FGHJKMNQUVXZ"
+
+
+def vencimentos_di1(calendario, anos, meses):
+    """Datas de vencimento do DI1 (primeiro dia útil do mês), vetorizado sobre anos e meses."""
+    meses_absolutos = (np.asarray(anos) - 1970) * 12 + np.asarray(meses) - 1
+    primeiros_dias = meses_absolutos.astype('datetime64[M]').astype('datetime64[D]')
+    return calendario.ajustar_dia_util(primeiros_dias)
+
+
+class CurvaDI:
+    """
+    Curva zero de juros construída a partir de uma strip de taxas de DI1.
+
+    Cada DI1 é um zero-cupom, então o fator de desconto de cada vértice sai
+    direto da taxa: (1 + taxa) ^ (-DU/252). Entre vértices a interpolação é a
+    exponencial da ANBIMA (flat-forward 252), em que o log do fator de
+    desconto é linear em dias úteis; após o último vértice a última taxa a
+    termo é mantida. Os fatores são pré-calculados para todos os dias úteis
+    até o último vértice, então consultar um prazo é indexar um array.
+
+    Parâmetros:
+    prazos_du: Prazo de cada vértice em dias úteis
+    taxas: Taxa de cada vértice (decimal, % a.a. base 252)
+    """
+
+    def __init__(self, prazos_du, taxas):
+        ordem = np.argsort(prazos_du)
+        self.prazos_du = np.asarray(prazos_du, dtype=np.int32)[ordem]
+        self.taxas = np.asarray(taxas, dtype=float)[ordem]
+        if self.prazos_du.size == 0 or self.prazos_du[0] <= 0 or np.any(np.diff(self.prazos_du) == 0):
+            raise ValueError("Os vértices devem ter prazos positivos e distintos")
+
+        log_fatores_vertices = -self.prazos_du / 252 * np.log1p(self.taxas)
+        # Vértice implícito em DU 0 com fator 1: antes do primeiro vértice vale a sua taxa
+        prazos = np.concatenate([[0], self.prazos_du])
+        log_fatores = np.concatenate([[0.0], log_fatores_vertices])
+        self.log_fatores = np.interp(np.arange(self.prazos_du[-1] + 1), prazos, log_fatores)
+        self.fatores_desconto = np.exp(self.log_fatores)
+        self.log_termo_final = (log_fatores[-1] - log_fatores[-2]) / (prazos[-1] - prazos[-2])
+
+    def fator_desconto(self, prazos_du):
+        """
+        Fator de desconto para prazo(s) em dias úteis.
+
+        Prazos inteiros indexam direto os fatores pré-calculados; prazos
+        fracionários (floats) interpolam o log do fator, o que é exato na
+        interpolação flat-forward 252.
+        """
+        prazos_du = np.asarray(prazos_du)
+        ultimo = self.prazos_du[-1]
+        if np.issubdtype(prazos_du.dtype, np.integer):
+            dentro = self.log_fatores[np.clip(prazos_du, 0, ultimo)]
+        else:
+            dentro = np.interp(prazos_du, np.arange(ultimo + 1), self.log_fatores)
+        return np.exp(np.where(prazos_du > ultimo, self.log_fatores[-1] + self.log_termo_final * (prazos_du - ultimo), dentro))
+
+    def taxa_zero(self, prazos_du):
+        """Taxa zero (% a.a. base 252, decimal) para prazo(s) em dias úteis."""
+        prazos_du = np.maximum(np.asarray(prazos_du), 1)
+        return self.fator_desconto(prazos_du) ** (-252 / prazos_du) - 1
+
+    def taxa_termo(self, prazo_inicio, prazo_fim):
+        """Taxa a termo (% a.a. base 252, decimal) entre dois prazos em dias úteis."""
+        prazo_inicio, prazo_fim = np.asarray(prazo_inicio), np.asarray(prazo_fim)
+        razao = self.fator_desconto(prazo_inicio) / self.fator_desconto(prazo_fim)
+        return razao ** (252 / np.maximum(prazo_fim - prazo_inicio, 1)) - 1
+
+    def pu(self, prazos_du):
+        """PU do DI1 (valor presente de R$ 100.000) para prazo(s) em dias úteis."""
+        return 100000 * self.fator_desconto(prazos_du)
+
+    def deslocar(self, choque, vertices=None):
+        """
+        Nova curva com as taxas deslocadas por choque (decimal).
+
+        Sem vertices o choque é paralelo; caso contrário só os vértices
+        indicados (índices) são deslocados.
+        """
+        taxas = self.taxas.copy()
+        if vertices is None:
+            taxas += choque
+        else:
+            taxas[vertices] += choque
+        return CurvaDI(self.prazos_du, taxas)
+
+
+@st.cache_resource(max_entries=32)
+def construir_curva_di(data_base, vencimentos, taxas):
+    """
+    Curva DI a partir de uma strip de vencimentos (datas) e taxas, cacheada
+    por strip para ser reutilizada entre reruns e instrumentos. vencimentos
+    e taxas devem ser tuplas.
+    """
+    prazos_du = get_calendario_b3().dias_uteis(data_base, np.array(vencimentos, dtype='datetime64[D]'))
+    validos = prazos_du > 0
+    return CurvaDI(prazos_du[validos], np.asarray(taxas)[validos])
+
+
+def strip_di1_exemplo(data_base):
+    """Strip ilustrativa de DI1: vencimentos trimestrais nos dois primeiros anos e anuais até dez anos."""
+    ano = data_base.year
+    anos = [ano + 1 + i // 4 for i in range(8)] + list(range(ano + 3, ano + 11))
+    meses = [1, 4, 7, 10] * 2 + [1] * 8
+    vencimentos = vencimentos_di1(get_calendario_b3(), anos, meses)
+    prazo_anos = (vencimentos - np.datetime64(data_base, 'D')).astype(float) / 365
+    # Curva com leve inversão no curto prazo e inclinação positiva no longo
+    taxas = 0.135 + 0.012 * np.exp(-prazo_anos / 1.5) + 0.003 * (1 - np.exp(-prazo_anos / 4))
+    return pd.DataFrame({
+        "Contrato": [f"DI1{LETRAS_VENCIMENTO[m - 1]}{a % 100:02d}" for a, m in zip(anos, meses)],
+        "Vencimento": pd.to_datetime(vencimentos).date,
+        "Taxa (% a.a.)": np.round(taxas * 100, 2)
+    })
+
+
+def criar_grafico_curva_di(curva):
+    """Cria o gráfico da curva zero e das taxas a termo diárias."""
+    prazos = np.arange(1, curva.prazos_du[-1] + 1)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=prazos,
+        y=curva.taxa_zero(prazos) * 100,
+        mode='lines',
+        name='Taxa Zero',
+        line=dict(color='#3498db', width=2),
+        hovertemplate='<b>%{x} DU</b><br>Taxa: %{y:.3f}%<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=prazos,
+        y=curva.taxa_termo(prazos - 1, prazos) * 100,
+        mode='lines',
+        name='Taxa a Termo (Flat-Forward)',
+        line=dict(color='#e67e22', width=1, dash='dot'),
+        hovertemplate='<b>%{x} DU</b><br>Termo: %{y:.3f}%<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=curva.prazos_du,
+        y=curva.taxas * 100,
+        mode='markers',
+        name='Vértices DI1',
+        marker=dict(color='#2c3e50', size=8),
+        hovertemplate='<b>%{x} DU</b><br>DI1: %{y:.2f}%<extra></extra>'
+    ))
+    fig.update_layout(
+        title={'text': 'Curva de Juros DI1', 'x': 0.5, 'xanchor': 'center', 'font': {'size': 16}},
+        xaxis_title="Prazo (dias úteis)",
+        yaxis_title="Taxa (% a.a.)",
+        height=400,
+        hovermode='x unified',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+    )
+    return fig
+
+
 def calcular_pu_contratacao(taxa_contratacao, prazo_vencimento):
     """Calcula o PU na contratação."""
     return 100000 / ((1 + taxa_contratacao) ** (prazo_vencimento / 252))
@@ -255,16 +517,47 @@ def render():
             key="futuros_valor_nocional"
         )
 
-        prazo_vencimento = st.number_input(
-            "Prazo para Vencimento (dias úteis):",
-            min_value=1,
-            max_value=252,
-            value=10,
-            step=1,
-            help="Número de dias úteis até o vencimento (ano = 252 dias úteis)",
-            key="futuros_prazo_vencimento"
+        usar_datas = st.checkbox(
+            "Calcular prazo por datas (calendário B3)",
+            value=False,
+            help="Conta os dias úteis entre as datas considerando fins de semana e feriados nacionais",
+            key="futuros_usar_datas"
         )
 
+        if usar_datas:
+            data_col1, data_col2 = st.columns(2)
+            with data_col1:
+                data_contratacao = st.date_input(
+                    "Data de Contratação:",
+                    value=datetime.date.today(),
+                    min_value=datetime.date(2000, 1, 1),
+                    max_value=datetime.date(2077, 12, 31),
+                    key="futuros_data_contratacao"
+                )
+            with data_col2:
+                data_vencimento = st.date_input(
+                    "Data de Vencimento:",
+                    value=data_contratacao + datetime.timedelta(days=14),
+                    min_value=data_contratacao + datetime.timedelta(days=1),
+                    max_value=datetime.date(2078, 12, 31),
+                    key="futuros_data_vencimento"
+                )
+            prazo_vencimento = int(get_calendario_b3().dias_uteis(data_contratacao, data_vencimento))
+            if prazo_vencimento <= 0:
+                st.error("Não há dias úteis entre a contratação e o vencimento; escolha um vencimento posterior.")
+                return
+            st.caption(f"Prazo para vencimento: {prazo_vencimento} dias úteis")
+        else:
+            prazo_vencimento = st.number_input(
+                "Prazo para Vencimento (dias úteis):",
+                min_value=1,
+                max_value=252,
+                value=10,
+                step=1,
+                help="Número de dias úteis até o vencimento (ano = 252 dias úteis)",
+                key="futuros_prazo_vencimento"
+            )
+
     with col2:
         taxa_contratacao = st.number_input(
             "Taxa de Juros na Contratação (% a.a.):",
@@ -427,6 +720,40 @@ def render():
         """)
 
 
+    with st.expander("📉 Curva de Juros DI1 (Flat-Forward 252)"):
+        st.markdown("""
+        A curva zero é construída a partir das taxas dos contratos DI1 negociados. Entre os vértices,
+        a interpolação é **exponencial (flat-forward 252)**, padrão ANBIMA: a taxa a termo é constante
+        entre dois vencimentos consecutivos.
+        """)
+        data_base = st.date_input(
+            "Data Base:",
+            value=datetime.date.today(),
+            min_value=datetime.date(2000, 1, 1),
+            max_value=datetime.date(2067, 12, 31),
+            key="futuros_curva_data_base"
+        )
+        strip = st.data_editor(
+            strip_di1_exemplo(data_base),
+            disabled=["Contrato", "Vencimento"],
+            hide_index=True,
+            use_container_width=True,
+            key=f"futuros_curva_strip_{data_base}"
+        )
+        curva = construir_curva_di(
+            data_base,
+            tuple(strip["Vencimento"]),
+            tuple(strip["Taxa (% a.a.)"].astype(float) / 100)
+        )
+        st.plotly_chart(criar_grafico_curva_di(curva), use_container_width=True)
+
+        curva_col1, curva_col2 = st.columns(2)
+        with curva_col1:
+            st.metric(f"Taxa da Curva para {prazo_vencimento} DU", f"{float(curva.taxa_zero(prazo_vencimento)) * 100:.2f}% a.a.")
+        with curva_col2:
+            st.metric("PU pela Curva", formatar_moeda(float(curva.pu(prazo_vencimento))))
+
+
 # Permitir execução standalone para testes
 if __name__ == "__main__":
     render()
\ No newline at end of file
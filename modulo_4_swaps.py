@@ -6,8 +6,10 @@ Calculadora de operações de swap no mercado brasileiro.
 import streamlit as st
 import plotly.graph_objects as go
 import numpy as np
+import datetime
 from enum import Enum
 from dataclasses import dataclass
+from modulo_3_futuros import CurvaDI, construir_curva_di, strip_di1_exemplo
 
 
 # Enums for swap types
@@ -140,82 +142,60 @@ class SwapCalculator:
             'total_result': exposure_result + hedge_result
         }
 
-    def generate_time_series(self):
-        """Generate time series data for plotting."""
-        # Create time points (one point per quarter)
-        quarters = np.arange(self.swap_params.quarters + 1)  # Include start point
-        
-        exposure_values = []
-        asset_values = []
-        liability_values = []
-        
-        # Check if we need to handle exchange rates
-        has_exchange_rate = (self.swap_params.indexer == IndexerType.EXCHANGE_RATE or 
-                            self.hedge_params.asset_indexer == IndexerType.EXCHANGE_RATE or 
-                            self.hedge_params.liability_indexer == IndexerType.EXCHANGE_RATE)
-        
-        for q in quarters:
-            # For quarter 0, all values are 0
-            if q == 0:
-                exposure_values.append(0)
-                asset_values.append(0)
-                liability_values.append(0)
-                continue
-            
-            # Initialize exchange variation
-            exchange_variation = 0
-                
-            # Calculate exchange rate at current quarter if needed
-            if has_exchange_rate:
-                current_fx = self.swap_params.exchange_rate_start + \
-                    (self.hedge_params.exchange_rate_maturity - self.swap_params.exchange_rate_start) * \
-                    (q / self.swap_params.quarters)
-                exchange_variation = (current_fx / self.swap_params.exchange_rate_start) - 1
-            
-            # Calculate exposure values
-            if self.swap_params.indexer == IndexerType.PRE_FIXED:
-                exposure_adj = self._calculate_pre_fixed_adjustment(self.swap_params.rate, q)
-            elif self.swap_params.indexer == IndexerType.POST_FIXED:
-                exposure_adj = self.swap_params.rate * (q / self.swap_params.quarters)
-            else:  # Exchange Rate
-                rate_adj = (1 + self.swap_params.rate) ** (q / 4) - 1
-                exposure_adj = (1 + exchange_variation) * (1 + rate_adj) - 1
-            
-            exposure_value = self.swap_params.notional * exposure_adj
-            exposure_values.append(-exposure_value if self.swap_params.exposure_type == ExposureType.LIABILITY else exposure_value)
-            
-            # Calculate asset leg values
-            if self.hedge_params.asset_indexer == IndexerType.PRE_FIXED:
-                asset_adj = self._calculate_pre_fixed_adjustment(self.hedge_params.asset_rate, q)
-            elif self.hedge_params.asset_indexer == IndexerType.POST_FIXED:
-                asset_adj = self.hedge_params.asset_rate * (q / self.swap_params.quarters)
-            else:  # Exchange Rate
-                cupom_adj = (1 + self.hedge_params.asset_cupom_cambial) ** (q / 4) - 1
-                asset_adj = (1 + exchange_variation) * (1 + cupom_adj) - 1
-            
-            asset_values.append(self.swap_params.notional * asset_adj)
-            
-            # Calculate liability leg values (now making it negative)
-            if self.hedge_params.liability_indexer == IndexerType.PRE_FIXED:
-                liability_adj = self._calculate_pre_fixed_adjustment(self.hedge_params.liability_rate, q)
-            elif self.hedge_params.liability_indexer == IndexerType.POST_FIXED:
-                liability_adj = self.hedge_params.liability_rate * (q / self.swap_params.quarters)
-            else:  # Exchange Rate
-                cupom_adj = (1 + self.hedge_params.liability_cupom_cambial) ** (q / 4) - 1
-                liability_adj = (1 + exchange_variation) * (1 + cupom_adj) - 1
-            
-            # Make liability negative since it's a payment obligation
-            liability_values.append(-self.swap_params.notional * liability_adj)
-        
-        # Calculate net position
-        net_values = [e + a + l for e, a, l in zip(exposure_values, asset_values, liability_values)]
-        
+    # Time series points per year for each granularity
+    PERIODS_PER_YEAR = {'quarterly': 4, 'daily': 252}
+
+    def _leg_adjustment_curve(self, indexer, rate, cupom_cambial, years, life_fraction, exchange_variation):
+        """Accumulated adjustment of one leg at every time point, as an array."""
+        if indexer == IndexerType.PRE_FIXED:
+            return self._calculate_pre_fixed_adjustment(rate, 4 * years)
+        if indexer == IndexerType.POST_FIXED:
+            return rate * life_fraction
+        # Exchange Rate: FX variation compounded with the rate (exposure) or cupom cambial (hedge legs)
+        carry = rate if cupom_cambial is None else cupom_cambial
+        return (1 + exchange_variation) * (1 + carry) ** years - 1
+
+    def generate_time_series(self, granularity='quarterly'):
+        """
+        Generate time series data for plotting.
+
+        Every leg is computed for all time points at once. granularity is
+        'quarterly' (one point per quarter) or 'daily' (252 business days per
+        year); 'quarters' holds the time of each point in quarters.
+        """
+        periods_per_year = self.PERIODS_PER_YEAR[granularity]
+        total_years = self.swap_params.quarters / 4
+        n_periods = int(round(total_years * periods_per_year))
+        years = np.arange(n_periods + 1) / periods_per_year  # Include start point
+        life_fraction = years / total_years
+
+        # Exchange rate moves linearly from the initial to the final rate
+        exchange_variation = np.zeros_like(years)
+        if IndexerType.EXCHANGE_RATE in (self.swap_params.indexer, self.hedge_params.asset_indexer,
+                                         self.hedge_params.liability_indexer):
+            if self.swap_params.exchange_rate_start is None or self.hedge_params.exchange_rate_maturity is None:
+                raise ValueError("Exchange rates must be provided for exchange rate calculations")
+            exchange_variation = (self.hedge_params.exchange_rate_maturity / self.swap_params.exchange_rate_start - 1) * life_fraction
+
+        notional = self.swap_params.notional
+        exposure = notional * self._leg_adjustment_curve(
+            self.swap_params.indexer, self.swap_params.rate, None, years, life_fraction, exchange_variation)
+        if self.swap_params.exposure_type == ExposureType.LIABILITY:
+            exposure = -exposure
+        asset = notional * self._leg_adjustment_curve(
+            self.hedge_params.asset_indexer, self.hedge_params.asset_rate, self.hedge_params.asset_cupom_cambial,
+            years, life_fraction, exchange_variation)
+        # Liability leg is negative since it's a payment obligation
+        liability = -notional * self._leg_adjustment_curve(
+            self.hedge_params.liability_indexer, self.hedge_params.liability_rate,
+            self.hedge_params.liability_cupom_cambial, years, life_fraction, exchange_variation)
+
         return {
-            'quarters': quarters,
-            'exposure': exposure_values,
-            'asset': asset_values,
-            'liability': liability_values,
-            'net': net_values
+            'quarters': years * 4,
+            'exposure': exposure,
+            'asset': asset,
+            'liability': liability,
+            'net': exposure + asset + liability
         }
 
     def generate_report(self):
@@ -259,17 +239,288 @@ The combined position resulted in a {'profit' if results['total_result'] > 0 els
         return report
 
 
+# Indexers in int8 code order used by SwapBook
+INDEXERS = list(IndexerType)
+INDEXER_CODES = {indexer: code for code, indexer in enumerate(INDEXERS)}
+
+
+class SwapBook:
+    """
+    Book of exposure + hedge swap pairs in struct-of-arrays form.
+
+    Each attribute holds one value per swap: indexers as int8 codes into
+    INDEXERS, exposure sign as +1 (asset) / -1 (liability) and every rate,
+    notional and exchange rate as float64 (NaN where not applicable). Results
+    are computed one indexer combination at a time, so each group runs the
+    same formulas as SwapCalculator as plain array arithmetic with no
+    per-swap branching.
+    """
+
+    FIELDS = ('exposure_sign', 'notional', 'indexer', 'rate', 'quarters', 'exchange_rate_start',
+              'asset_indexer', 'liability_indexer', 'asset_rate', 'liability_rate',
+              'asset_cupom_cambial', 'liability_cupom_cambial', 'exchange_rate_maturity')
+
+    def __init__(self, exposure_sign, notional, indexer, rate, quarters, exchange_rate_start,
+                 asset_indexer, liability_indexer, asset_rate, liability_rate,
+                 asset_cupom_cambial, liability_cupom_cambial, exchange_rate_maturity):
+        self.exposure_sign = np.asarray(exposure_sign, dtype=np.int8)
+        self.notional = np.asarray(notional, dtype=np.float64)
+        self.indexer = np.asarray(indexer, dtype=np.int8)
+        self.rate = np.asarray(rate, dtype=np.float64)
+        self.quarters = np.asarray(quarters, dtype=np.float64)
+        self.exchange_rate_start = np.asarray(exchange_rate_start, dtype=np.float64)
+        self.asset_indexer = np.asarray(asset_indexer, dtype=np.int8)
+        self.liability_indexer = np.asarray(liability_indexer, dtype=np.int8)
+        self.asset_rate = np.asarray(asset_rate, dtype=np.float64)
+        self.liability_rate = np.asarray(liability_rate, dtype=np.float64)
+        self.asset_cupom_cambial = np.asarray(asset_cupom_cambial, dtype=np.float64)
+        self.liability_cupom_cambial = np.asarray(liability_cupom_cambial, dtype=np.float64)
+        self.exchange_rate_maturity = np.asarray(exchange_rate_maturity, dtype=np.float64)
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Build a book from an iterable of (SwapParameters, HedgeParameters) pairs."""
+        def value(x):
+            return np.nan if x is None else x
+
+        rows = [(1 if swap.exposure_type == ExposureType.ASSET else -1, swap.notional,
+                 INDEXER_CODES[swap.indexer], swap.rate, swap.quarters, value(swap.exchange_rate_start),
+                 INDEXER_CODES[hedge.asset_indexer], INDEXER_CODES[hedge.liability_indexer],
+                 hedge.asset_rate, hedge.liability_rate, value(hedge.asset_cupom_cambial),
+                 value(hedge.liability_cupom_cambial), value(hedge.exchange_rate_maturity))
+                for swap, hedge in pairs]
+        return cls(*(np.array(column, dtype=float) for column in zip(*rows)))
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Build a book from a DataFrame with one column per name in FIELDS."""
+        return cls(*(frame[field].to_numpy() for field in cls.FIELDS))
+
+    def __len__(self):
+        return self.notional.size
+
+    def _groups(self):
+        """
+        Sort the swaps by indexer combination.
+
+        Returns the sort order, the start of each group in it and each
+        group's (exposure, asset, liability) indexer codes.
+        """
+        n = len(INDEXERS)
+        keys = (self.indexer.astype(np.int16) * n + self.asset_indexer) * n + self.liability_indexer
+        order = np.argsort(keys, kind='stable')
+        starts = np.flatnonzero(np.r_[True, np.diff(keys[order]) != 0])
+        group_keys = keys[order][starts]
+        return order, starts, np.column_stack([group_keys // (n * n), group_keys // n % n, group_keys % n])
+
+    def _adjustments(self, code, rate, cupom_cambial, quarters, exchange_variation):
+        """Accumulated adjustment of one leg for a group sharing the indexer code."""
+        if INDEXERS[code] == IndexerType.PRE_FIXED:
+            return (1 + rate) ** (quarters / 4) - 1
+        if INDEXERS[code] == IndexerType.POST_FIXED:
+            return rate
+        if np.isnan(exchange_variation).any():
+            raise ValueError("Exchange rates must be provided for exchange rate calculations")
+        # Exposure compounds its rate with the FX variation, hedge legs their cupom cambial
+        carry = rate if cupom_cambial is None else cupom_cambial
+        return (1 + exchange_variation) * (1 + carry) ** (quarters / 4) - 1
+
+    def calculate_total_result(self):
+        """
+        Exposure, hedge and total result of every swap in one pass.
+
+        Returns a dict of arrays with the same keys as
+        SwapCalculator.calculate_total_result.
+        """
+        exposure = np.empty_like(self.notional)
+        hedge = np.empty_like(self.notional)
+        exchange_variation = self.exchange_rate_maturity / self.exchange_rate_start - 1
+
+        order, starts, codes = self._groups()
+        for group, (exposure_code, asset_code, liability_code) in zip(np.split(order, starts[1:]), codes):
+            quarters = self.quarters[group]
+            fx = exchange_variation[group]
+            exposure[group] = self.exposure_sign[group] * self.notional[group] * self._adjustments(
+                exposure_code, self.rate[group], None, quarters, fx)
+            hedge[group] = self.notional[group] * (
+                self._adjustments(asset_code, self.asset_rate[group], self.asset_cupom_cambial[group], quarters, fx)
+                - self._adjustments(liability_code, self.liability_rate[group],
+                                    self.liability_cupom_cambial[group], quarters, fx))
+
+        return {
+            'exposure_result': exposure,
+            'hedge_result': hedge,
+            'total_result': exposure + hedge
+        }
+
+    def summary(self, results=None):
+        """Count and summed results per indexer combination, one row per combination."""
+        results = self.calculate_total_result() if results is None else results
+        order, starts, codes = self._groups()
+        return {
+            'exposure_indexer': [INDEXERS[code].value for code in codes[:, 0]],
+            'asset_indexer': [INDEXERS[code].value for code in codes[:, 1]],
+            'liability_indexer': [INDEXERS[code].value for code in codes[:, 2]],
+            'swaps': np.diff(np.r_[starts, len(self)]),
+            'notional': np.add.reduceat(self.notional[order], starts),
+            **{name: np.add.reduceat(values[order], starts) for name, values in results.items()}
+        }
+
+
+def random_swap_book(n_swaps, seed=None):
+    """
+    Generate a random training swap book.
+
+    Rates are drawn around current Brazilian levels, maturities up to five
+    years and exchange rates around 5.00 BRL/USD.
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.arange(len(INDEXERS), dtype=np.int8)
+    exchange_rate_start = np.round(rng.uniform(4.8, 5.4, n_swaps), 4)
+    return SwapBook(
+        rng.choice([1, -1], n_swaps),
+        np.round(rng.uniform(1, 50, n_swaps)) * 1e6,
+        rng.choice(codes, n_swaps),
+        np.round(rng.uniform(0.05, 0.15, n_swaps), 4),
+        rng.integers(1, 21, n_swaps),
+        exchange_rate_start,
+        rng.choice(codes, n_swaps),
+        rng.choice(codes, n_swaps),
+        np.round(rng.uniform(0.05, 0.15, n_swaps), 4),
+        np.round(rng.uniform(0.05, 0.15, n_swaps), 4),
+        np.round(rng.uniform(0.02, 0.07, n_swaps), 4),
+        np.round(rng.uniform(0.02, 0.07, n_swaps), 4),
+        np.round(exchange_rate_start * rng.lognormal(0, 0.15, n_swaps), 4)
+    )
+
+
+# Business days per quarter used to turn swap quarters into a DU term
+BUSINESS_DAYS_PER_QUARTER = 63
+
+
+class SwapMarkToMarket:
+    """
+    Mark-to-market of the hedge swaps in a SwapBook against DI and cupom curves.
+
+    Each leg is projected once to its value at maturity: pre-fixed legs
+    compound their rate, FX legs compound the cupom cambial over the FX
+    variation and CDI (post-fixed) legs are worth par, since the CDI accrued
+    until maturity is discounted at the same curve that projects it. Pre
+    legs are discounted on the DI curve and FX legs on the cupom cambial
+    curve, so revaluing on a bumped curve only looks up new discount factors.
+
+    Parameters:
+    book: SwapBook with the swaps to value
+    business_days: Term of each swap in business days (default 63 per quarter)
+    fx_spot: Current exchange rate (default the initial rate of each swap)
+    """
+
+    # Curve each leg is discounted on
+    DI, CUPOM, NONE = 0, 1, 2
+
+    def __init__(self, book, business_days=None, fx_spot=None):
+        self.book = book
+        self.business_days = (np.round(book.quarters * BUSINESS_DAYS_PER_QUARTER).astype(np.int32)
+                              if business_days is None else np.asarray(business_days, dtype=np.int32))
+        fx_spot = book.exchange_rate_start if fx_spot is None else np.asarray(fx_spot, dtype=float)
+        self.fx_ratio = fx_spot / book.exchange_rate_start
+        years = self.business_days / 252
+
+        # Rows are the asset and liability legs, received and paid
+        codes = np.stack([book.asset_indexer, book.liability_indexer])
+        rates = np.stack([book.asset_rate, book.liability_rate])
+        cupons = np.stack([book.asset_cupom_cambial, book.liability_cupom_cambial])
+        is_pre = codes == INDEXER_CODES[IndexerType.PRE_FIXED]
+        is_fx = codes == INDEXER_CODES[IndexerType.EXCHANGE_RATE]
+        with np.errstate(invalid='ignore'):
+            final_factor = np.select([is_pre, is_fx], [(1 + rates) ** years, self.fx_ratio * (1 + cupons) ** years], 1.0)
+        self.leg_sign = np.array([[1.0], [-1.0]])
+        self.leg_amounts = book.notional * final_factor
+        self.leg_curve = np.select([is_pre, is_fx], [self.DI, self.CUPOM], self.NONE).astype(np.int8)
+
+    def _discount_factors(self, di_curve, cupom_curve, business_days):
+        """Discount factor of every leg on the curve it is discounted on."""
+        return np.choose(self.leg_curve, [di_curve.fator_desconto(business_days),
+                                          cupom_curve.fator_desconto(business_days),
+                                          np.ones(business_days.shape)])
+
+    def value(self, di_curve, cupom_curve):
+        """
+        Mark-to-market of every swap (asset leg minus liability leg).
+
+        Returns a dict of arrays with the 'asset', 'liability' and 'net'
+        present value of each swap.
+        """
+        legs = self.leg_amounts * self._discount_factors(di_curve, cupom_curve, self.business_days)
+        return {'asset': legs[0], 'liability': -legs[1], 'net': (self.leg_sign * legs).sum(axis=0)}
+
+    def dv01(self, di_curve, cupom_curve, bump=0.0001):
+        """Change in each swap's value for a parallel bump of the DI and of the cupom curve."""
+        base = self.value(di_curve, cupom_curve)['net']
+        return {
+            'di': self.value(di_curve.deslocar(bump), cupom_curve)['net'] - base,
+            'cupom': self.value(di_curve, cupom_curve.deslocar(bump))['net'] - base
+        }
+
+    def key_rate_dv01(self, di_curve, cupom_curve, bump=0.0001):
+        """
+        Book value change for a bump of each curve vertex on its own.
+
+        Returns a dict with one array per curve ('di', 'cupom'), one entry
+        per vertex of that curve.
+        """
+        base = self.value(di_curve, cupom_curve)['net'].sum()
+        return {
+            'di': np.array([self.value(di_curve.deslocar(bump, [k]), cupom_curve)['net'].sum() - base
+                            for k in range(di_curve.prazos_du.size)]),
+            'cupom': np.array([self.value(di_curve, cupom_curve.deslocar(bump, [k]))['net'].sum() - base
+                               for k in range(cupom_curve.prazos_du.size)])
+        }
+
+    def daily_series(self, di_curve, cupom_curve, swap=0, exchange_rate_maturity=None):
+        """
+        Daily mark-to-market of one swap's legs until maturity.
+
+        The curves roll forward as implied, so the CDI accrues at the DI
+        forwards and the remaining life is discounted at forward discount
+        factors. The exchange rate moves linearly from the initial rate to
+        exchange_rate_maturity (default the swap's rate at maturity).
+        """
+        total = int(self.business_days[swap])
+        days = np.arange(total + 1)
+        di_forward = di_curve.fator_desconto(total) / di_curve.fator_desconto(days)
+        cupom_forward = cupom_curve.fator_desconto(total) / cupom_curve.fator_desconto(days)
+        final_rate = self.book.exchange_rate_maturity[swap] if exchange_rate_maturity is None else exchange_rate_maturity
+        fx_path = 1 + (final_rate / self.book.exchange_rate_start[swap] - 1) * days / total
+
+        legs = []
+        for sign, leg in zip(self.leg_sign[:, 0], range(2)):
+            amount = self.leg_amounts[leg, swap]
+            if self.leg_curve[leg, swap] == self.DI:
+                legs.append(sign * amount * di_forward)
+            elif self.leg_curve[leg, swap] == self.CUPOM:
+                legs.append(sign * amount / self.fx_ratio[swap] * fx_path * cupom_forward)
+            else:
+                # CDI leg: par plus the CDI accrued so far
+                legs.append(sign * amount / di_curve.fator_desconto(days))
+        return {'days': days, 'asset': legs[0], 'liability': legs[1], 'net': legs[0] + legs[1]}
+
+
 def criar_grafico_evolucao(time_series):
     """Cria o gráfico de evolução das posições."""
     fig = go.Figure()
     
+    # Markers only when there is one point per quarter
+    quarter_ticks = np.arange(int(np.ceil(time_series['quarters'][-1])) + 1)
+    mode = 'lines+markers' if len(time_series['quarters']) == len(quarter_ticks) else 'lines'
+    
     # Add traces
     fig.add_trace(go.Scatter(
         x=time_series['quarters'],
         y=time_series['exposure'],
         name='Exposure',
         line=dict(color='blue'),
-        mode='lines+markers'
+        mode=mode
     ))
     
     fig.add_trace(go.Scatter(
@@ -277,7 +528,7 @@ def criar_grafico_evolucao(time_series):
         y=time_series['asset'],
         name='Asset Leg',
         line=dict(color='green'),
-        mode='lines+markers'
+        mode=mode
     ))
     
     fig.add_trace(go.Scatter(
@@ -285,7 +536,7 @@ def criar_grafico_evolucao(time_series):
         y=time_series['liability'],
         name='Liability Leg',
         line=dict(color='red'),
-        mode='lines+markers'
+        mode=mode
     ))
     
     fig.add_trace(go.Scatter(
@@ -293,7 +544,7 @@ def criar_grafico_evolucao(time_series):
         y=time_series['net'],
         name='Net Position',
         line=dict(color='purple', dash='dash'),
-        mode='lines+markers'
+        mode=mode
     ))
     
     # Update layout
@@ -304,14 +555,31 @@ def criar_grafico_evolucao(time_series):
         hovermode='x unified',
         xaxis=dict(
             tickmode='array',
-            ticktext=[f'Q{q}' for q in time_series['quarters']],
-            tickvals=time_series['quarters']
+            ticktext=[f'Q{q}' for q in quarter_ticks],
+            tickvals=quarter_ticks
         )
     )
     
     return fig
 
 
+def criar_grafico_mtm(series, shocked_series):
+    """Cria o gráfico da marcação a mercado diária do swap, antes e depois do choque."""
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=series['days'], y=series['asset'], name='Asset Leg', line=dict(color='green')))
+    fig.add_trace(go.Scatter(x=series['days'], y=series['liability'], name='Liability Leg', line=dict(color='red')))
+    fig.add_trace(go.Scatter(x=series['days'], y=series['net'], name='Swap MtM', line=dict(color='purple')))
+    fig.add_trace(go.Scatter(x=shocked_series['days'], y=shocked_series['net'], name='Swap MtM (Shocked Curves)',
+                             line=dict(color='purple', dash='dash')))
+    fig.update_layout(
+        title='Daily Mark-to-Market of the Swap',
+        xaxis_title='Business Days',
+        yaxis_title='Value (R$)',
+        hovermode='x unified'
+    )
+    return fig
+
+
 def render():
     """
     Função principal que renderiza o módulo de Swaps.
@@ -447,6 +715,17 @@ def render():
                 key="swaps_liability_cupom"
             )
 
+        # Initial exchange rate for exchange rate hedge legs when the exposure does not set it
+        if exposure_exchange_rate is None and IndexerType.EXCHANGE_RATE.value in (asset_indexer, liability_indexer):
+            exposure_exchange_rate = st.number_input(
+                "Initial Exchange Rate (BRL/USD)",
+                min_value=0.0,
+                value=5.0,
+                step=0.1,
+                format="%f",
+                key="swaps_hedge_exchange_rate_start"
+            )
+
         # Exchange rate at maturity (shown if any leg uses exchange rate)
         exchange_rate_maturity = None
         if (asset_indexer == IndexerType.EXCHANGE_RATE.value or 
@@ -461,30 +740,38 @@ def render():
                 key="swaps_exchange_rate_maturity"
             )
 
+    granularity = st.radio(
+        "Time Series Granularity",
+        ["Quarterly", "Daily"],
+        horizontal=True,
+        help="Plot one point per quarter or one per business day (252 per year)",
+        key="swaps_granularity"
+    )
+
+    # Create parameters objects
+    swap_params = SwapParameters(
+        exposure_type=ExposureType(exposure_type),
+        notional=float(notional),
+        indexer=IndexerType(exposure_indexer),
+        rate=float(exposure_rate),
+        quarters=int(quarters),
+        exchange_rate_start=float(exposure_exchange_rate) if exposure_exchange_rate is not None else None
+    )
+    
+    hedge_params = HedgeParameters(
+        asset_indexer=IndexerType(asset_indexer),
+        liability_indexer=IndexerType(liability_indexer),
+        asset_rate=float(asset_rate) if asset_indexer != IndexerType.EXCHANGE_RATE.value else 0.0,
+        liability_rate=float(liability_rate) if liability_indexer != IndexerType.EXCHANGE_RATE.value else 0.0,
+        asset_cupom_cambial=float(asset_cupom) if asset_indexer == IndexerType.EXCHANGE_RATE.value else None,
+        liability_cupom_cambial=float(liability_cupom) if liability_indexer == IndexerType.EXCHANGE_RATE.value else None,
+        exchange_rate_maturity=float(exchange_rate_maturity) if (asset_indexer == IndexerType.EXCHANGE_RATE.value or 
+                                                            liability_indexer == IndexerType.EXCHANGE_RATE.value or
+                                                            exposure_indexer == IndexerType.EXCHANGE_RATE.value) else None
+    )
+
     # Calculate button
     if st.button("Calculate Swap Results", key="swaps_calculate_btn"):
-        # Create parameters objects
-        swap_params = SwapParameters(
-            exposure_type=ExposureType(exposure_type),
-            notional=float(notional),
-            indexer=IndexerType(exposure_indexer),
-            rate=float(exposure_rate),
-            quarters=int(quarters),
-            exchange_rate_start=float(exposure_exchange_rate) if exposure_indexer == IndexerType.EXCHANGE_RATE.value else None
-        )
-        
-        hedge_params = HedgeParameters(
-            asset_indexer=IndexerType(asset_indexer),
-            liability_indexer=IndexerType(liability_indexer),
-            asset_rate=float(asset_rate) if asset_indexer != IndexerType.EXCHANGE_RATE.value else 0.0,
-            liability_rate=float(liability_rate) if liability_indexer != IndexerType.EXCHANGE_RATE.value else 0.0,
-            asset_cupom_cambial=float(asset_cupom) if asset_indexer == IndexerType.EXCHANGE_RATE.value else None,
-            liability_cupom_cambial=float(liability_cupom) if liability_indexer == IndexerType.EXCHANGE_RATE.value else None,
-            exchange_rate_maturity=float(exchange_rate_maturity) if (asset_indexer == IndexerType.EXCHANGE_RATE.value or 
-                                                                liability_indexer == IndexerType.EXCHANGE_RATE.value or
-                                                                exposure_indexer == IndexerType.EXCHANGE_RATE.value) else None
-        )
-        
         # Calculate results
         calculator = SwapCalculator(swap_params, hedge_params)
         results = calculator.calculate_total_result()
@@ -523,7 +810,7 @@ def render():
         st.header("Position Evolution Over Time")
         
         # Generate time series data
-        time_series = calculator.generate_time_series()
+        time_series = calculator.generate_time_series(granularity.lower())
         
         # Create and display the plot
         fig = criar_grafico_evolucao(time_series)
@@ -541,6 +828,89 @@ def render():
         All values start at zero and evolve according to their respective rates and adjustments.
         """)
 
+    with st.expander("Swap Book Valuation"):
+        st.markdown("""
+        Values a whole corporate swap book at once. Swaps are stored column by column and
+        grouped by indexer combination, so thousands of trades are priced in a single pass.
+        """)
+        book_col1, book_col2 = st.columns(2)
+        with book_col1:
+            n_swaps = st.number_input("Number of Swaps", min_value=1, max_value=100000, value=5000,
+                                      step=500, key="swaps_book_size")
+        with book_col2:
+            book_seed = st.number_input("Random Seed", min_value=0, value=42, step=1, key="swaps_book_seed")
+
+        book = random_swap_book(int(n_swaps), seed=int(book_seed))
+        book_results = book.calculate_total_result()
+
+        book_res1, book_res2, book_res3 = st.columns(3)
+        book_res1.metric("Book Exposure Result", f"R$ {book_results['exposure_result'].sum():,.2f}")
+        book_res2.metric("Book Swap P&L", f"R$ {book_results['hedge_result'].sum():,.2f}")
+        book_res3.metric("Book Total Result", f"R$ {book_results['total_result'].sum():,.2f}")
+
+        summary = book.summary(book_results)
+        st.dataframe({
+            "Exposure": summary['exposure_indexer'],
+            "Asset Leg": summary['asset_indexer'],
+            "Liability Leg": summary['liability_indexer'],
+            "Swaps": summary['swaps'],
+            "Notional (R$)": summary['notional'],
+            "Exposure Result (R$)": summary['exposure_result'],
+            "Swap P&L (R$)": summary['hedge_result'],
+            "Total Result (R$)": summary['total_result']
+        }, use_container_width=True)
+
+    with st.expander("Mark-to-Market on DI and Cupom Curves"):
+        st.markdown("""
+        Marks the hedge swap to market: pre-fixed legs are discounted on the DI curve (flat-forward 252),
+        exchange rate legs on the cupom cambial curve, and CDI legs stay at par plus accrued CDI.
+        Curve shocks only change discount factors, so DV01 and key-rate risk of the whole book update live.
+        """)
+        curve_col1, curve_col2, curve_col3 = st.columns(3)
+        with curve_col1:
+            di_shock = st.slider("DI Curve Shock (bps)", min_value=-300, max_value=300, value=0, step=5,
+                                 key="swaps_mtm_di_shock")
+        with curve_col2:
+            cupom_level = st.number_input("Cupom Cambial Curve (% p.a.)", min_value=0.0, max_value=20.0, value=5.0,
+                                          step=0.25, key="swaps_mtm_cupom_level")
+        with curve_col3:
+            cupom_shock = st.slider("Cupom Curve Shock (bps)", min_value=-300, max_value=300, value=0, step=5,
+                                    key="swaps_mtm_cupom_shock")
+
+        today = datetime.date.today()
+        strip = strip_di1_exemplo(today)
+        di_curve = construir_curva_di(today, tuple(strip["Vencimento"]), tuple(strip["Taxa (% a.a.)"] / 100))
+        cupom_curve = CurvaDI([252], [cupom_level / 100])
+        shocked_di = di_curve.deslocar(di_shock / 10000)
+        shocked_cupom = cupom_curve.deslocar(cupom_shock / 10000)
+
+        swap_mtm = SwapMarkToMarket(SwapBook.from_pairs([(swap_params, hedge_params)]))
+        base_series = swap_mtm.daily_series(di_curve, cupom_curve)
+        shocked_value = swap_mtm.value(shocked_di, shocked_cupom)['net'][0]
+        mtm_col1, mtm_col2, mtm_col3 = st.columns(3)
+        mtm_col1.metric("Swap MtM", f"R$ {base_series['net'][0]:,.2f}")
+        mtm_col2.metric("Swap MtM After Shock", f"R$ {shocked_value:,.2f}",
+                        delta=f"{shocked_value - base_series['net'][0]:,.2f}")
+        mtm_col3.metric("Swap DV01 (DI)", f"R$ {swap_mtm.dv01(di_curve, cupom_curve)['di'][0]:,.2f}")
+        st.plotly_chart(criar_grafico_mtm(base_series, swap_mtm.daily_series(shocked_di, shocked_cupom)),
+                        use_container_width=True)
+
+        st.subheader("Swap Book Curve Risk")
+        book_mtm = SwapMarkToMarket(book)
+        book_value = book_mtm.value(shocked_di, shocked_cupom)['net'].sum()
+        book_dv01 = book_mtm.dv01(shocked_di, shocked_cupom)
+        risk_col1, risk_col2, risk_col3 = st.columns(3)
+        risk_col1.metric("Book MtM", f"R$ {book_value:,.2f}")
+        risk_col2.metric("Book DV01 (DI)", f"R$ {book_dv01['di'].sum():,.2f}")
+        risk_col3.metric("Book DV01 (Cupom)", f"R$ {book_dv01['cupom'].sum():,.2f}")
+
+        key_rates = book_mtm.key_rate_dv01(shocked_di, shocked_cupom)
+        fig_key_rates = go.Figure(go.Bar(x=strip["Contrato"][:key_rates['di'].size], y=key_rates['di'],
+                                         marker_color='steelblue'))
+        fig_key_rates.update_layout(title='Key-Rate DV01 by DI1 Vertex (1 bp)', xaxis_title='DI1 Vertex',
+                                    yaxis_title='Value Change (R$)')
+        st.plotly_chart(fig_key_rates, use_container_width=True)
+
     # Add some helpful information at the bottom
     st.markdown("""
     ---
@@ -557,7 +927,7 @@ def render():
     2. Fill in the hedge details on the right side:
     - Configure both asset and liability legs
     - Enter rates for all legs
-    - For exchange rate legs, also enter the cupom cambial
+    - For exchange rate legs, also enter the cupom cambial (and the initial exchange rate if the exposure does not use one)
     - If any leg uses exchange rate, specify the exchange rate at maturity
 
     3. Click "Calculate Swap Results" to see the analysis
@@ -3,11 +3,23 @@ Módulo 5: Opções
 Ferramenta interativa de ensino de opções com simulador e estratégias.
 """
 
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import streamlit as st
 import plotly.graph_objects as go
 import numpy as np
 import pandas as pd
+from dataclasses import dataclass
 from scipy.stats import norm
+from scipy.optimize import brentq, least_squares
+from scipy.linalg import solve_banded
 
 
 # Custom CSS for better styling
@@ -41,103 +53,2348 @@ h1, h2, h3 {
 """
 
 
+def _as_call_mask(option_type):
+    """
+    Convert an option type specification into a boolean call mask.
+    
+    Accepts 'call'/'put' strings (or arrays of them) as well as boolean or
+    integer masks, where True/1 means call and False/0 means put.
+    """
+    option_type = np.asarray(option_type)
+    if option_type.dtype.kind in ('U', 'S', 'O'):
+        return np.char.lower(option_type.astype(str)) == 'call'
+    return option_type.astype(bool)
+
+
+def _d1_d2(S, K, T, r, sigma):
+    """
+    Compute d1 and d2 of the Black-Scholes model for broadcast arrays.
+    
+    When sigma * sqrt(T) is zero (expiry or zero volatility) d1 and d2 are
+    sent to +/-inf according to the moneyness of the forward, so that the
+    pricing formulas collapse to the discounted intrinsic value instead of
+    producing NaNs.
+    
+    Returns:
+    d1, d2, vol_sqrt_t, degenerate: broadcast arrays
+    """
+    T = np.maximum(T, 0.0)
+    sigma = np.maximum(sigma, 0.0)
+    vol_sqrt_t = sigma * np.sqrt(T)
+    degenerate = vol_sqrt_t <= 1e-12
+    safe_vol = np.where(degenerate, 1.0, vol_sqrt_t)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moneyness = np.log(S / K) + r * T
+        d1 = np.where(
+            degenerate,
+            np.where(moneyness > 0, np.inf, np.where(moneyness < 0, -np.inf, 0.0)),
+            moneyness / safe_vol + 0.5 * vol_sqrt_t
+        )
+    d2 = np.where(degenerate, d1, d1 - vol_sqrt_t)
+    
+    return d1, d2, vol_sqrt_t, degenerate
+
+
+def black_scholes_vectorized(S, K, T, r, sigma, is_call):
+    """
+    Price European options with Black-Scholes over broadcast arrays.
+    
+    All inputs may be scalars or NumPy arrays of any shape that broadcast
+    together, so a full strike x expiry grid is priced in a single call.
+    At T = 0 or sigma = 0 the price converges to max(S - K*e^(-rT), 0) for
+    calls and max(K*e^(-rT) - S, 0) for puts.
+    
+    Parameters:
+    S: Current stock price
+    K: Strike price
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual)
+    sigma: Volatility
+    is_call: Call/put mask (bool/int array, True/1 for calls) or 'call'/'put'
+    
+    Returns:
+    option_price: Array with the broadcast shape of the inputs
+    """
+    S, K, T, r, sigma = (np.asarray(x, dtype=float) for x in (S, K, T, r, sigma))
+    is_call = _as_call_mask(is_call)
+    
+    d1, d2, _, _ = _d1_d2(S, K, T, r, sigma)
+    discounted_K = K * np.exp(-r * np.maximum(T, 0.0))
+    
+    call_price = S * norm.cdf(d1) - discounted_K * norm.cdf(d2)
+    put_price = discounted_K * norm.cdf(-d2) - S * norm.cdf(-d1)
+    
+    return np.where(is_call, call_price, put_price)
+
+
 def black_scholes(S, K, T, r, sigma, option_type):
     """
     Calculate option price using Black-Scholes model.
     
     Parameters:
-    S: Current stock price
-    K: Strike price
-    T: Time to maturity (in years)
-    r: Risk-free interest rate (annual)
-    sigma: Volatility
-    option_type: 'call' or 'put'
+    S: Current stock price
+    K: Strike price
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual)
+    sigma: Volatility
+    option_type: 'call' or 'put'
+    
+    Returns:
+    option_price: Price of the option (array when any input is an array)
+    """
+    option_price = black_scholes_vectorized(S, K, T, r, sigma, option_type)
+    return option_price[()]
+
+
+GREEK_NAMES = ('price', 'delta', 'gamma', 'theta', 'vega', 'rho',
+               'vanna', 'volga', 'charm', 'speed')
+
+
+def greeks(S, K, T, r, sigma, option_type, which=None):
+    """
+    Calculate Black-Scholes Greeks from a single d1/d2 evaluation.
+    
+    Inputs broadcast like black_scholes_vectorized, so a whole chain or a
+    spot x volatility grid is handled in one call. norm.pdf(d1) is evaluated
+    once and norm.cdf(d1)/norm.cdf(d2) only when a requested Greek needs them.
+    
+    Parameters:
+    S: Current stock price
+    K: Strike price
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual)
+    sigma: Volatility
+    option_type: 'call'/'put' or a call mask (True/1 for calls)
+    which: Iterable with the names in GREEK_NAMES to compute (default: all)
+    
+    Returns:
+    greeks: Dictionary mapping each requested name to an array. Units are per
+    year (theta, charm) and per 1.00 of volatility (vega, vanna, volga); theta
+    and charm measure the change as calendar time passes.
+    """
+    which = GREEK_NAMES if which is None else tuple(which)
+    unknown = set(which) - set(GREEK_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown Greeks: {sorted(unknown)}")
+    
+    S, K, T, r, sigma = (np.asarray(x, dtype=float) for x in (S, K, T, r, sigma))
+    is_call = _as_call_mask(option_type)
+    
+    d1, d2, vol_sqrt_t, degenerate = _d1_d2(S, K, T, r, sigma)
+    T = np.maximum(T, 0.0)
+    sqrt_t = np.sqrt(T)
+    # Safe denominators: where the model is degenerate the density terms are zero
+    safe_vol_sqrt_t = np.where(degenerate, 1.0, vol_sqrt_t)
+    safe_sigma = np.where(sigma > 0, sigma, 1.0)
+    safe_t = np.where(T > 0, T, 1.0)
+    
+    pdf_d1 = np.where(degenerate, 0.0, norm.pdf(d1))
+    discounted_K = K * np.exp(-r * T)
+    sign = np.where(is_call, 1.0, -1.0)
+    
+    needs_cdf = {'price', 'delta', 'theta', 'rho'}.intersection(which)
+    if needs_cdf:
+        cdf_d1 = norm.cdf(sign * d1)
+        cdf_d2 = norm.cdf(sign * d2)
+    
+    result = {}
+    for name in which:
+        with np.errstate(invalid='ignore'):
+            if name == 'price':
+                value = sign * (S * cdf_d1 - discounted_K * cdf_d2)
+            elif name == 'delta':
+                value = sign * cdf_d1
+            elif name == 'gamma':
+                value = pdf_d1 / (S * safe_vol_sqrt_t)
+            elif name == 'theta':
+                value = (-S * pdf_d1 * sigma / (2 * np.where(T > 0, sqrt_t, 1.0))
+                         - sign * r * discounted_K * cdf_d2)
+            elif name == 'vega':
+                value = S * pdf_d1 * sqrt_t
+            elif name == 'rho':
+                value = sign * discounted_K * T * cdf_d2
+            elif name == 'vanna':
+                value = -pdf_d1 * d2 / safe_sigma
+            elif name == 'volga':
+                value = S * pdf_d1 * sqrt_t * d1 * d2 / safe_sigma
+            elif name == 'charm':
+                value = -pdf_d1 * (2 * r * T - d2 * vol_sqrt_t) / (2 * safe_t * safe_vol_sqrt_t)
+            else:  # speed
+                value = -pdf_d1 / (S * safe_vol_sqrt_t) / S * (d1 / safe_vol_sqrt_t + 1)
+        # d1/d2 are infinite where the model is degenerate; those Greeks vanish
+        result[name] = np.where(np.isfinite(value), value, 0.0)[()]
+    
+    return result
+
+
+def implied_volatility(price, S, K, T, r, option_type, tol=1e-8, max_iter=50, sigma_bounds=(1e-4, 5.0)):
+    """
+    Invert Black-Scholes for a whole chain of option premiums at once.
+    
+    Every quote takes vectorized Newton-Raphson steps using the closed-form
+    Vega, safeguarded by a per-quote [low, high] volatility bracket that is
+    tightened after each step (a bisection step is taken whenever Newton
+    would leave the bracket). The few quotes that have not converged after
+    max_iter iterations, typically deep ITM/OTM, are finished with Brent's
+    method on their final bracket.
+    
+    Parameters:
+    price: Market option premium
+    S: Current stock price
+    K: Strike price
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual)
+    option_type: 'call'/'put' or a call mask (True/1 for calls)
+    tol: Absolute tolerance on the premium
+    max_iter: Maximum number of vectorized Newton iterations
+    sigma_bounds: (low, high) volatilities searched
+    
+    Returns:
+    result: Dictionary with the implied 'sigma' (NaN where the premium is
+    outside the no-arbitrage bounds), the per-quote 'converged' flags and the
+    number of Newton 'iterations' used
+    """
+    price, S, K, T, r = (np.asarray(x, dtype=float) for x in (price, S, K, T, r))
+    is_call = _as_call_mask(option_type)
+    shape = np.broadcast_shapes(price.shape, S.shape, K.shape, T.shape, r.shape, is_call.shape)
+    price, S, K, T, r, is_call = (np.broadcast_to(x, shape).ravel()
+                                  for x in (price, S, K, T, r, is_call))
+    
+    sigma_low, sigma_high = sigma_bounds
+    low = np.full(price.shape, sigma_low)
+    high = np.full(price.shape, sigma_high)
+    
+    # Only premiums strictly inside the model's price range have a solution
+    valid = (T > 0) & np.isfinite(price)
+    valid &= black_scholes_vectorized(S, K, T, r, low, is_call) < price
+    valid &= black_scholes_vectorized(S, K, T, r, high, is_call) > price
+    
+    # Manaster-Koehler starting point (the inflection point of price in sigma)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(2 * np.abs(np.log(S / K) + r * T) / T)
+    sigma = np.clip(np.nan_to_num(sigma, nan=0.2), 0.05, sigma_high)
+    
+    converged = np.zeros(price.shape, dtype=bool)
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        active = np.flatnonzero(valid & ~converged)
+        if active.size == 0:
+            iterations -= 1
+            break
+        
+        g = greeks(S[active], K[active], T[active], r[active], sigma[active],
+                   is_call[active], which=('price', 'vega'))
+        diff = g['price'] - price[active]
+        
+        low[active] = np.where(diff < 0, sigma[active], low[active])
+        high[active] = np.where(diff > 0, sigma[active], high[active])
+        converged[active] = np.abs(diff) < tol
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            newton = sigma[active] - diff / g['vega']
+        inside = (newton > low[active]) & (newton < high[active])
+        step = np.where(inside, newton, 0.5 * (low[active] + high[active]))
+        sigma[active] = np.where(converged[active], sigma[active], step)
+    
+    # Bracketed fallback for the quotes Newton could not finish
+    for i in np.flatnonzero(valid & ~converged):
+        def objective(vol, i=i):
+            return black_scholes(S[i], K[i], T[i], r[i], vol, is_call[i]) - price[i]
+        try:
+            sigma[i] = brentq(objective, low[i], high[i], xtol=1e-12, maxiter=200)
+            converged[i] = abs(objective(sigma[i])) < max(tol, 1e-10)
+        except ValueError:
+            pass
+    
+    sigma = np.where(valid, sigma, np.nan)
+    
+    return {
+        'sigma': sigma.reshape(shape)[()],
+        'converged': converged.reshape(shape)[()],
+        'iterations': iterations
+    }
+
+
+def _crr_backward(S, K, T, r, sigma, is_call, steps, american=True, track_boundary=False, smooth=False):
+    """
+    Run the Cox-Ross-Rubinstein backward induction on one rolling buffer.
+    
+    Option values and node prices live in two arrays of length steps + 1
+    that are overwritten in place as the induction walks back one time step,
+    so memory is O(steps) and every step is a handful of NumPy operations.
+    With smooth=True the last step is replaced by Black-Scholes values
+    (Broadie-Detemple), which removes the odd/even oscillation of the error.
+    
+    Returns:
+    price, boundary: Option value today and, when track_boundary is True, the
+    critical stock price at each time step (NaN where exercise is never optimal)
+    """
+    if steps < 1:
+        raise ValueError("The tree needs at least one step")
+    if T <= 0 or sigma <= 0:
+        return float(black_scholes(S, K, T, r, sigma, 'call' if is_call else 'put')), None
+    
+    dt = T / steps
+    u = np.exp(sigma * np.sqrt(dt))
+    d = 1 / u
+    disc = np.exp(-r * dt)
+    p = (np.exp(r * dt) - d) / (u - d)
+    if not 0 < p < 1:
+        raise ValueError("Time step too large for the CRR tree; increase the number of steps")
+    sign = 1.0 if is_call else -1.0
+    
+    # Terminal layer: node j has price S * u^(2j - steps)
+    stock = S * u ** (2.0 * np.arange(steps + 1) - steps)
+    values = np.maximum(sign * (stock - K), 0.0)
+    exercise = np.empty(steps + 1)
+    boundary = np.full(steps + 1, np.nan) if track_boundary else None
+    if track_boundary:
+        boundary[steps] = K
+    
+    for i in range(steps - 1, -1, -1):
+        n = i + 1
+        # Continuation value, written over the first n slots of the buffer
+        stock[:n] *= u
+        if smooth and i == steps - 1:
+            values[:n] = black_scholes_vectorized(stock[:n], K, dt, r, sigma, is_call)
+        else:
+            values[:n] = disc * (p * values[1:n + 1] + (1 - p) * values[:n])
+        
+        if american:
+            np.multiply(stock[:n] - K, sign, out=exercise[:n])
+            if track_boundary:
+                exercised = (exercise[:n] > values[:n]) & (exercise[:n] > 0)
+                if exercised.any():
+                    critical = stock[:n][exercised]
+                    boundary[i] = critical.min() if is_call else critical.max()
+            np.maximum(values[:n], exercise[:n], out=values[:n])
+    
+    return float(values[0]), boundary
+
+
+def binomial_price(S, K, T, r, sigma, option_type, steps=500, american=True, richardson=False):
+    """
+    Calculate option price on a Cox-Ross-Rubinstein binomial tree.
+    
+    Parameters:
+    S: Current stock price
+    K: Strike price
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual)
+    sigma: Volatility
+    option_type: 'call' or 'put'
+    steps: Number of time steps in the tree
+    american: Allow early exercise at every node
+    richardson: Combine smoothed steps and steps/2 trees with Richardson
+    extrapolation (2 * P(steps) - P(steps/2)); the Black-Scholes last step
+    makes the error a smooth O(1/steps) term that the extrapolation cancels
+    
+    Returns:
+    option_price: Price of the option
+    """
+    is_call = bool(_as_call_mask(option_type))
+    price, _ = _crr_backward(S, K, T, r, sigma, is_call, steps, american, smooth=richardson)
+    
+    if richardson:
+        coarse, _ = _crr_backward(S, K, T, r, sigma, is_call, max(1, steps // 2), american, smooth=True)
+        price = 2 * price - coarse
+    
+    return price
+
+
+def early_exercise_boundary(S, K, T, r, sigma, option_type, steps=500):
+    """
+    Calculate the early-exercise boundary of an American option.
+    
+    Parameters:
+    S: Current stock price
+    K: Strike price
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual)
+    sigma: Volatility
+    option_type: 'call' or 'put'
+    steps: Number of time steps in the tree
+    
+    Returns:
+    boundary: Dictionary with the option 'price', the 'time' of each step
+    (in years) and the 'critical_price' below which a put (above which a
+    call) is exercised, NaN where early exercise is never optimal
+    """
+    is_call = bool(_as_call_mask(option_type))
+    price, boundary = _crr_backward(S, K, T, r, sigma, is_call, steps, True, track_boundary=True)
+    
+    if boundary is None:
+        return {'price': price, 'time': np.array([0.0]), 'critical_price': np.array([np.nan])}
+    
+    return {
+        'price': price,
+        'time': np.linspace(0.0, T, steps + 1),
+        'critical_price': boundary
+    }
+
+
+MC_PAYOFFS = ('european', 'asian', 'geometric_asian', 'barrier', 'lookback', 'digital')
+BARRIER_TYPES = ('down-and-out', 'down-and-in', 'up-and-out', 'up-and-in')
+
+# Upper bound on the number of simulated prices held in memory per chunk
+MC_CHUNK_ELEMENTS = 2 ** 21
+
+
+def _gbm_paths(rng, n_paths, S, T, r, sigma, n_steps, antithetic=False):
+    """
+    Simulate risk-neutral geometric Brownian motion paths.
+    
+    Returns an array of shape (n_paths, n_steps) with the prices at the
+    monitoring dates T/n_steps, 2T/n_steps, ..., T (the spot is not included).
+    With antithetic=True the second half of the rows mirrors the shocks of
+    the first half, so n_paths must be even.
+    """
+    dt = T / n_steps
+    if antithetic:
+        z = rng.standard_normal((n_paths // 2, n_steps))
+        z = np.concatenate([z, -z])
+    else:
+        z = rng.standard_normal((n_paths, n_steps))
+    
+    log_increments = (r - 0.5 * sigma**2) * dt + sigma * np.sqrt(dt) * z
+    np.cumsum(log_increments, axis=1, out=log_increments)
+    return S * np.exp(log_increments)
+
+
+def _path_payoff(paths, S, K, is_call, payoff, barrier=None, barrier_type=None):
+    """
+    Calculate the undiscounted payoff of each simulated path.
+    
+    Parameters:
+    paths: Array (n_paths, n_steps) of monitored prices
+    S: Spot price at inception
+    K: Strike price (ignored by the floating-strike lookback)
+    is_call: True for calls, False for puts
+    payoff: One of MC_PAYOFFS
+    barrier: Barrier level (barrier options only)
+    barrier_type: One of BARRIER_TYPES (barrier options only)
+    
+    Returns:
+    payoffs: Array (n_paths,)
+    """
+    sign = 1.0 if is_call else -1.0
+    terminal = paths[:, -1]
+    
+    if payoff == 'european':
+        return np.maximum(sign * (terminal - K), 0.0)
+    
+    if payoff == 'asian':
+        return np.maximum(sign * (paths.mean(axis=1) - K), 0.0)
+    
+    if payoff == 'geometric_asian':
+        return np.maximum(sign * (np.exp(np.log(paths).mean(axis=1)) - K), 0.0)
+    
+    if payoff == 'digital':
+        # Cash-or-nothing paying 1
+        return (sign * (terminal - K) > 0).astype(float)
+    
+    if payoff == 'barrier':
+        if barrier_type.startswith('down'):
+            touched = np.minimum(paths.min(axis=1), S) <= barrier
+        else:
+            touched = np.maximum(paths.max(axis=1), S) >= barrier
+        alive = ~touched if barrier_type.endswith('out') else touched
+        return np.where(alive, np.maximum(sign * (terminal - K), 0.0), 0.0)
+    
+    # Floating-strike lookback: buy at the minimum (call) or sell at the maximum (put)
+    if is_call:
+        return terminal - np.minimum(paths.min(axis=1), S)
+    return np.maximum(paths.max(axis=1), S) - terminal
+
+
+def _mc_chunk_sums(rng, n_paths, S, K, T, r, sigma, is_call, payoff, n_steps,
+                   antithetic, barrier, barrier_type, control_mean):
+    """
+    Simulate one chunk of paths and return its sufficient statistics.
+    
+    The sample Y is the discounted payoff and the control X the discounted
+    European payoff on the same path; both are centred on control_mean to
+    keep the running sums well conditioned. Antithetic pairs are averaged
+    into a single sample.
+    
+    Returns:
+    sums: Array [n, sum(Y), sum(Y^2), sum(X), sum(X^2), sum(X*Y)]
+    """
+    paths = _gbm_paths(rng, n_paths, S, T, r, sigma, n_steps, antithetic)
+    discount = np.exp(-r * T)
+    sign = 1.0 if is_call else -1.0
+    
+    y = discount * _path_payoff(paths, S, K, is_call, payoff, barrier, barrier_type) - control_mean
+    x = discount * np.maximum(sign * (paths[:, -1] - K), 0.0) - control_mean
+    
+    if antithetic:
+        half = n_paths // 2
+        y = 0.5 * (y[:half] + y[half:])
+        x = 0.5 * (x[:half] + x[half:])
+    
+    return np.array([y.size, y.sum(), y @ y, x.sum(), x @ x, x @ y])
+
+
+def _mc_summary(sums, control_mean, control_variate, confidence):
+    """Turn accumulated chunk statistics into a price, standard error and interval."""
+    n, sum_y, sum_yy, sum_x, sum_xx, sum_xy = sums
+    mean_y = sum_y / n
+    var_y = max(sum_yy - n * mean_y**2, 0.0) / (n - 1)
+    estimate = mean_y
+    variance = var_y
+    beta = 0.0
+    
+    if control_variate:
+        mean_x = sum_x / n
+        var_x = (sum_xx - n * mean_x**2) / (n - 1)
+        if var_x > 0:
+            cov_xy = (sum_xy - n * mean_x * mean_y) / (n - 1)
+            beta = cov_xy / var_x
+            # The control has known mean zero after centring on its BS price
+            estimate = mean_y - beta * mean_x
+            variance = max(var_y - cov_xy**2 / var_x, 0.0)
+    
+    std_error = np.sqrt(variance / n)
+    z = norm.ppf(0.5 + confidence / 2)
+    price = control_mean + estimate
+    
+    return {
+        'price': float(price),
+        'std_error': float(std_error),
+        'ci_low': float(price - z * std_error),
+        'ci_high': float(price + z * std_error),
+        'beta': float(beta)
+    }
+
+
+# Worker processes are kept alive between reruns and reused by every session
+MC_MAX_WORKERS = os.cpu_count() or 1
+_PROCESS_POOL = None
+_PROCESS_POOL_WORKERS = 0
+
+
+def _get_process_pool(workers):
+    """Return the persistent process pool, (re)creating it for the requested size."""
+    global _PROCESS_POOL, _PROCESS_POOL_WORKERS
+    
+    if _PROCESS_POOL is None or _PROCESS_POOL_WORKERS != workers:
+        if _PROCESS_POOL is not None:
+            _PROCESS_POOL.shutdown(wait=False)
+        # 'spawn' avoids forking the multithreaded Streamlit server process
+        _PROCESS_POOL = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        _PROCESS_POOL_WORKERS = workers
+    
+    return _PROCESS_POOL
+
+
+def _mc_stream(seed_sequence, n_paths, chunk_size, S, K, T, r, sigma, is_call, payoff,
+               n_steps, antithetic, barrier, barrier_type, control_mean):
+    """
+    Simulate n_paths in chunks from one independent random stream.
+    
+    This is the unit of work of each worker process; it returns the summed
+    chunk statistics of _mc_chunk_sums.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    sums = np.zeros(6)
+    remaining = n_paths
+    
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        sums += _mc_chunk_sums(rng, size, S, K, T, r, sigma, is_call, payoff, n_steps,
+                               antithetic, barrier, barrier_type, control_mean)
+        remaining -= size
+    
+    return sums
+
+
+def monte_carlo_price(S, K, T, r, sigma, option_type, payoff='european', n_paths=100_000,
+                      n_steps=None, antithetic=True, control_variate=True, barrier=None,
+                      barrier_type='down-and-out', seed=None, confidence=0.95, chunk_size=None,
+                      workers=1):
+    """
+    Calculate option price by Monte Carlo simulation of GBM paths.
+    
+    Paths are generated and reduced in fixed-size chunks, so memory stays
+    bounded by chunk_size x n_steps regardless of n_paths. Only the running
+    sums needed for the estimate and its standard error are kept.
+    
+    With workers > 1 the paths are split across a persistent process pool.
+    Each worker draws from its own stream spawned from SeedSequence(seed), and
+    the partial sums are reduced in worker order as they are collected, so
+    results are bit-reproducible for a given seed and worker count.
+    
+    Parameters:
+    S: Current stock price
+    K: Strike price (for the floating-strike lookback it only sets the control)
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual)
+    sigma: Volatility
+    option_type: 'call' or 'put'
+    payoff: One of MC_PAYOFFS
+    n_paths: Number of simulated paths
+    n_steps: Monitoring dates per path (default: 1 for European and digital, 252 otherwise)
+    antithetic: Pair each path with its mirrored shocks
+    control_variate: Use the European payoff, whose Black-Scholes price is
+    known, as a control variate
+    barrier: Barrier level (barrier options only)
+    barrier_type: One of BARRIER_TYPES (barrier options only)
+    seed: Seed for numpy's random generator, for reproducible results
+    confidence: Confidence level of the reported interval
+    chunk_size: Paths per chunk (default: MC_CHUNK_ELEMENTS / n_steps)
+    workers: Number of worker processes
+    
+    Returns:
+    result: Dictionary with 'price', 'std_error', 'ci_low', 'ci_high',
+    'n_paths' and the control variate coefficient 'beta'
+    """
+    if payoff not in MC_PAYOFFS:
+        raise ValueError(f"Unknown payoff '{payoff}'. Use one of {MC_PAYOFFS}")
+    if payoff == 'barrier' and (barrier is None or barrier_type not in BARRIER_TYPES):
+        raise ValueError(f"Barrier options need a barrier level and a type in {BARRIER_TYPES}")
+    
+    is_call = bool(_as_call_mask(option_type))
+    if n_steps is None:
+        n_steps = 1 if payoff in ('european', 'digital') else 252
+    if chunk_size is None:
+        chunk_size = max(2, MC_CHUNK_ELEMENTS // n_steps)
+    if antithetic:
+        n_paths += n_paths % 2
+        chunk_size += chunk_size % 2
+    
+    control_mean = float(black_scholes(S, K, T, r, sigma, 'call' if is_call else 'put'))
+    workers = max(1, min(int(workers), n_paths // 2))
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    
+    # Split the paths across workers, keeping every share even for antithetic pairs
+    unit = 2 if antithetic else 1
+    shares = np.full(workers, (n_paths // unit) // workers * unit)
+    shares[:(n_paths // unit) % workers] += unit
+    args = (chunk_size, S, K, T, r, sigma, is_call, payoff, n_steps,
+            antithetic, barrier, barrier_type, control_mean)
+    
+    if workers == 1:
+        sums = _mc_stream(seeds[0], n_paths, *args)
+    else:
+        pool = _get_process_pool(workers)
+        futures = [pool.submit(_mc_stream, seed_sequence, int(share), *args)
+                   for seed_sequence, share in zip(seeds, shares)]
+        sums = np.zeros(6)
+        for future in futures:
+            sums += future.result()
+    
+    result = _mc_summary(sums, control_mean, control_variate, confidence)
+    result['n_paths'] = n_paths
+    return result
+
+
+# Continuity correction of Broadie, Glasserman and Kou for discretely monitored barriers
+BGK_BETA = 0.5826
+
+
+def barrier_price(S, K, T, r, sigma, option_type, barrier, barrier_type, rebate=0.0, n_monitoring=None):
+    """
+    Calculate the price of a single-barrier option (Reiner-Rubinstein).
+    
+    Knock-in rebates are paid at expiry and knock-out rebates when the
+    barrier is hit. Inputs broadcast against each other.
+    
+    Parameters:
+    S, K, T, r, sigma, option_type: As in black_scholes_vectorized
+    barrier: Barrier level
+    barrier_type: One of BARRIER_TYPES
+    rebate: Cash paid if a knock-out is hit or a knock-in never is
+    n_monitoring: Number of discrete monitoring dates; the barrier is then
+    shifted away from the spot by exp(0.5826 sigma sqrt(T / n)). None means
+    continuous monitoring.
+    
+    Returns:
+    price: Barrier option price
+    """
+    if barrier_type not in BARRIER_TYPES:
+        raise ValueError(f"Unknown barrier type '{barrier_type}'. Use one of {BARRIER_TYPES}")
+    
+    S, K, T, r, sigma, H, rebate = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (S, K, T, r, sigma, barrier, rebate)))
+    phi = np.where(_as_call_mask(option_type), 1.0, -1.0)
+    down = barrier_type.startswith('down')
+    eta = 1.0 if down else -1.0
+    if n_monitoring:
+        H = H * np.exp(-eta * BGK_BETA * sigma * np.sqrt(T / n_monitoring))
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vol_sqrt_t = sigma * np.sqrt(T)
+        mu = (r - 0.5 * sigma**2) / sigma**2
+        lam = np.sqrt(mu**2 + 2 * r / sigma**2)
+        discount = np.exp(-r * T)
+        ratio = H / S
+        
+        x1 = np.log(S / K) / vol_sqrt_t + (1 + mu) * vol_sqrt_t
+        x2 = np.log(S / H) / vol_sqrt_t + (1 + mu) * vol_sqrt_t
+        y1 = np.log(H**2 / (S * K)) / vol_sqrt_t + (1 + mu) * vol_sqrt_t
+        y2 = np.log(H / S) / vol_sqrt_t + (1 + mu) * vol_sqrt_t
+        z = np.log(H / S) / vol_sqrt_t + lam * vol_sqrt_t
+        
+        A = phi * S * norm.cdf(phi * x1) - phi * K * discount * norm.cdf(phi * (x1 - vol_sqrt_t))
+        B = phi * S * norm.cdf(phi * x2) - phi * K * discount * norm.cdf(phi * (x2 - vol_sqrt_t))
+        C = (phi * S * ratio**(2 * (mu + 1)) * norm.cdf(eta * y1)
+             - phi * K * discount * ratio**(2 * mu) * norm.cdf(eta * (y1 - vol_sqrt_t)))
+        D = (phi * S * ratio**(2 * (mu + 1)) * norm.cdf(eta * y2)
+             - phi * K * discount * ratio**(2 * mu) * norm.cdf(eta * (y2 - vol_sqrt_t)))
+        E = rebate * discount * (norm.cdf(eta * (x2 - vol_sqrt_t)) - ratio**(2 * mu) * norm.cdf(eta * (y2 - vol_sqrt_t)))
+        F = rebate * (ratio**(mu + lam) * norm.cdf(eta * z) + ratio**(mu - lam) * norm.cdf(eta * (z - 2 * lam * vol_sqrt_t)))
+    
+    # Haug's table: (K above barrier, K below barrier) per type, call and put
+    call = phi > 0
+    above = K > H
+    if barrier_type == 'down-and-in':
+        price = np.where(call, np.where(above, C + E, A - B + D + E), np.where(above, B - C + D + E, A + E))
+    elif barrier_type == 'up-and-in':
+        price = np.where(call, np.where(above, A + E, B - C + D + E), np.where(above, A - B + D + E, C + E))
+    elif barrier_type == 'down-and-out':
+        price = np.where(call, np.where(above, A - C + F, B - D + F), np.where(above, A - B + C - D + F, F))
+    else:  # up-and-out
+        price = np.where(call, np.where(above, F, A - B + C - D + F), np.where(above, B - D + F, A - C + F))
+    
+    # Already through the barrier: knock-outs pay the rebate, knock-ins are vanilla
+    breached = S <= H if down else S >= H
+    if barrier_type.endswith('out'):
+        price = np.where(breached, rebate, price)
+    else:
+        price = np.where(breached, black_scholes_vectorized(S, K, T, r, sigma, call), price)
+    return price[()]
+
+
+def geometric_asian_price(S, K, T, r, sigma, option_type, n_fixings=None):
+    """
+    Calculate the price of a geometric-average Asian option (Kemna-Vorst).
+    
+    The geometric average of GBM prices is lognormal, so the price is a
+    Black-Scholes formula on its forward and variance.
+    
+    Parameters:
+    S, K, T, r, sigma, option_type: As in black_scholes_vectorized
+    n_fixings: Number of equally spaced fixings T/n, ..., T; None for a
+    continuous average over [0, T]
+    
+    Returns:
+    price: Geometric Asian option price
+    """
+    S, K, T, r, sigma = (np.asarray(x, dtype=float) for x in (S, K, T, r, sigma))
+    phi = np.where(_as_call_mask(option_type), 1.0, -1.0)
+    
+    if n_fixings:
+        n = float(n_fixings)
+        mean_factor, var_factor = (n + 1) / (2 * n), (n + 1) * (2 * n + 1) / (6 * n**2)
+    else:
+        mean_factor, var_factor = 0.5, 1.0 / 3.0
+    
+    variance = sigma**2 * T * var_factor
+    forward = S * np.exp((r - 0.5 * sigma**2) * T * mean_factor + 0.5 * variance)
+    # Black's formula on the average's forward: same kernel with zero rate and unit time
+    price = np.exp(-r * T) * black_scholes_vectorized(forward, K, 1.0, 0.0, np.sqrt(variance), phi > 0)
+    return price[()]
+
+
+def digital_price(S, K, T, r, sigma, option_type, kind='cash', payout=1.0):
+    """
+    Calculate the price of a European digital option.
+    
+    Parameters:
+    S, K, T, r, sigma, option_type: As in black_scholes_vectorized
+    kind: 'cash' (cash-or-nothing, pays payout) or 'asset' (asset-or-nothing)
+    payout: Cash amount of a cash-or-nothing digital
+    
+    Returns:
+    price: Digital option price
+    """
+    phi = np.where(_as_call_mask(option_type), 1.0, -1.0)
+    d1, d2, _, _ = _d1_d2(S, K, T, r, sigma)
+    
+    if kind == 'cash':
+        price = payout * np.exp(-r * np.asarray(T, dtype=float)) * norm.cdf(phi * d2)
+    elif kind == 'asset':
+        price = np.asarray(S, dtype=float) * norm.cdf(phi * d1)
+    else:
+        raise ValueError(f"Unknown digital kind '{kind}'. Use 'cash' or 'asset'")
+    return price[()]
+
+
+def lookback_price(S, K, T, r, sigma, option_type, extreme=None):
+    """
+    Calculate the price of a floating-strike lookback (Goldman-Sosin-Gatto).
+    
+    The call pays S_T minus the minimum and the put the maximum minus S_T,
+    with continuous monitoring.
+    
+    Parameters:
+    S, T, r, sigma, option_type: As in black_scholes_vectorized
+    K: Ignored (the strike floats); kept for a uniform pricer signature
+    extreme: Minimum (call) or maximum (put) observed so far (default S)
+    
+    Returns:
+    price: Lookback option price
+    """
+    S, T, r, sigma = (np.asarray(x, dtype=float) for x in (S, T, r, sigma))
+    extreme = S if extreme is None else np.asarray(extreme, dtype=float)
+    phi = np.where(_as_call_mask(option_type), 1.0, -1.0)
+    
+    # The sigma^2 / 2b terms have a finite limit at b = 0; keep b off zero
+    b = np.where(np.abs(r) < 1e-7, 1e-7, r)
+    vol_sqrt_t = sigma * np.sqrt(T)
+    a1 = (np.log(S / extreme) + (b + 0.5 * sigma**2) * T) / vol_sqrt_t
+    a2 = a1 - vol_sqrt_t
+    discount = np.exp(-r * T)
+    
+    # phi = 1: call on the minimum; phi = -1: put on the maximum
+    price = (phi * S * norm.cdf(phi * a1) - phi * extreme * discount * norm.cdf(phi * a2)
+             + phi * S * discount * sigma**2 / (2 * b)
+             * ((S / extreme)**(-2 * b / sigma**2) * norm.cdf(-phi * a1 + phi * 2 * b * np.sqrt(T) / sigma)
+                - np.exp(b * T) * norm.cdf(-phi * a1)))
+    return price[()]
+
+
+HEDGE_COMPONENTS = ('delta', 'gamma', 'theta', 'vega', 'carry', 'costs', 'residual')
+
+
+def delta_hedge_simulation(S, K, T, r, sigma, option_type, position='sell', n_paths=10_000, n_steps=252,
+                           rebalance_every=1, realized_vol=None, drift=None, implied_vol_end=None,
+                           transaction_cost=0.0, seed=None):
+    """
+    Backtest discrete delta hedging of one option over simulated GBM paths.
+    
+    The option is marked with Black-Scholes at the (possibly drifting) implied
+    vol and hedged with its delta, refreshed every rebalance_every steps. All
+    quantities are (paths x steps) arrays; the P&L of each step is
+    
+        q [dV - D dS - r dt (V - D S)] - costs
+    
+    for q options (+1 bought, -1 sold) hedged with -q D shares, and is split
+    into its Taylor terms: delta slippage q (Delta - D) dS, gamma q Gamma dS^2 / 2,
+    theta q Theta dt, vega q Vega dsigma, financing carry, transaction costs
+    and the residual.
+    
+    Parameters:
+    S, K, T, r, sigma, option_type: Option and its pricing (implied) vol
+    position: 'buy' or 'sell'
+    n_paths: Number of simulated paths
+    n_steps: Number of time steps until expiry
+    rebalance_every: Steps between hedge rebalances
+    realized_vol: Volatility of the simulated paths (default sigma)
+    drift: Real-world drift of the paths (default r)
+    implied_vol_end: Implied vol at expiry; the marking vol moves linearly
+    from sigma to it (default sigma, no vega P&L)
+    transaction_cost: Proportional cost per unit of stock value traded
+    seed: Random seed
+    
+    Returns:
+    result: Dictionary with the total 'pnl' of each path, its 'attribution'
+    per HEDGE_COMPONENTS (each an array over paths), the option 'premium',
+    and the mean 'pnl_mean' and 'pnl_std'
+    """
+    q = 1.0 if position == 'buy' else -1.0
+    is_call = _as_call_mask(option_type)
+    realized_vol = sigma if realized_vol is None else realized_vol
+    drift = r if drift is None else drift
+    implied_vol_end = sigma if implied_vol_end is None else implied_vol_end
+    
+    rng = np.random.default_rng(seed)
+    dt = T / n_steps
+    paths = np.empty((n_paths, n_steps + 1))
+    paths[:, 0] = S
+    paths[:, 1:] = _gbm_paths(rng, n_paths, S, T, drift, realized_vol, n_steps)
+    
+    times = np.arange(n_steps + 1) * dt
+    implied = sigma + (implied_vol_end - sigma) * times / T
+    unit = greeks(paths, K, T - times, r, implied, is_call, which=('price', 'delta', 'gamma', 'theta', 'vega'))
+    
+    # Hedge held over each step: the delta of the last rebalance date
+    held_index = (np.arange(n_steps) // rebalance_every) * rebalance_every
+    held = unit['delta'][:, held_index]
+    value, spot = unit['price'][:, :-1], paths[:, :-1]
+    dS = np.diff(paths, axis=1)
+    dV = np.diff(unit['price'], axis=1)
+    
+    traded = np.diff(np.concatenate([np.zeros((n_paths, 1)), held, np.zeros((n_paths, 1))], axis=1), axis=1)
+    trade_spots = np.concatenate([spot, paths[:, -1:]], axis=1)
+    costs = transaction_cost * np.abs(traded) * trade_spots
+    
+    step_pnl = q * (dV - held * dS - r * dt * (value - held * spot))
+    attribution = {
+        'delta': q * (unit['delta'][:, :-1] - held) * dS,
+        'gamma': q * 0.5 * unit['gamma'][:, :-1] * dS ** 2,
+        'theta': q * unit['theta'][:, :-1] * dt,
+        'vega': q * unit['vega'][:, :-1] * np.diff(implied),
+        'carry': -q * r * dt * (value - held * spot),
+    }
+    attribution = {name: component.sum(axis=1) for name, component in attribution.items()}
+    attribution['costs'] = -costs.sum(axis=1)
+    pnl = step_pnl.sum(axis=1) + attribution['costs']
+    attribution['residual'] = pnl - sum(attribution[name] for name in HEDGE_COMPONENTS[:-1])
+    
+    return {
+        'pnl': pnl,
+        'attribution': attribution,
+        'premium': float(unit['price'][0, 0]),
+        'pnl_mean': float(pnl.mean()),
+        'pnl_std': float(pnl.std())
+    }
+
+
+def _theta_scheme_bands(a, b, c, theta):
+    """Build the banded (I - theta * L) matrix for scipy.linalg.solve_banded."""
+    n = b.size
+    bands = np.zeros((3, n))
+    bands[0, 1:] = -theta * c[:-1]
+    bands[1] = 1 - theta * b
+    bands[2, :-1] = -theta * a[1:]
+    return bands
+
+
+def pde_price(S, K, T, r, sigma, option_type, american=False, n_space=400, n_time=400,
+              s_max=None, rannacher_steps=2):
+    """
+    Solve the Black-Scholes PDE with Crank-Nicolson finite differences.
+    
+    One backward solve on a uniform spot grid gives the option value for
+    every spot on the grid, plus Delta, Gamma and Theta by finite differences
+    on the same grid. Each time step is a tridiagonal solve with
+    scipy.linalg.solve_banded. The first steps use implicit Euler half-steps
+    (Rannacher smoothing) to damp the oscillations caused by the payoff kink.
+    American early exercise is enforced with the penalty method.
+    
+    Parameters:
+    S: Current stock price
+    K: Strike price
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual)
+    sigma: Volatility
+    option_type: 'call' or 'put'
+    american: Allow early exercise
+    n_space: Number of spot intervals in the grid
+    n_time: Number of time steps
+    s_max: Upper end of the spot grid (default: wide enough for 4 std devs)
+    rannacher_steps: Number of initial steps replaced by implicit half-steps
+    
+    Returns:
+    result: Dictionary with the 'spot_grid' and the 'price_grid', 'delta_grid',
+    'gamma_grid' and 'theta_grid' today over it, plus 'price', 'delta',
+    'gamma' and 'theta' interpolated at S
+    """
+    is_call = bool(_as_call_mask(option_type))
+    if s_max is None:
+        s_max = max(S, K) * max(2.0, np.exp(4 * sigma * np.sqrt(T)))
+    
+    spot_grid = np.linspace(0.0, s_max, n_space + 1)
+    j = np.arange(1, n_space)
+    dt = T / n_time
+    intrinsic = np.maximum((spot_grid - K) if is_call else (K - spot_grid), 0.0)
+    
+    # Spatial operator L (per unit of time) on the interior nodes
+    a = 0.5 * (sigma**2 * j**2 - r * j)
+    b = -(sigma**2 * j**2 + r)
+    c = 0.5 * (sigma**2 * j**2 + r * j)
+    
+    def boundaries(tau):
+        if is_call:
+            return 0.0, s_max - K * np.exp(-r * tau)
+        lower = K if american else K * np.exp(-r * tau)
+        return lower, 0.0
+    
+    def step(values, tau_new, h, theta):
+        bands = _theta_scheme_bands(a * h, b * h, c * h, theta)
+        interior = values[1:-1]
+        explicit = (1 - theta) * h * (a * values[:-2] + b * interior + c * values[2:])
+        lower, upper = boundaries(tau_new)
+        rhs = interior + explicit
+        rhs[0] += theta * h * a[0] * lower
+        rhs[-1] += theta * h * c[-1] * upper
+        
+        new_values = np.empty_like(values)
+        new_values[0], new_values[-1] = lower, upper
+        
+        if not american:
+            new_values[1:-1] = solve_banded((1, 1), bands, rhs)
+            return new_values
+        
+        # Penalty iteration: nodes below the payoff are pinned to it
+        payoff = intrinsic[1:-1]
+        penalty = 1e8
+        active = np.zeros(interior.size, dtype=bool)
+        for _ in range(50):
+            penalised = bands.copy()
+            penalised[1] += penalty * active
+            solution = solve_banded((1, 1), penalised, rhs + penalty * active * payoff)
+            new_active = solution < payoff
+            if np.array_equal(new_active, active):
+                break
+            active = new_active
+        new_values[1:-1] = np.maximum(solution, payoff)
+        return new_values
+    
+    values = intrinsic.copy()
+    previous = values
+    tau = 0.0
+    for n in range(n_time):
+        previous = values
+        if n < rannacher_steps:
+            values = step(values, tau + 0.5 * dt, 0.5 * dt, 1.0)
+            values = step(values, tau + dt, 0.5 * dt, 1.0)
+        else:
+            values = step(values, tau + dt, dt, 0.5)
+        tau += dt
+    
+    dS = spot_grid[1]
+    delta_grid = np.gradient(values, dS)
+    gamma_grid = np.gradient(delta_grid, dS)
+    # Theta as calendar time passes: today's value minus the value one step closer to expiry
+    theta_grid = (previous - values) / dt
+    
+    return {
+        'spot_grid': spot_grid,
+        'price_grid': values,
+        'delta_grid': delta_grid,
+        'gamma_grid': gamma_grid,
+        'theta_grid': theta_grid,
+        'price': float(np.interp(S, spot_grid, values)),
+        'delta': float(np.interp(S, spot_grid, delta_grid)),
+        'gamma': float(np.interp(S, spot_grid, gamma_grid)),
+        'theta': float(np.interp(S, spot_grid, theta_grid))
+    }
+
+
+class PricingCache:
+    """
+    Thread-safe LRU cache of pricing results keyed on quantized inputs.
+    
+    Contract parameters are rounded to a fixed number of decimals before
+    they are used both as the key and as the inputs of the computation, so
+    every hit returns exactly what a fresh computation would. Array inputs
+    are keyed on their rounded bytes and shape.
+    """
+    
+    def __init__(self, maxsize=4096, decimals=6):
+        self.maxsize = maxsize
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def quantize(self, value):
+        """Round a scalar or array input, returning (key part, rounded value)."""
+        rounded = np.round(np.asarray(value, dtype=float), self.decimals)
+        if rounded.ndim == 0:
+            return float(rounded), float(rounded)
+        return (rounded.shape, rounded.tobytes()), rounded
+    
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, calling compute() on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        
+        value = _freeze(compute())
+        
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        
+        return value
+    
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+    
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def _freeze(value):
+    """Make cached arrays read-only so callers cannot corrupt shared entries."""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for item in value.values():
+            _freeze(item)
+    return value
+
+
+@st.cache_resource
+def get_pricing_cache():
+    """Return the pricing cache shared by every Streamlit session."""
+    return PricingCache()
+
+
+PRICING_ENGINES = {
+    'black_scholes': black_scholes,
+    'binomial': binomial_price,
+    'pde': pde_price,
+    'barrier': barrier_price,
+    'geometric_asian': geometric_asian_price,
+    'digital': digital_price,
+    'lookback': lookback_price,
+}
+
+
+def _option_type_key(option_type):
+    """Hashable key for an option type string or call mask."""
+    if isinstance(option_type, str):
+        return option_type.lower()
+    mask = _as_call_mask(option_type)
+    return (mask.shape, mask.tobytes())
+
+
+def cached_price(S, K, T, r, sigma, option_type, engine='black_scholes', **engine_kwargs):
+    """
+    Calculate option price through the shared pricing cache.
+    
+    Parameters:
+    S, K, T, r, sigma, option_type: As in black_scholes (arrays allowed for
+    the Black-Scholes engine)
+    engine: Name of the pricing engine in PRICING_ENGINES
+    engine_kwargs: Extra arguments of the engine (e.g. steps, american)
+    
+    Returns:
+    result: Whatever the engine returns (read-only when it is an array)
+    """
+    cache = get_pricing_cache()
+    keys, values = zip(*(cache.quantize(x) for x in (S, K, T, r, sigma)))
+    key = (engine, *keys, _option_type_key(option_type), tuple(sorted(engine_kwargs.items())))
+    return cache.get_or_compute(
+        key, lambda: PRICING_ENGINES[engine](*values, option_type, **engine_kwargs)
+    )
+
+
+def cached_greeks(S, K, T, r, sigma, option_type, which=None):
+    """
+    Calculate Black-Scholes Greeks through the shared pricing cache.
+    
+    Returns the same dictionary as greeks(), with read-only arrays.
+    """
+    cache = get_pricing_cache()
+    which = GREEK_NAMES if which is None else tuple(which)
+    keys, values = zip(*(cache.quantize(x) for x in (S, K, T, r, sigma)))
+    key = ('greeks', *keys, _option_type_key(option_type), which)
+    return dict(cache.get_or_compute(key, lambda: greeks(*values, option_type, which=which)))
+
+
+def svi_total_variance(k, a, b, rho, m, s):
+    """
+    Raw SVI total implied variance w(k) = a + b (rho (k - m) + sqrt((k - m)^2 + s^2)).
+    
+    k is the log-moneyness log(K / F); the parameters broadcast against it.
+    """
+    k = np.asarray(k, dtype=float)
+    return a + b * (rho * (k - m) + np.sqrt((k - m) ** 2 + s ** 2))
+
+
+def _fit_svi_slice(k, w):
+    """Least-squares raw SVI fit of one expiry slice of total variances."""
+    w_max = max(w.max(), 1e-6)
+    atm = np.interp(0.0, k, w) if k.size > 1 else w[0]
+    fit = least_squares(
+        lambda p: svi_total_variance(k, *p) - w,
+        x0=[0.5 * atm, 0.1, -0.3, 0.0, 0.1],
+        bounds=([-w_max, 0.0, -0.999, -2.0, 1e-4], [w_max, 5.0, 0.999, 2.0, 5.0])
+    )
+    return fit.x
+
+
+class VolSurface:
+    """
+    Implied volatility surface fitted per expiry with raw SVI.
+    
+    Each slice is reduced to its five SVI coefficients, so a lookup costs one
+    binary search over the expiries plus a closed-form evaluation. Between
+    slices the total variance is interpolated linearly in time at the same
+    log-moneyness; outside them the nearest slice's vol is held flat.
+    
+    Parameters:
+    S: Spot price of the underlying
+    r: Risk-free interest rate (annual), used for the forward
+    strikes: Strike grid (n_strikes,)
+    expiries: Expiry grid in years (n_expiries,), strictly increasing
+    vols: Implied vols on the grid (n_expiries, n_strikes); nan marks a missing quote
+    """
+    
+    def __init__(self, S, r, strikes, expiries, vols):
+        self.S = float(S)
+        self.r = float(r)
+        self.expiries = np.asarray(expiries, dtype=float)
+        strikes = np.asarray(strikes, dtype=float)
+        vols = np.asarray(vols, dtype=float).reshape(self.expiries.size, strikes.size)
+        
+        params, errors = [], []
+        for T, slice_vols in zip(self.expiries, vols):
+            quoted = np.isfinite(slice_vols)
+            k = np.log(strikes[quoted] / self.forward(T))
+            slice_params = _fit_svi_slice(k, slice_vols[quoted] ** 2 * T)
+            fitted = np.sqrt(np.maximum(svi_total_variance(k, *slice_params), 0.0) / T)
+            params.append(slice_params)
+            errors.append(np.sqrt(np.mean((fitted - slice_vols[quoted]) ** 2)))
+        
+        # One row of (a, b, rho, m, s) per expiry
+        self.params = np.array(params)
+        self.fit_errors = np.array(errors)
+    
+    def forward(self, T):
+        """Forward price of the underlying for maturity T."""
+        return self.S * np.exp(self.r * np.asarray(T, dtype=float))
+    
+    def total_variance(self, K, T):
+        """Interpolated total implied variance sigma^2 T, broadcast over K and T."""
+        K, T = np.broadcast_arrays(np.asarray(K, dtype=float), np.asarray(T, dtype=float))
+        T_eff = np.clip(T, self.expiries[0], self.expiries[-1])
+        k = np.log(K / self.forward(T_eff))
+        
+        # Bracketing slices by binary search; a single slice brackets itself
+        hi = np.minimum(np.maximum(np.searchsorted(self.expiries, T_eff), 1), self.expiries.size - 1)
+        lo = np.maximum(hi - 1, 0)
+        span = self.expiries[hi] - self.expiries[lo]
+        weight = np.divide(T_eff - self.expiries[lo], span, out=np.zeros(T.shape), where=span > 0)
+        
+        w_lo = np.maximum(svi_total_variance(k, *np.moveaxis(self.params[lo], -1, 0)), 0.0)
+        w_hi = np.maximum(svi_total_variance(k, *np.moveaxis(self.params[hi], -1, 0)), 0.0)
+        w = w_lo + weight * (w_hi - w_lo)
+        
+        # Outside the quoted expiries the vol, not the total variance, is held flat
+        return w * np.divide(T, T_eff)
+    
+    def vol(self, K, T):
+        """Implied volatility at strikes K and maturities T (vectorized)."""
+        K, T = np.broadcast_arrays(np.asarray(K, dtype=float), np.asarray(T, dtype=float))
+        T_eff = np.clip(T, self.expiries[0], self.expiries[-1])
+        return np.sqrt(self.total_variance(K, T_eff) / T_eff)[()]
+
+
+def parametric_smile(S, r, strikes, expiries, atm_vol, skew, convexity):
+    """
+    Implied vol grid of a quadratic smile in standardized log-moneyness.
+    
+    vol = atm_vol + skew x + convexity x^2 with x = log(K / F) / sqrt(T), floored at 1%.
+    Returns an array (n_expiries, n_strikes) suitable for VolSurface.
+    """
+    strikes = np.asarray(strikes, dtype=float)[None, :]
+    expiries = np.asarray(expiries, dtype=float)[:, None]
+    x = np.log(strikes / (S * np.exp(r * expiries))) / np.sqrt(expiries)
+    return np.maximum(atm_vol + skew * x + convexity * x ** 2, 0.01)
+
+
+@st.cache_resource(max_entries=32)
+def get_vol_surface(S, r, strikes, expiries, vols):
+    """
+    Return the VolSurface fitted to a quote grid, shared across reruns.
+    
+    strikes, expiries and vols must be tuples (vols flattened row by row) so
+    identical grids reuse the same fit.
+    """
+    return VolSurface(S, r, strikes, expiries, vols)
+
+
+# B3 option series letters: A-L are calls and M-X puts expiring January to December
+B3_CALL_LETTERS = 'ABCDEFGHIJKL'
+B3_PUT_LETTERS = 'MNOPQRSTUVWX'
+
+# Columns every chain file must provide, with their in-memory dtypes
+CHAIN_COLUMNS = {
+    'ticker': 'category',
+    'strike': np.float32,
+    'expiry': 'datetime64[D]',
+    'bid': np.float32,
+    'ask': np.float32,
+}
+
+# Only chain files in this server directory are offered in the app
+CHAIN_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'chains')
+
+# Memory-mapped columnar copies of loaded chains live here, one folder per source file
+CHAIN_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'option_chain_cache')
+
+
+def parse_b3_tickers(tickers):
+    """
+    Decode the series letter of B3 option tickers (e.g. PETRA250, VALEM620).
+    
+    Parameters:
+    tickers: Array of ticker strings
+    
+    Returns:
+    series: Dictionary with the 'root' (underlying code), the 'is_call' mask
+    and the expiry 'month' (1-12, 0 when the ticker is not a B3 option)
+    """
+    parts = pd.Series(np.asarray(tickers, dtype=str)).str.upper().str.extract(r'^([A-Z0-9]{4})([A-X])\d')
+    letters = parts[1].fillna('').to_numpy(dtype=str)
+    call_month = np.char.find(B3_CALL_LETTERS, letters) + 1
+    put_month = np.char.find(B3_PUT_LETTERS, letters) + 1
+    is_call = (call_month > 0) & (letters != '')
+    month = np.where(letters == '', 0, np.where(is_call, call_month, put_month))
+    return {'root': parts[0].fillna('').to_numpy(dtype=str), 'is_call': is_call, 'month': month.astype(np.int8)}
+
+
+class OptionChain:
+    """
+    Option chain in columnar form with compact dtypes.
+    
+    Tickers are stored once as categories plus int32 codes, prices as float32
+    and expiries as int32 days since 1970-01-01. Every column is a flat numpy
+    array, so a chain saved with save() can be reopened memory-mapped.
+    """
+    
+    NUMERIC_COLUMNS = ('ticker_codes', 'strike', 'expiry_days', 'bid', 'ask', 'is_call')
+    
+    def __init__(self, categories, ticker_codes, strike, expiry_days, bid, ask, is_call):
+        self.categories = categories
+        self.ticker_codes = ticker_codes
+        self.strike = strike
+        self.expiry_days = expiry_days
+        self.bid = bid
+        self.ask = ask
+        self.is_call = is_call
+    
+    @classmethod
+    def from_frame(cls, frame):
+        """
+        Build a chain from a DataFrame with the CHAIN_COLUMNS.
+        
+        An optional 'type' column ('call'/'put') sets the option type; without
+        it the type is decoded from the B3 series letter of each ticker.
+        """
+        missing = set(CHAIN_COLUMNS) - set(frame.columns)
+        if missing:
+            raise ValueError(f"Option chain is missing columns: {sorted(missing)}")
+        
+        tickers = frame['ticker'].astype('category').cat
+        categories = tickers.categories.to_numpy(dtype=str)
+        codes = tickers.codes.to_numpy().astype(np.int32)
+        if 'type' in frame.columns:
+            is_call = frame['type'].astype(str).str.lower().str.startswith('c').to_numpy()
+        else:
+            # Decode each distinct ticker once and broadcast through the codes
+            is_call = parse_b3_tickers(categories)['is_call'][codes]
+        
+        return cls(
+            categories,
+            codes,
+            frame['strike'].to_numpy(dtype=np.float32),
+            pd.to_datetime(frame['expiry']).to_numpy().astype('datetime64[D]').astype(np.int32),
+            frame['bid'].to_numpy(dtype=np.float32),
+            frame['ask'].to_numpy(dtype=np.float32),
+            np.asarray(is_call, dtype=bool)
+        )
+    
+    def __len__(self):
+        return self.strike.size
+    
+    @property
+    def tickers(self):
+        """Ticker of every row (materialized from the categories)."""
+        return self.categories[self.ticker_codes]
+    
+    @property
+    def mid(self):
+        """Mid price of every row as float64."""
+        return (self.bid.astype(float) + self.ask.astype(float)) / 2
+    
+    def time_to_expiry(self, as_of):
+        """Years from the date as_of to each expiry (calendar days / 365)."""
+        as_of_days = np.datetime64(as_of, 'D').astype(np.int64)
+        return (self.expiry_days - as_of_days) / 365.0
+    
+    def to_frame(self):
+        """Return the chain as a DataFrame with a categorical ticker column."""
+        return pd.DataFrame({
+            'ticker': pd.Categorical.from_codes(self.ticker_codes, self.categories),
+            'type': np.where(self.is_call, 'call', 'put'),
+            'strike': self.strike,
+            'expiry': self.expiry_days.astype('datetime64[D]'),
+            'bid': self.bid,
+            'ask': self.ask,
+        })
+    
+    def save(self, directory):
+        """Write one .npy file per column to directory."""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'categories.npy'), self.categories)
+        for name in self.NUMERIC_COLUMNS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+    
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Open a chain written by save(); columns are memory-mapped by default."""
+        mode = 'r' if mmap else None
+        columns = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode)
+                   for name in ('categories',) + cls.NUMERIC_COLUMNS}
+        return cls(**columns)
+
+
+def read_chain_frame(source):
+    """
+    Read a CSV or Parquet option chain into a DataFrame with compact dtypes.
+    
+    source may be a path or an uploaded file object with a name.
+    """
+    name = getattr(source, 'name', str(source)).lower()
+    if name.endswith(('.parquet', '.pq')):
+        import pyarrow.parquet as pq
+        header = pq.read_schema(source).names
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        columns = list(CHAIN_COLUMNS) + (['type'] if 'type' in header else [])
+        frame = pd.read_parquet(source, columns=columns)
+    else:
+        header = pd.read_csv(source, nrows=0).columns
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        usecols = list(CHAIN_COLUMNS) + (['type'] if 'type' in header else [])
+        frame = pd.read_csv(
+            source, usecols=usecols, parse_dates=['expiry'],
+            dtype={column: dtype for column, dtype in CHAIN_COLUMNS.items() if column != 'expiry'}
+        )
+    return frame
+
+
+def parity_spot(strike, is_call, premium, T, r):
+    """
+    Infer the underlying price from put-call parity, S = C - P + K * e^(-rT).
+    
+    Calls and puts are paired by strike (same expiry assumed) and the median
+    over the pairs is returned; NaN when no strike has both a call and a put.
+    """
+    strike, is_call = np.asarray(strike, dtype=float), np.asarray(is_call, dtype=bool)
+    premium, T = np.asarray(premium, dtype=float), np.broadcast_to(np.asarray(T, dtype=float), strike.shape)
+    calls, puts = np.flatnonzero(is_call), np.flatnonzero(~is_call)
+    _, call_idx, put_idx = np.intersect1d(strike[calls], strike[puts], return_indices=True)
+    if call_idx.size == 0:
+        return np.nan
+    calls, puts = calls[call_idx], puts[put_idx]
+    return float(np.median(premium[calls] - premium[puts] + strike[calls] * np.exp(-r * T[calls])))
+
+
+def load_option_chain(path, cache_dir=None, mmap=True):
+    """
+    Load an option chain file, reusing its memory-mapped columnar copy.
+    
+    The first load parses the CSV/Parquet file and saves it under
+    CHAIN_CACHE_DIR (or in cache_dir) as .npy columns; later loads open those
+    columns memory-mapped and only parse again when the source file is newer.
+    
+    Parameters:
+    path: CSV or Parquet file with the CHAIN_COLUMNS
+    cache_dir: Directory for the columnar copy (default: a folder in
+    CHAIN_CACHE_DIR named after the hash of the absolute source path)
+    mmap: Whether to memory-map the cached columns
+    
+    Returns:
+    chain: OptionChain
+    """
+    if cache_dir is None:
+        source_key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+        cache_dir = os.path.join(CHAIN_CACHE_DIR, source_key)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    source_mtime = os.path.getmtime(path)
+    
+    if os.path.exists(meta_path):
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get('source_mtime', -1) >= source_mtime:
+            return OptionChain.load(cache_dir, mmap=mmap)
+    
+    chain = OptionChain.from_frame(read_chain_frame(path))
+    chain.save(cache_dir)
+    with open(meta_path, 'w') as meta_file:
+        json.dump({'source': os.path.abspath(path), 'source_mtime': source_mtime, 'rows': len(chain)}, meta_file)
+    return OptionChain.load(cache_dir, mmap=mmap) if mmap else chain
+
+
+def list_chain_files(data_dir=CHAIN_DATA_DIR):
+    """List the CSV/Parquet chain files in data_dir (empty when it does not exist)."""
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(name for name in os.listdir(data_dir)
+                  if name.lower().endswith(('.csv', '.parquet')) and os.path.isfile(os.path.join(data_dir, name)))
+
+
+# Number of points on the price axis of payoff/profit charts
+CHART_POINTS = 10_001
+
+LEG_TYPES = ('call', 'put', 'stock')
+
+
+def option_payoff(S_T, K, option_type, position):
+    """
+    Calculate option payoff at expiration.
+    
+    Parameters:
+    S_T: Stock price at expiration (scalar or array)
+    K: Strike price
+    option_type: 'call' or 'put'
+    position: 'buy' or 'sell'
+    
+    Returns:
+    payoff: Payoff at expiration
+    """
+    S_T = np.asarray(S_T, dtype=float)
+    if option_type == 'call':
+        payoff = np.maximum(0.0, S_T - K)
+    else:  # put
+        payoff = np.maximum(0.0, K - S_T)
+    
+    if position == 'sell':
+        payoff = -payoff
+    
+    return payoff[()]
+
+
+def option_profit(S_T, K, premium, option_type, position):
+    """
+    Calculate option profit at expiration.
+    
+    Parameters:
+    S_T: Stock price at expiration (scalar or array)
+    K: Strike price
+    premium: Option premium
+    option_type: 'call' or 'put'
+    position: 'buy' or 'sell'
+    
+    Returns:
+    profit: Profit at expiration
+    """
+    payoff = option_payoff(S_T, K, option_type, position)
+    
+    if position == 'buy':
+        profit = payoff - premium
+    else:  # sell
+        profit = premium + payoff
+    
+    return profit
+
+
+def _leg_payoff_matrix(prices, strikes, leg_types):
+    """
+    Calculate the expiry payoff of one unit of every leg at every price.
+    
+    Returns an array (n_prices, n_legs); stock legs pay the price itself.
+    """
+    prices = np.asarray(prices, dtype=float)[:, None]
+    strikes = np.asarray(strikes, dtype=float)[None, :]
+    leg_types = np.asarray(leg_types)[None, :]
+    
+    return np.select(
+        [leg_types == 'call', leg_types == 'put'],
+        [np.maximum(prices - strikes, 0.0), np.maximum(strikes - prices, 0.0)],
+        default=np.broadcast_to(prices, (prices.shape[0], strikes.shape[1]))
+    )
+
+
+def analyze_expiry_profile(strikes, leg_types, quantities, premiums):
+    """
+    Solve the piecewise-linear expiry profit of a multi-leg position exactly.
+    
+    The profit only changes slope at the strikes: a leg of quantity q adds q
+    to the slope at its strike whether it is a call or a put. Sorting the
+    strikes and accumulating those slope changes gives the profit at every
+    kink in O(legs log legs), with no price grid.
+    
+    Parameters:
+    strikes: Strike of each leg (ignored for stock legs)
+    leg_types: 'call', 'put' or 'stock' for each leg
+    quantities: Signed quantity of each leg (positive bought, negative sold)
+    premiums: Unit price paid for each leg (option premium or stock price)
+    
+    Returns:
+    analysis: Dictionary with the 'kinks' (zero price and the sorted strikes),
+    the 'kink_profits' at them, the 'slopes' to the right of each kink, every
+    'break_even', the 'max_profit' and 'max_loss' (inf when unbounded) and the
+    prices where they are reached ('max_profit_at', 'max_loss_at'; nan when
+    unbounded)
+    """
+    strikes = np.asarray(strikes, dtype=float)
+    leg_types = np.asarray(leg_types)
+    quantities = np.asarray(quantities, dtype=float)
+    is_option = leg_types != 'stock'
+    is_put = leg_types == 'put'
+    
+    knot_strikes, inverse = np.unique(strikes[is_option], return_inverse=True)
+    slope_changes = np.bincount(inverse, weights=quantities[is_option], minlength=knot_strikes.size)
+    
+    # Below every strike only stock and puts move with the price
+    first_slope = quantities[~is_option].sum() - quantities[is_put].sum()
+    floor_profit = quantities[is_put] @ strikes[is_put] - quantities @ np.asarray(premiums, dtype=float)
+    
+    kinks = np.concatenate([[0.0], knot_strikes[knot_strikes > 0]])
+    slope_changes = np.concatenate([[0.0], slope_changes[knot_strikes > 0]])
+    slopes = first_slope + np.cumsum(slope_changes)
+    kink_profits = floor_profit + np.concatenate([[0.0], np.cumsum(slopes[:-1] * np.diff(kinks))])
+    upper_slope = slopes[-1]
+    
+    tol = 1e-9 * (1.0 + np.abs(kink_profits).max())
+    left, right = kink_profits[:-1], kink_profits[1:]
+    crossing = ((left > tol) & (right < -tol)) | ((left < -tol) & (right > tol))
+    break_evens = [kinks[:-1][crossing] - left[crossing] / slopes[:-1][crossing], kinks[np.abs(kink_profits) <= tol]]
+    if kink_profits[-1] * upper_slope < 0 and abs(kink_profits[-1]) > tol:
+        break_evens.append([kinks[-1] - kink_profits[-1] / upper_slope])
+    
+    max_profit = np.inf if upper_slope > 0 else kink_profits.max()
+    max_loss = np.inf if upper_slope < 0 else -kink_profits.min()
+    
+    return {
+        'kinks': kinks,
+        'kink_profits': kink_profits,
+        'slopes': slopes,
+        'break_evens': np.sort(np.concatenate(break_evens)),
+        'max_profit': float(max_profit),
+        'max_loss': float(max_loss),
+        'max_profit_at': np.nan if upper_slope > 0 else float(kinks[kink_profits.argmax()]),
+        'max_loss_at': np.nan if upper_slope < 0 else float(kinks[kink_profits.argmin()])
+    }
+
+
+def payoff_profile(prices, strikes, leg_types, quantities, premiums):
+    """
+    Calculate payoff, profit and break-even points of a multi-leg position.
+    
+    The payoff of every leg over the whole price grid is one (prices x legs)
+    matrix, and the position is its product with the signed quantities.
+    
+    Parameters:
+    prices: Price grid of the underlying at expiration
+    strikes: Strike of each leg (ignored for stock legs)
+    leg_types: 'call', 'put' or 'stock' for each leg
+    quantities: Signed quantity of each leg (positive bought, negative sold)
+    premiums: Unit price paid for each leg (option premium or stock price)
+    
+    Returns:
+    profile: Dictionary with the 'payoff' and 'profit' arrays over prices and
+    the exact 'break_evens' from analyze_expiry_profile
+    """
+    prices = np.asarray(prices, dtype=float)
+    quantities = np.asarray(quantities, dtype=float)
+    
+    payoff = _leg_payoff_matrix(prices, strikes, leg_types) @ quantities
+    profit = payoff - quantities @ np.asarray(premiums, dtype=float)
+    analysis = analyze_expiry_profile(strikes, leg_types, quantities, premiums)
+    
+    return {'payoff': payoff, 'profit': profit, 'break_evens': analysis['break_evens']}
+
+
+def break_even_point(K, premium, option_type, position):
+    """
+    Calculate break-even point.
+    
+    Parameters:
+    K: Strike price
+    premium: Option premium
+    option_type: 'call' or 'put'
+    position: 'buy' or 'sell'
+    
+    Returns:
+    break_even: Break-even point (nan if the position never breaks even,
+    e.g. a put whose premium exceeds its strike)
+    """
+    quantity = 1.0 if position == 'buy' else -1.0
+    break_evens = analyze_expiry_profile([K], [option_type], [quantity], [premium])['break_evens']
+    return break_evens[0] if break_evens.size else np.nan
+
+
+@dataclass(frozen=True)
+class Leg:
+    """One leg of an option strategy."""
+    option_type: str  # 'call', 'put' or 'stock'
+    strike: float = 0.0
+    expiry: float = 1.0  # years; ignored for stock legs
+    quantity: float = 1.0
+    side: str = 'buy'  # 'buy' or 'sell'
+    
+    @property
+    def signed_quantity(self):
+        return self.quantity if self.side == 'buy' else -self.quantity
+
+
+@dataclass(frozen=True)
+class Strategy:
+    """A multi-leg option strategy; immutable so it can key caches."""
+    name: str
+    legs: tuple
+    
+    def leg_arrays(self):
+        """Return the legs in struct-of-arrays form: types, strikes, expiries, signed quantities."""
+        return (
+            np.array([leg.option_type for leg in self.legs]),
+            np.array([leg.strike for leg in self.legs], dtype=float),
+            np.array([leg.expiry for leg in self.legs], dtype=float),
+            np.array([leg.signed_quantity for leg in self.legs], dtype=float)
+        )
+
+
+STRATEGY_GREEKS = ('delta', 'gamma', 'theta', 'vega', 'rho')
+
+
+def price_strategy(strategy, S, r, sigma):
+    """
+    Price every leg of a strategy and aggregate its Greeks in one batched call.
+    
+    Parameters:
+    strategy: Strategy to price
+    S: Current stock price
+    r: Risk-free interest rate (annual)
+    sigma: Volatility (scalar or one value per leg)
+    
+    Returns:
+    result: Dictionary with the unit 'premiums' of each leg (the stock price
+    for stock legs), the 'net_premium' paid (negative when received) and the
+    position 'greeks' summed over the legs
+    """
+    leg_types, strikes, expiries, quantities = strategy.leg_arrays()
+    is_stock = leg_types == 'stock'
+    
+    # Stock legs go through the kernel as dummy at-the-money calls and are overridden below
+    leg_greeks = cached_greeks(S, np.where(is_stock, S, strikes), expiries, r, sigma,
+                               leg_types == 'call', which=('price',) + STRATEGY_GREEKS)
+    premiums = np.where(is_stock, S, leg_greeks['price'])
+    
+    position_greeks = {}
+    for name in STRATEGY_GREEKS:
+        unit = np.where(is_stock, 1.0 if name == 'delta' else 0.0, leg_greeks[name])
+        position_greeks[name] = float(quantities @ unit)
+    
+    return {
+        'premiums': premiums,
+        'net_premium': float(quantities @ premiums),
+        'greeks': position_greeks
+    }
+
+
+def _grid_break_evens(prices, profit):
+    """Locate the zeros of a profit curve sampled on a price grid."""
+    crossing = np.flatnonzero(np.sign(profit[:-1]) * np.sign(profit[1:]) < 0)
+    weight = profit[crossing] / (profit[crossing] - profit[crossing + 1])
+    break_evens = prices[crossing] + weight * (prices[crossing + 1] - prices[crossing])
+    return np.sort(np.concatenate([break_evens, prices[profit == 0]]))
+
+
+def strategy_profile(strategy, prices, S, r, sigma):
+    """
+    Calculate the profit of a strategy over a price grid at its first expiry.
+    
+    Legs expiring at the horizon contribute their intrinsic value; legs that
+    expire later (calendar spreads) are revalued with Black-Scholes for the
+    time they have left. All legs are evaluated as one (prices x legs) array.
+    
+    Parameters:
+    strategy: Strategy to evaluate
+    prices: Price grid of the underlying at the horizon
+    S: Current stock price
+    r: Risk-free interest rate (annual)
+    sigma: Volatility
+    
+    Returns:
+    profile: Dictionary with the 'horizon' (years), the position 'value' and
+    'profit' at the horizon, the 'profit_today' if the position were closed
+    at the current value, the 'break_evens', 'max_profit' and 'max_loss'
+    (inf when unbounded), the asymptotic 'upper_slope' of the profit as the
+    price grows and the pricing result of price_strategy. When every option
+    leg expires at the horizon these come exactly from analyze_expiry_profile;
+    otherwise they are read from the grid plus a zero price.
+    """
+    prices = np.asarray(prices, dtype=float)
+    leg_types, strikes, expiries, quantities = strategy.leg_arrays()
+    is_stock = leg_types == 'stock'
+    is_call = leg_types == 'call'
+    pricing = price_strategy(strategy, S, r, sigma)
+    
+    horizon = expiries[~is_stock].min() if (~is_stock).any() else 0.0
+    remaining = np.where(is_stock, 0.0, expiries - horizon)
+    today = np.where(is_stock, 0.0, expiries)
+    
+    # The grid carries one extra zero price so the profit floor is always seen
+    grid = np.append(prices, 0.0)[:, None]
+    leg_values = black_scholes_vectorized(grid, strikes, np.stack([remaining, today])[:, None, :],
+                                          r, sigma, is_call)
+    leg_values = np.where(is_stock, grid, leg_values)
+    value, value_today = leg_values @ quantities
+    
+    profit = value - pricing['net_premium']
+    # As the price grows every call behaves like stock and every put vanishes
+    upper_slope = float(quantities[leg_types != 'put'].sum())
+    
+    if np.all(remaining == 0.0):
+        analysis = analyze_expiry_profile(strikes, leg_types, quantities, pricing['premiums'])
+        break_evens, max_profit, max_loss = analysis['break_evens'], analysis['max_profit'], analysis['max_loss']
+    else:
+        break_evens = _grid_break_evens(prices, profit[:-1])
+        max_profit = np.inf if upper_slope > 0 else float(profit.max())
+        max_loss = np.inf if upper_slope < 0 else float(-profit.min())
+    
+    return {
+        'horizon': horizon,
+        'upper_slope': upper_slope,
+        'value': value[:-1],
+        'profit': profit[:-1],
+        'profit_today': value_today[:-1] - pricing['net_premium'],
+        'break_evens': break_evens,
+        'max_profit': max_profit,
+        'max_loss': max_loss,
+        'pricing': pricing
+    }
+
+
+def scenario_grid(strategy, S, r, sigma, spot_shocks, vol_shocks, elapsed):
+    """
+    Revalue a strategy on a (time x vol x spot) grid of scenarios.
+    
+    Every leg is repriced with Black-Scholes at every scenario in one
+    broadcast call; legs that have already expired pay their intrinsic value.
+    
+    Parameters:
+    strategy: Strategy to revalue
+    S: Current stock price
+    r: Risk-free interest rate (annual)
+    sigma: Current volatility (scalar or one value per leg)
+    spot_shocks: Relative spot moves (e.g. -0.2 for a 20% drop)
+    vol_shocks: Absolute volatility moves (e.g. -0.05 for 5 vol points down)
+    elapsed: Time elapsed from today in years
+    
+    Returns:
+    scenarios: Dictionary with the axes 'elapsed', 'vol_shocks' and 'spots'
+    and the 'pnl' cube of shape (elapsed, vol_shocks, spots) relative to the
+    current value of the position
+    """
+    leg_types, strikes, expiries, quantities = strategy.leg_arrays()
+    is_stock = leg_types == 'stock'
+    net_premium = price_strategy(strategy, S, r, sigma)['net_premium']
+    
+    elapsed = np.asarray(elapsed, dtype=float)
+    vol_shocks = np.asarray(vol_shocks, dtype=float)
+    spots = S * (1.0 + np.asarray(spot_shocks, dtype=float))
+    
+    # Axes: elapsed x vol x spot x leg
+    spot_axis = spots[None, None, :, None]
+    vol_axis = np.maximum(np.asarray(sigma, dtype=float) + vol_shocks[None, :, None, None], 1e-4)
+    remaining = np.maximum(expiries - elapsed[:, None, None, None], 0.0)
+    
+    leg_values = black_scholes_vectorized(spot_axis, strikes, remaining, r, vol_axis, leg_types == 'call')
+    leg_values = np.where(is_stock, spot_axis, leg_values)
+    
+    return {
+        'elapsed': elapsed,
+        'vol_shocks': vol_shocks,
+        'spots': spots,
+        'pnl': leg_values @ quantities - net_premium
+    }
+
+
+@st.cache_data(max_entries=64)
+def cached_scenario_grid(strategy, S, r, sigma, spot_shocks, vol_shocks, elapsed):
+    """scenario_grid memoized per strategy and grid; array arguments must be tuples."""
+    return scenario_grid(strategy, S, r, np.asarray(sigma), spot_shocks, vol_shocks, elapsed)
+
+
+# Declarative strategy definitions: each leg is
+# (option type, side, strike slider key, quantity, expiry as a multiple of T);
+# "order" lists the strike keys from lowest to highest strike
+STRATEGY_TEMPLATES = {
+    "Compra de Call (Long Call)": {
+        "description": "Compra de uma opção de compra, dando a você o direito de comprar o ativo subjacente pelo preço de exercício.",
+        "strikes": {"K_call": ("Preço de Exercício da Call", 100.0)},
+        "legs": [("call", "buy", "K_call", 1, 1.0)]
+    },
+    "Trava de Alta com Calls (Bull Call Spread)": {
+        "description": "Comprar uma opção de compra com strike menor e vender uma opção de compra com strike maior.",
+        "strikes": {"K_long": ("Preço de Exercício da Call Comprada", 95.0),
+                    "K_short": ("Preço de Exercício da Call Vendida", 110.0)},
+        "order": ("K_long", "K_short"),
+        "legs": [("call", "buy", "K_long", 1, 1.0), ("call", "sell", "K_short", 1, 1.0)]
+    },
+    "Reversão de Risco (Compra Call, Vende Put)": {
+        "description": "Comprar uma call fora do dinheiro financiada pela venda de uma put fora do dinheiro, criando exposição altista com custo reduzido.",
+        "strikes": {"K_call": ("Preço de Exercício da Call Comprada", 110.0),
+                    "K_put": ("Preço de Exercício da Put Vendida", 90.0)},
+        "order": ("K_put", "K_call"),
+        "legs": [("call", "buy", "K_call", 1, 1.0), ("put", "sell", "K_put", 1, 1.0)]
+    },
+    "Venda Coberta de Call (Covered Call)": {
+        "description": "Possuir o ativo subjacente e vender uma opção de compra sobre ele.",
+        "strikes": {"K_call": ("Preço de Exercício da Call", 110.0)},
+        "legs": [("stock", "buy", None, 1, 1.0), ("call", "sell", "K_call", 1, 1.0)]
+    },
+    "Trava de Alta com Puts (Bull Put Spread)": {
+        "description": "Vender uma opção de venda com strike maior e comprar uma opção de venda com strike menor, recebendo prêmio líquido.",
+        "strikes": {"K_long": ("Preço de Exercício da Put Comprada", 90.0),
+                    "K_short": ("Preço de Exercício da Put Vendida", 105.0)},
+        "order": ("K_long", "K_short"),
+        "legs": [("put", "buy", "K_long", 1, 1.0), ("put", "sell", "K_short", 1, 1.0)]
+    },
+    "Spread Vertical de Call Comprado": {
+        "description": "Comprar uma call e vender outra call de strike maior no mesmo vencimento, limitando custo e ganho.",
+        "strikes": {"K_long": ("Preço de Exercício da Call Comprada", 95.0),
+                    "K_short": ("Preço de Exercício da Call Vendida", 110.0)},
+        "order": ("K_long", "K_short"),
+        "legs": [("call", "buy", "K_long", 1, 1.0), ("call", "sell", "K_short", 1, 1.0)]
+    },
+    "Compra de Put (Long Put)": {
+        "description": "Compra de uma opção de venda, dando a você o direito de vender o ativo subjacente pelo preço de exercício.",
+        "strikes": {"K_put": ("Preço de Exercício da Put", 100.0)},
+        "legs": [("put", "buy", "K_put", 1, 1.0)]
+    },
+    "Trava de Baixa com Puts (Bear Put Spread)": {
+        "description": "Comprar uma opção de venda com strike maior e vender uma opção de venda com strike menor.",
+        "strikes": {"K_long": ("Preço de Exercício da Put Comprada", 110.0),
+                    "K_short": ("Preço de Exercício da Put Vendida", 95.0)},
+        "order": ("K_short", "K_long"),
+        "legs": [("put", "buy", "K_long", 1, 1.0), ("put", "sell", "K_short", 1, 1.0)]
+    },
+    "Reversão de Risco (Compra Put, Vende Call)": {
+        "description": "Comprar uma put fora do dinheiro financiada pela venda de uma call fora do dinheiro, criando exposição baixista com custo reduzido.",
+        "strikes": {"K_put": ("Preço de Exercício da Put Comprada", 90.0),
+                    "K_call": ("Preço de Exercício da Call Vendida", 110.0)},
+        "order": ("K_put", "K_call"),
+        "legs": [("put", "buy", "K_put", 1, 1.0), ("call", "sell", "K_call", 1, 1.0)]
+    },
+    "Trava de Baixa com Calls (Bear Call Spread)": {
+        "description": "Vender uma opção de compra com strike menor e comprar uma opção de compra com strike maior, recebendo prêmio líquido.",
+        "strikes": {"K_short": ("Preço de Exercício da Call Vendida", 95.0),
+                    "K_long": ("Preço de Exercício da Call Comprada", 110.0)},
+        "order": ("K_short", "K_long"),
+        "legs": [("call", "sell", "K_short", 1, 1.0), ("call", "buy", "K_long", 1, 1.0)]
+    },
+    "Venda Coberta de Put (Covered Put)": {
+        "description": "Estar vendido no ativo subjacente e vender uma opção de venda sobre ele.",
+        "strikes": {"K_put": ("Preço de Exercício da Put", 90.0)},
+        "legs": [("stock", "sell", None, 1, 1.0), ("put", "sell", "K_put", 1, 1.0)]
+    },
+    "Venda de Call (Short Call)": {
+        "description": "Venda de uma opção de compra, obrigando você a vender o ativo subjacente pelo preço de exercício se a opção for exercida.",
+        "strikes": {"K_call": ("Preço de Exercício da Call", 100.0)},
+        "legs": [("call", "sell", "K_call", 1, 1.0)]
+    },
+    "Condor de Ferro (Iron Condor)": {
+        "description": "Uma estratégia neutra de mercado que lucra quando o preço do subjacente permanece dentro de uma faixa.",
+        "strikes": {"K_put_long": ("Strike da Put Comprada", 80.0),
+                    "K_put_short": ("Strike da Put Vendida", 90.0),
+                    "K_call_short": ("Strike da Call Vendida", 110.0),
+                    "K_call_long": ("Strike da Call Comprada", 120.0)},
+        "order": ("K_put_long", "K_put_short", "K_call_short", "K_call_long"),
+        "legs": [("put", "buy", "K_put_long", 1, 1.0), ("put", "sell", "K_put_short", 1, 1.0),
+                 ("call", "sell", "K_call_short", 1, 1.0), ("call", "buy", "K_call_long", 1, 1.0)]
+    },
+    "Venda de Straddle (Short Straddle)": {
+        "description": "Vender uma call e uma put no mesmo preço de exercício, lucrando se o preço ficar próximo do strike.",
+        "strikes": {"K": ("Preço de Exercício", 100.0)},
+        "legs": [("call", "sell", "K", 1, 1.0), ("put", "sell", "K", 1, 1.0)]
+    },
+    "Venda de Strangle (Short Strangle)": {
+        "description": "Vender uma put de strike menor e uma call de strike maior, lucrando se o preço permanecer entre os strikes.",
+        "strikes": {"K_put": ("Strike da Put Vendida", 90.0),
+                    "K_call": ("Strike da Call Vendida", 110.0)},
+        "order": ("K_put", "K_call"),
+        "legs": [("put", "sell", "K_put", 1, 1.0), ("call", "sell", "K_call", 1, 1.0)]
+    },
+    "Borboleta (Butterfly Spread)": {
+        "description": "Comprar uma call de strike baixo, vender duas calls de strike intermediário e comprar uma call de strike alto.",
+        "strikes": {"K_low": ("Strike Inferior (Comprado)", 90.0),
+                    "K_mid": ("Strike Central (2 Vendidas)", 100.0),
+                    "K_high": ("Strike Superior (Comprado)", 110.0)},
+        "order": ("K_low", "K_mid", "K_high"),
+        "legs": [("call", "buy", "K_low", 1, 1.0), ("call", "sell", "K_mid", 2, 1.0),
+                 ("call", "buy", "K_high", 1, 1.0)]
+    },
+    "Compra de Straddle (Long Straddle)": {
+        "description": "Comprar tanto uma call quanto uma put no mesmo preço de exercício, lucrando com grandes movimentos de preço em qualquer direção.",
+        "strikes": {"K": ("Preço de Exercício", 100.0)},
+        "legs": [("call", "buy", "K", 1, 1.0), ("put", "buy", "K", 1, 1.0)]
+    },
+    "Compra de Strangle (Long Strangle)": {
+        "description": "Comprar uma put de strike menor e uma call de strike maior, lucrando com grandes movimentos a um custo menor que o straddle.",
+        "strikes": {"K_put": ("Strike da Put Comprada", 90.0),
+                    "K_call": ("Strike da Call Comprada", 110.0)},
+        "order": ("K_put", "K_call"),
+        "legs": [("put", "buy", "K_put", 1, 1.0), ("call", "buy", "K_call", 1, 1.0)]
+    },
+    "Long Guts": {
+        "description": "Comprar uma call e uma put dentro do dinheiro (strike da call abaixo do strike da put), lucrando com grandes movimentos.",
+        "strikes": {"K_call": ("Strike da Call Comprada", 90.0),
+                    "K_put": ("Strike da Put Comprada", 110.0)},
+        "order": ("K_call", "K_put"),
+        "legs": [("call", "buy", "K_call", 1, 1.0), ("put", "buy", "K_put", 1, 1.0)]
+    },
+    "Borboleta de Ferro (Iron Butterfly)": {
+        "description": "Vender um straddle no strike central e comprar um strangle de proteção, com risco e ganho limitados.",
+        "strikes": {"K_put_long": ("Strike da Put Comprada", 90.0),
+                    "K_body": ("Strike Central (Call e Put Vendidas)", 100.0),
+                    "K_call_long": ("Strike da Call Comprada", 110.0)},
+        "order": ("K_put_long", "K_body", "K_call_long"),
+        "legs": [("put", "buy", "K_put_long", 1, 1.0), ("put", "sell", "K_body", 1, 1.0),
+                 ("call", "sell", "K_body", 1, 1.0), ("call", "buy", "K_call_long", 1, 1.0)]
+    },
+    "Spread de Calendário (Calendar Spread)": {
+        "description": "Vender uma call de vencimento curto e comprar uma call de mesmo strike com o dobro do prazo, lucrando com o decaimento mais rápido da opção curta.",
+        "strikes": {"K": ("Preço de Exercício", 100.0)},
+        "legs": [("call", "sell", "K", 1, 1.0), ("call", "buy", "K", 1, 2.0)]
+    },
+}
+
+
+def build_strategy(name, strikes, T):
+    """
+    Build a Strategy from its template, the chosen strikes and the base expiry.
+    
+    Parameters:
+    name: Key of STRATEGY_TEMPLATES
+    strikes: Dictionary mapping the template's strike keys to values
+    T: Base time to maturity (in years)
     
     Returns:
-    option_price: Price of the option
-    """
-    d1 = (np.log(S / K) + (r + 0.5 * sigma**2) * T) / (sigma * np.sqrt(T))
-    d2 = d1 - sigma * np.sqrt(T)
+    strategy: Strategy with one Leg per template leg
     
-    if option_type == 'call':
-        option_price = S * norm.cdf(d1) - K * np.exp(-r * T) * norm.cdf(d2)
-    else:  # put
-        option_price = K * np.exp(-r * T) * norm.cdf(-d2) - S * norm.cdf(-d1)
-    
-    return option_price
+    Raises:
+    ValueError: If the strikes break the template's order (e.g. crossed
+    spread strikes), since the position would no longer be the named strategy
+    """
+    template = STRATEGY_TEMPLATES[name]
+    order = template.get("order", ())
+    for lower, upper in zip(order, order[1:]):
+        if strikes[upper] < strikes[lower]:
+            raise ValueError(
+                f"'{template['strikes'][upper][0]}' ({strikes[upper]:.2f}) must not be below "
+                f"'{template['strikes'][lower][0]}' ({strikes[lower]:.2f})"
+            )
+    legs = tuple(
+        Leg(option_type, strikes.get(strike_key, 0.0), T * expiry_factor, quantity, side)
+        for option_type, side, strike_key, quantity, expiry_factor in template["legs"]
+    )
+    return Strategy(name, legs)
 
 
-def option_payoff(S_T, K, option_type, position):
+PORTFOLIO_GREEKS = ('price', 'delta', 'gamma', 'theta', 'vega', 'rho')
+
+
+class Portfolio:
     """
-    Calculate option payoff at expiration.
+    Book of option and stock positions in struct-of-arrays form.
     
-    Parameters:
-    S_T: Stock price at expiration
-    K: Strike price
-    option_type: 'call' or 'put'
-    position: 'buy' or 'sell'
+    Every attribute is one array with a row per position, so valuing the whole
+    book is a single call to greeks() and grouping is a sort plus
+    np.add.reduceat instead of a loop over positions.
     
-    Returns:
-    payoff: Payoff at expiration
+    Parameters:
+    underlying: Underlying code of each position
+    option_type: 'call', 'put' or 'stock' for each position
+    strike: Strike of each position (ignored for stock)
+    expiry: Time to maturity of each position in years (ignored for stock)
+    quantity: Signed quantity (positive long, negative short)
+    cost: Unit price paid for each position (default 0, giving pure MtM)
     """
-    if option_type == 'call':
-        payoff = max(0, S_T - K)
-    else:  # put
-        payoff = max(0, K - S_T)
     
-    if position == 'sell':
-        payoff = -payoff
+    def __init__(self, underlying, option_type, strike, expiry, quantity, cost=None):
+        self.underlyings, self.underlying_codes = np.unique(np.asarray(underlying, dtype=str), return_inverse=True)
+        self.option_type = np.asarray(option_type, dtype=str)
+        self.strike = np.asarray(strike, dtype=float)
+        self.expiry = np.asarray(expiry, dtype=float)
+        self.quantity = np.asarray(quantity, dtype=float)
+        self.cost = np.zeros_like(self.quantity) if cost is None else np.asarray(cost, dtype=float)
+    
+    @classmethod
+    def from_frame(cls, frame):
+        """Build a portfolio from a DataFrame with the constructor's column names."""
+        return cls(frame['underlying'], frame['option_type'], frame['strike'], frame['expiry'],
+                   frame['quantity'], frame['cost'] if 'cost' in frame.columns else None)
+    
+    def __len__(self):
+        return self.quantity.size
+    
+    def _per_position(self, values, name):
+        """Broadcast a scalar, per-underlying dict or per-position array to the positions."""
+        if isinstance(values, dict):
+            missing = set(self.underlyings) - set(values)
+            if missing:
+                raise ValueError(f"No {name} for underlyings: {sorted(missing)}")
+            return np.array([values[u] for u in self.underlyings], dtype=float)[self.underlying_codes]
+        return np.broadcast_to(np.asarray(values, dtype=float), self.quantity.shape)
+    
+    def risk(self, spots, r, sigma):
+        """
+        Value the whole book and its Greeks in one vectorized pass.
+        
+        Parameters:
+        spots: Spot per underlying (dict) or per position (array)
+        r: Risk-free interest rate (annual)
+        sigma: Volatility as a scalar, dict per underlying or array per position
+        
+        Returns:
+        risk: Dictionary with the per-position 'positions' (quantity-weighted
+        value, pnl and Greeks) and the book 'totals'; theta is per year and
+        vega and rho per 1.00 change, as in greeks()
+        """
+        S = self._per_position(spots, 'spot')
+        vol = self._per_position(sigma, 'volatility')
+        is_stock = self.option_type == 'stock'
+        
+        # Stock rows go through the kernel as dummy at-the-money calls and are overridden below
+        unit = greeks(S, np.where(is_stock, S, self.strike), np.where(is_stock, 1.0, self.expiry),
+                      r, vol, self.option_type == 'call', which=PORTFOLIO_GREEKS)
+        
+        positions = {}
+        for name in PORTFOLIO_GREEKS:
+            stock_value = S if name == 'price' else (1.0 if name == 'delta' else 0.0)
+            positions['value' if name == 'price' else name] = self.quantity * np.where(is_stock, stock_value, unit[name])
+        positions['pnl'] = positions['value'] - self.quantity * self.cost
+        
+        return {
+            'positions': positions,
+            'totals': {name: float(column.sum()) for name, column in positions.items()}
+        }
+    
+    def group(self, risk, by=('underlying', 'expiry')):
+        """
+        Aggregate per-position risk by underlying and/or expiry.
+        
+        Positions are sorted by the group keys once and every risk column is
+        summed per group with np.add.reduceat.
+        
+        Parameters:
+        risk: Result of risk()
+        by: Group keys, any of 'underlying', 'expiry' and 'option_type'
+        
+        Returns:
+        table: DataFrame with one row per group and the summed risk columns
+        """
+        keys = {
+            'underlying': self.underlying_codes,
+            'expiry': np.where(self.option_type == 'stock', 0.0, self.expiry),
+            'option_type': self.option_type,
+        }
+        columns = [keys[name] for name in by]
+        order = np.lexsort(columns[::-1])
+        sorted_keys = [column[order] for column in columns]
+        
+        change = np.zeros(order.size, dtype=bool)
+        change[0] = order.size > 0
+        for column in sorted_keys:
+            change[1:] |= column[1:] != column[:-1]
+        starts = np.flatnonzero(change)
+        
+        table = {name: column[starts] for name, column in zip(by, sorted_keys)}
+        if 'underlying' in table:
+            table['underlying'] = self.underlyings[table['underlying']]
+        table['positions'] = np.diff(np.append(starts, order.size))
+        for name, column in risk['positions'].items():
+            table[name] = np.add.reduceat(column[order], starts) if starts.size else column[:0]
+        return pd.DataFrame(table)
+
+
+VAR_METHODS = ('delta_normal', 'delta_gamma', 'monte_carlo', 'historical')
+
+
+def _per_underlying(portfolio, values, name):
+    """Array with one value per underlying of the portfolio from a scalar or dict."""
+    if isinstance(values, dict):
+        missing = set(portfolio.underlyings) - set(values)
+        if missing:
+            raise ValueError(f"No {name} for underlyings: {sorted(missing)}")
+        return np.array([values[u] for u in portfolio.underlyings], dtype=float)
+    return np.full(portfolio.underlyings.size, float(values))
+
+
+def _correlation_matrix(correlation, n):
+    """Correlation matrix from a scalar (common correlation) or a full matrix."""
+    if correlation is None or np.ndim(correlation) == 0:
+        rho = 0.0 if correlation is None else float(correlation)
+        return np.full((n, n), rho) + (1.0 - rho) * np.eye(n)
+    return np.asarray(correlation, dtype=float)
+
+
+def _tail_merge(tail, pnl, k):
+    """Keep the k worst P&Ls of the running tail and a new chunk of scenarios."""
+    merged = np.concatenate([tail, pnl])
+    return merged if merged.size <= k else np.partition(merged, k - 1)[:k]
+
+
+def _revaluation_grids(portfolio, spots, r, sigma, horizon, log_range, grid_points):
+    """
+    Value each underlying's sub-book at the horizon on a grid of spot prices.
     
-    return payoff
+    Options on one underlying depend on no other spot, so the book value in a
+    scenario is the sum over underlyings of these curves interpolated at the
+    scenario spots. Returns the (n_underlyings, grid_points) spot grids and values.
+    """
+    n_underlyings = portfolio.underlyings.size
+    log_moves = np.linspace(-log_range, log_range, grid_points)
+    grids = spots[:, None] * np.exp(log_moves[None, :] * sigma[:, None] * np.sqrt(horizon))
+    values = np.zeros((n_underlyings, grid_points))
+    
+    # Positions with identical terms are netted first so each contract is priced once
+    leg_order = np.argsort(LEG_TYPES)
+    type_codes = leg_order[np.searchsorted(LEG_TYPES, portfolio.option_type, sorter=leg_order)]
+    terms = np.column_stack([portfolio.underlying_codes, type_codes, portfolio.strike,
+                             np.where(portfolio.option_type == 'stock', 0.0, portfolio.expiry)])
+    terms, inverse = np.unique(terms, axis=0, return_inverse=True)
+    quantity = np.bincount(inverse.ravel(), weights=portfolio.quantity, minlength=len(terms))
+    codes = terms[:, 0].astype(int)
+    is_call = terms[:, 1] == LEG_TYPES.index('call')
+    is_stock = terms[:, 1] == LEG_TYPES.index('stock')
+    remaining = np.maximum(terms[:, 3] - horizon, 0.0)
+    
+    chunk = max(1, MC_CHUNK_ELEMENTS // grid_points)
+    for u in range(n_underlyings):
+        rows = np.flatnonzero((codes == u) & (quantity != 0))
+        for start in range(0, rows.size, chunk):
+            block = rows[start:start + chunk]
+            grid = grids[u][:, None]
+            leg_values = black_scholes_vectorized(grid, terms[block, 2], remaining[block], r, sigma[u], is_call[block])
+            leg_values = np.where(is_stock[block], grid, leg_values)
+            values[u] += leg_values @ quantity[block]
+    return grids, values
 
 
-def option_profit(S_T, K, premium, option_type, position):
+def value_at_risk(portfolio, spots, r, sigma, method='delta_normal', confidence=0.99, horizon=1 / 252,
+                  correlation=None, n_scenarios=1_000_000, returns=None, seed=None, grid_points=501):
     """
-    Calculate option profit at expiration.
+    Calculate Value-at-Risk and Expected Shortfall of an option book.
+    
+    Underlying log-returns over the horizon are normal with the pricing vols
+    and the given correlation. 'delta_normal' uses the position deltas;
+    'delta_gamma' adds the gammas and takes the quantile by Cornish-Fisher
+    from the exact cumulants of the quadratic P&L; 'monte_carlo' and
+    'historical' fully revalue the book, per underlying, on a fine spot grid
+    at the horizon. Simulated scenarios are processed in chunks keeping only
+    the running tail, so memory stays flat in n_scenarios.
     
     Parameters:
-    S_T: Stock price at expiration
-    K: Strike price
-    premium: Option premium
-    option_type: 'call' or 'put'
-    position: 'buy' or 'sell'
+    portfolio: Portfolio to measure
+    spots: Spot per underlying (dict) or one spot for all
+    r: Risk-free interest rate (annual)
+    sigma: Volatility per underlying (dict) or one vol for all
+    method: One of VAR_METHODS
+    confidence: Confidence level (e.g. 0.99)
+    horizon: Risk horizon in years (default one business day)
+    correlation: Common correlation (scalar) or matrix between underlyings
+    n_scenarios: Number of scenarios for 'monte_carlo'
+    returns: Historical log-returns (n_days, n_underlyings) for 'historical'
+    seed: Random seed for 'monte_carlo'
+    grid_points: Size of the revaluation grid per underlying
     
     Returns:
-    profit: Profit at expiration
+    result: Dictionary with 'var' and 'es' as positive losses, the P&L
+    'mean' and 'std' and, for simulations, the number of 'scenarios'
     """
-    payoff = option_payoff(S_T, K, option_type, position)
-    
-    if position == 'buy':
-        profit = payoff - premium
-    else:  # sell
-        profit = premium + payoff
-    
-    return profit
+    if method not in VAR_METHODS:
+        raise ValueError(f"Unknown VaR method: {method}")
+    
+    S = _per_underlying(portfolio, spots, 'spot')
+    vol = _per_underlying(portfolio, sigma, 'volatility')
+    tail_prob = 1.0 - confidence
+    
+    if method in ('delta_normal', 'delta_gamma'):
+        risk = portfolio.risk(dict(zip(portfolio.underlyings, S)), r, dict(zip(portfolio.underlyings, vol)))
+        codes, n_underlyings = portfolio.underlying_codes, portfolio.underlyings.size
+        delta = np.bincount(codes, weights=risk['positions']['delta'], minlength=n_underlyings)
+        gamma = np.bincount(codes, weights=risk['positions']['gamma'], minlength=n_underlyings)
+        mean = risk['totals']['theta'] * horizon
+        
+        # P&L = mean + b'x + 1/2 x'Ax with x standard normal and dS = S sigma sqrt(h) L x
+        scale = S * vol * np.sqrt(horizon)
+        L = np.linalg.cholesky(_correlation_matrix(correlation, n_underlyings))
+        b = L.T @ (delta * scale)
+        
+        if method == 'delta_normal':
+            std = float(np.sqrt(b @ b))
+            z = norm.ppf(tail_prob)
+            return {'var': -(mean + z * std), 'es': -(mean - std * norm.pdf(z) / tail_prob),
+                    'mean': mean, 'std': std}
+        
+        A = L.T @ np.diag(gamma * scale ** 2) @ L
+        lam, P = np.linalg.eigh(A)
+        c = P.T @ b
+        cumulants = [mean + 0.5 * lam.sum(), c @ c + 0.5 * lam @ lam,
+                     np.sum(lam ** 3) + 3 * np.sum(c ** 2 * lam),
+                     3 * np.sum(lam ** 4) + 12 * np.sum(c ** 2 * lam ** 2)]
+        std = float(np.sqrt(cumulants[1]))
+        skew = cumulants[2] / std ** 3 if std > 0 else 0.0
+        kurt = cumulants[3] / std ** 4 if std > 0 else 0.0
+        
+        def cornish_fisher(p):
+            z = norm.ppf(p)
+            w = z + (z ** 2 - 1) * skew / 6 + (z ** 3 - 3 * z) * kurt / 24 - (2 * z ** 3 - 5 * z) * skew ** 2 / 36
+            return cumulants[0] + std * w
+        
+        # ES as the average Cornish-Fisher quantile over the tail levels
+        tail_levels = (np.arange(200) + 0.5) / 200 * tail_prob
+        return {'var': float(-cornish_fisher(tail_prob)), 'es': float(-cornish_fisher(tail_levels).mean()),
+                'mean': float(cumulants[0]), 'std': std, 'skew': float(skew), 'excess_kurtosis': float(kurt)}
+    
+    value_today = portfolio.risk(dict(zip(portfolio.underlyings, S)), r,
+                                 dict(zip(portfolio.underlyings, vol)))['totals']['value']
+    
+    if method == 'historical':
+        if returns is None:
+            raise ValueError("Historical VaR needs a returns matrix")
+        returns = np.asarray(returns, dtype=float).reshape(len(returns), -1)
+        n_scenarios = returns.shape[0]
+        log_range = max(np.abs(returns / (vol * np.sqrt(horizon))).max(), 1.0)
+        chunks = (returns[start:start + MC_CHUNK_ELEMENTS // 8] for start in range(0, n_scenarios, MC_CHUNK_ELEMENTS // 8))
+    else:
+        rng = np.random.default_rng(seed)
+        L = np.linalg.cholesky(_correlation_matrix(correlation, S.size))
+        log_range = 8.0
+        drift = -0.5 * vol ** 2 * horizon
+        chunk_size = max(1, MC_CHUNK_ELEMENTS // (8 * S.size))
+        chunks = (drift + (rng.standard_normal((min(chunk_size, n_scenarios - start), S.size)) @ L.T) * vol * np.sqrt(horizon)
+                  for start in range(0, n_scenarios, chunk_size))
+    
+    grids, values = _revaluation_grids(portfolio, S, r, vol, horizon, log_range, grid_points)
+    k = max(1, int(np.ceil(n_scenarios * tail_prob)))
+    tail = np.empty(0)
+    total = total_sq = 0.0
+    for log_returns in chunks:
+        pnl = -value_today
+        for u in range(S.size):
+            pnl = pnl + np.interp(S[u] * np.exp(log_returns[:, u]), grids[u], values[u])
+        tail = _tail_merge(tail, pnl, k)
+        total += pnl.sum()
+        total_sq += pnl @ pnl
+    
+    mean = total / n_scenarios
+    tail = np.sort(tail)
+    return {'var': float(-tail[-1]), 'es': float(-tail.mean()), 'mean': float(mean),
+            'std': float(np.sqrt(max(total_sq / n_scenarios - mean ** 2, 0.0))), 'scenarios': n_scenarios}
 
 
-def break_even_point(K, premium, option_type, position):
+def random_portfolio(n_positions, underlyings=('PETR4', 'VALE3', 'ITUB4', 'BOVA11'), seed=None):
     """
-    Calculate break-even point.
-    
-    Parameters:
-    K: Strike price
-    premium: Option premium
-    option_type: 'call' or 'put'
-    position: 'buy' or 'sell'
+    Generate a random training book of option positions.
     
-    Returns:
-    break_even: Break-even point
+    Strikes are spread around 100, expiries on monthly steps up to two years
+    and quantities are lots of 100 long or short.
     """
-    if position == 'buy':
-        if option_type == 'call':
-            return K + premium
-        else:  # put
-            return K - premium
-    else:  # sell
-        if option_type == 'call':
-            return K + premium
-        else:  # put
-            return K - premium
+    rng = np.random.default_rng(seed)
+    return Portfolio(
+        rng.choice(underlyings, n_positions),
+        rng.choice(['call', 'put'], n_positions),
+        np.round(rng.uniform(70, 130, n_positions)),
+        rng.integers(1, 25, n_positions) / 12,
+        rng.choice([-5, -3, -1, 1, 3, 5], n_positions) * 100
+    )
 
 
 def render_introduction_tab():
@@ -288,14 +2545,34 @@ def render_simulator_tab():
         position_eng = "buy" if position == "Compra" else "sell"
         option_type_eng = option_type.lower()
         
-        # Calculate option premium
-        premium = black_scholes(S, K, T, r, sigma, option_type_eng)
+        # Calculate option premium (American options are priced on a binomial tree)
+        european_premium = cached_price(S, K, T, r, sigma, option_type_eng)
+        if option_style == "Americana":
+            premium = cached_price(S, K, T, r, sigma, option_type_eng, engine='binomial',
+                                   steps=500, richardson=True)
+        else:
+            premium = european_premium
         
         st.markdown("### Prêmio da Opção")
         st.markdown(f"#### R$ {premium:.2f}")
         
-        if option_style == "Americana" and option_type == "Put" and K > S:
-            st.warning("Nota: Para opções de venda americanas quando o preço de exercício > preço atual, o exercício antecipado pode ser ótimo. O modelo Black-Scholes pode subestimar o prêmio.")
+        if option_style == "Americana":
+            st.caption(f"Árvore binomial CRR (500 passos). Prêmio de exercício antecipado: R$ {premium - european_premium:.2f}")
+        
+        with st.expander("Volatilidade Implícita"):
+            market_premium = st.number_input(
+                "Prêmio de Mercado (R$)",
+                min_value=0.0,
+                value=round(float(european_premium), 2),
+                step=0.1,
+                help="Prêmio observado de uma opção europeia com os mesmos parâmetros",
+                key="opcoes_market_premium"
+            )
+            implied = implied_volatility(market_premium, S, K, T, r, option_type_eng)
+            if implied['converged']:
+                st.metric("σ Implícita", f"{implied['sigma'] * 100:.2f}%")
+            else:
+                st.warning("Prêmio fora dos limites de não-arbitragem: não há volatilidade implícita.")
     
     with col2:
         st.markdown("### Diagramas de Payoff e Lucro")
@@ -306,15 +2583,21 @@ def render_simulator_tab():
         price_max = K * (1 + range_percent)
         
         # Create price array
-        prices = np.linspace(price_min, price_max, 100)
+        prices = np.linspace(price_min, price_max, CHART_POINTS)
         
-        # Calculate payoffs and profits
-        payoffs = [option_payoff(price, K, option_type_eng, position_eng) for price in prices]
-        profits = [option_profit(price, K, premium, option_type_eng, position_eng) for price in prices]
+        # Calculate payoffs and profits over the whole price grid at once
+        payoffs = option_payoff(prices, K, option_type_eng, position_eng)
+        profits = option_profit(prices, K, premium, option_type_eng, position_eng)
         
         # Calculate break-even point
         be_point = break_even_point(K, premium, option_type_eng, position_eng)
         
+        # One PDE solve values the option today at every price on the chart
+        pde = cached_price(S, K, T, r, sigma, option_type_eng, engine='pde',
+                           american=(option_style == "Americana"), s_max=2 * max(price_max, S))
+        value_today = np.interp(prices, pde['spot_grid'], pde['price_grid'])
+        profits_today = value_today - premium if position_eng == 'buy' else premium - value_today
+        
         # Create DataFrame for displaying data
         df = pd.DataFrame({
             'Preço do Subjacente': prices,
@@ -369,6 +2652,14 @@ def render_simulator_tab():
             line=dict(color='green', width=2)
         ))
         
+        fig2.add_trace(go.Scatter(
+            x=prices,
+            y=profits_today,
+            mode='lines',
+            name='Lucro Hoje (Marcação a Mercado)',
+            line=dict(color='gray', width=2, dash='dot')
+        ))
+        
         fig2.add_trace(go.Scatter(
             x=[K],
             y=[option_profit(K, K, premium, option_type_eng, position_eng)],
@@ -406,6 +2697,26 @@ def render_simulator_tab():
         st.plotly_chart(fig1, use_container_width=True)
         st.plotly_chart(fig2, use_container_width=True)
         
+        if option_style == "Americana" and option_type == "Put":
+            boundary = early_exercise_boundary(S, K, T, r, sigma, option_type_eng, steps=500)
+            
+            fig3 = go.Figure()
+            fig3.add_trace(go.Scatter(
+                x=boundary['time'],
+                y=boundary['critical_price'],
+                mode='lines',
+                name='Fronteira de Exercício',
+                line=dict(color='orange', width=2)
+            ))
+            fig3.update_layout(
+                title="Fronteira de Exercício Antecipado (exercer abaixo da curva)",
+                xaxis_title="Tempo (anos)",
+                yaxis_title="Preço Crítico do Subjacente",
+                height=400,
+                hovermode="x unified"
+            )
+            st.plotly_chart(fig3, use_container_width=True)
+        
     # Display explanation
     st.markdown("### Explicação")
     
@@ -454,36 +2765,21 @@ def render_simulator_tab():
     # Option Greeks Calculation
     st.markdown("### Gregas das Opções")
     
-    # Calculate d1 and d2 for Greeks
-    d1 = (np.log(S / K) + (r + 0.5 * sigma**2) * T) / (sigma * np.sqrt(T))
-    d2 = d1 - sigma * np.sqrt(T)
-    
-    # Calculate Delta
-    if option_type == "Call":
-        delta = norm.cdf(d1)
-    else:  # Put
-        delta = norm.cdf(d1) - 1
-    
-    # Calculate Gamma
-    gamma = norm.pdf(d1) / (S * sigma * np.sqrt(T))
-    
-    # Calculate Theta (time decay)
-    if option_type == "Call":
-        theta = -S * norm.pdf(d1) * sigma / (2 * np.sqrt(T)) - r * K * np.exp(-r * T) * norm.cdf(d2)
-    else:  # Put
-        theta = -S * norm.pdf(d1) * sigma / (2 * np.sqrt(T)) + r * K * np.exp(-r * T) * norm.cdf(-d2)
-    theta = theta / 365  # convert to daily
-    
-    # Calculate Vega
-    vega = S * np.sqrt(T) * norm.pdf(d1) * 0.01  # for 1% change in volatility
-    
-    if position == "Venda":
-        delta = -delta
-        gamma = -gamma
-        theta = -theta
-        vega = -vega
-    
-    col1, col2, col3, col4 = st.columns(4)
+    # All Greeks come from one shared d1/d2 evaluation
+    option_greeks = cached_greeks(S, K, T, r, sigma, option_type_eng)
+    position_sign = -1 if position == "Venda" else 1
+    delta = position_sign * option_greeks['delta']
+    gamma = position_sign * option_greeks['gamma']
+    theta = position_sign * option_greeks['theta'] / 365  # convert to daily
+    if option_style == "Americana":
+        # Early exercise changes the spot Greeks: read them from the PDE grid
+        delta = position_sign * pde['delta']
+        gamma = position_sign * pde['gamma']
+        theta = position_sign * pde['theta'] / 365
+    vega = position_sign * option_greeks['vega'] * 0.01  # for 1% change in volatility
+    rho = position_sign * option_greeks['rho'] * 0.01  # for 1% change in interest rate
+    
+    col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
         st.metric("Delta", f"{delta:.4f}")
@@ -500,6 +2796,234 @@ def render_simulator_tab():
     with col4:
         st.metric("Vega", f"{vega:.4f}")
         st.caption("Variação no preço da opção para 1% de variação na volatilidade")
+    
+    with col5:
+        st.metric("Rho", f"{rho:.4f}")
+        st.caption("Variação no preço da opção para 1% de variação na taxa de juros")
+    
+    with st.expander("Gregas de Segunda Ordem"):
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("Vanna", f"{position_sign * option_greeks['vanna'] * 0.01:.4f}")
+            st.caption("Variação do Delta para 1% de variação na volatilidade")
+        
+        with col2:
+            st.metric("Volga", f"{position_sign * option_greeks['volga'] * 0.0001:.4f}")
+            st.caption("Variação do Vega (por 1%) para 1% de variação na volatilidade")
+        
+        with col3:
+            st.metric("Charm", f"{position_sign * option_greeks['charm'] / 365:.4f}")
+            st.caption("Variação diária do Delta com a passagem do tempo")
+        
+        with col4:
+            st.metric("Speed", f"{position_sign * option_greeks['speed']:.6f}")
+            st.caption("Variação do Gamma para R$1 de variação no subjacente")
+    
+    # Dynamic hedging exercise for the option above
+    st.markdown("### Hedge Dinâmico (Delta Hedging)")
+    
+    with st.expander("Simular Hedge Dinâmico"):
+        rebalance_labels = {"Diário": 1, "Semanal": 5, "Mensal": 21}
+        hedge_col1, hedge_col2 = st.columns(2)
+        
+        with hedge_col1:
+            hedge_paths = st.select_slider("Número de Trajetórias", options=[1_000, 5_000, 10_000],
+                                           value=5_000, key="opcoes_hedge_paths")
+            rebalance_label = st.selectbox("Frequência de Rebalanceamento", list(rebalance_labels),
+                                           key="opcoes_hedge_rebalance")
+        
+        with hedge_col2:
+            realized_vol = st.slider("Volatilidade Realizada (%)", min_value=5.0, max_value=100.0,
+                                     value=float(round(sigma * 100)), step=1.0, key="opcoes_hedge_realized") / 100
+            cost_bps = st.slider("Custo de Transação (bps)", min_value=0, max_value=50, value=0,
+                                 step=5, key="opcoes_hedge_cost")
+        
+        if st.button("Simular Hedge", key="opcoes_hedge_run"):
+            hedge = delta_hedge_simulation(
+                S, K, T, r, sigma, option_type_eng, position=position_eng,
+                n_paths=hedge_paths, n_steps=max(1, int(round(T * 252))),
+                rebalance_every=rebalance_labels[rebalance_label], realized_vol=realized_vol,
+                transaction_cost=cost_bps / 10_000, seed=42
+            )
+            
+            col1, col2, col3 = st.columns(3)
+            col1.metric("P&L Médio do Hedge", f"R$ {hedge['pnl_mean']:.4f}")
+            col2.metric("Desvio Padrão", f"R$ {hedge['pnl_std']:.4f}")
+            col3.metric("Desvio / Prêmio", f"{hedge['pnl_std'] / hedge['premium']:.2%}" if hedge['premium'] > 0 else "-")
+            
+            hedge_fig = go.Figure(go.Histogram(x=hedge['pnl'], nbinsx=80, marker_color='steelblue'))
+            hedge_fig.update_layout(
+                title="Distribuição do P&L do Hedge no Vencimento",
+                xaxis_title="P&L (R$)", yaxis_title="Número de Trajetórias", height=350
+            )
+            st.plotly_chart(hedge_fig, use_container_width=True)
+            
+            component_labels = {'delta': "Delta (defasagem do hedge)", 'gamma': "Gamma", 'theta': "Theta",
+                                'vega': "Vega", 'carry': "Financiamento", 'costs': "Custos", 'residual': "Resíduo"}
+            st.dataframe(pd.DataFrame({
+                'Componente': [component_labels[name] for name in HEDGE_COMPONENTS],
+                'Média (R$)': [hedge['attribution'][name].mean() for name in HEDGE_COMPONENTS],
+                'Desvio Padrão (R$)': [hedge['attribution'][name].std() for name in HEDGE_COMPONENTS]
+            }), use_container_width=True, hide_index=True)
+            st.caption(
+                "Trajetórias simuladas com a volatilidade realizada; a opção é marcada e protegida "
+                "com a volatilidade implícita escolhida acima."
+            )
+    
+    # Path-dependent payoffs priced by Monte Carlo
+    st.markdown("### Opções Dependentes da Trajetória (Monte Carlo)")
+    
+    with st.expander("Simular por Monte Carlo"):
+        payoff_labels = {
+            "Europeia": "european",
+            "Asiática (média aritmética)": "asian",
+            "Asiática (média geométrica)": "geometric_asian",
+            "Barreira": "barrier",
+            "Lookback (strike flutuante)": "lookback",
+            "Digital (paga R$ 1)": "digital"
+        }
+        mc_col1, mc_col2 = st.columns(2)
+        
+        with mc_col1:
+            payoff_label = st.selectbox("Payoff", list(payoff_labels), key="opcoes_mc_payoff")
+            n_paths = st.select_slider(
+                "Número de Trajetórias",
+                options=[10_000, 50_000, 100_000, 500_000, 1_000_000],
+                value=100_000,
+                key="opcoes_mc_paths"
+            )
+        
+        with mc_col2:
+            barrier_type = st.selectbox("Tipo de Barreira", BARRIER_TYPES, key="opcoes_mc_barrier_type")
+            barrier = st.number_input(
+                "Nível da Barreira",
+                min_value=1.0,
+                value=float(round(S * 0.8 if barrier_type.startswith('down') else S * 1.2)),
+                step=1.0,
+                key="opcoes_mc_barrier"
+            )
+        
+        # Closed forms for the same contract (daily monitoring where it matters)
+        mc_payoff = payoff_labels[payoff_label]
+        closed_forms = {
+            'european': lambda: cached_price(S, K, T, r, sigma, option_type_eng),
+            'geometric_asian': lambda: cached_price(S, K, T, r, sigma, option_type_eng, engine='geometric_asian', n_fixings=252),
+            'barrier': lambda: cached_price(S, K, T, r, sigma, option_type_eng, engine='barrier', barrier=barrier,
+                                            barrier_type=barrier_type, n_monitoring=252),
+            'lookback': lambda: cached_price(S, K, T, r, sigma, option_type_eng, engine='lookback'),
+            'digital': lambda: cached_price(S, K, T, r, sigma, option_type_eng, engine='digital'),
+        }
+        if mc_payoff in closed_forms:
+            st.metric("Preço por Fórmula Fechada", f"R$ {float(closed_forms[mc_payoff]()):.4f}")
+            if mc_payoff == 'lookback':
+                st.caption("Fórmula de Goldman-Sosin-Gatto com monitoramento contínuo; a simulação monitora diariamente.")
+        else:
+            st.caption("Sem fórmula fechada para a média aritmética; use a simulação.")
+        
+        if st.button("Simular", key="opcoes_mc_run"):
+            mc = monte_carlo_price(
+                S, K, T, r, sigma, option_type_eng,
+                payoff=mc_payoff,
+                n_paths=n_paths,
+                barrier=barrier,
+                barrier_type=barrier_type,
+                seed=42,
+                workers=MC_MAX_WORKERS if n_paths >= 500_000 else 1
+            )
+            st.metric("Preço Estimado", f"R$ {mc['price']:.4f}")
+            st.caption(
+                f"Erro padrão: {mc['std_error']:.4f} | "
+                f"IC 95%: [R$ {mc['ci_low']:.4f}; R$ {mc['ci_high']:.4f}] | "
+                f"{mc['n_paths']:,} trajetórias com variáveis antitéticas e de controle"
+            )
+    
+    # Market data: implied vol smile of a loaded option chain
+    st.markdown("### Cadeia de Opções (Dados de Mercado)")
+    
+    with st.expander("Carregar Cadeia de Opções"):
+        st.caption(
+            "Arquivo CSV ou Parquet com as colunas ticker, strike, expiry, bid e ask "
+            "(tipo decodificado pela letra de série B3 quando não houver coluna 'type')."
+        )
+        chain_file = st.selectbox(
+            "Arquivo do Servidor", [''] + list_chain_files(),
+            format_func=lambda name: name or "(nenhum)", key="opcoes_chain_file"
+        )
+        uploaded = st.file_uploader("Ou Envie um Arquivo", type=["csv", "parquet"], key="opcoes_chain_upload")
+        
+        chain = None
+        try:
+            if chain_file:
+                chain = load_option_chain(os.path.join(CHAIN_DATA_DIR, chain_file))
+            elif uploaded is not None:
+                chain = OptionChain.from_frame(read_chain_frame(uploaded))
+        except (OSError, ValueError) as error:
+            st.error(f"Não foi possível carregar a cadeia: {error}")
+        
+        if chain is not None and len(chain):
+            as_of = st.date_input("Data de Referência", key="opcoes_chain_as_of")
+            roots = parse_b3_tickers(chain.categories)['root']
+            root_options = sorted(set(roots) - {''}) or ['']
+            root = st.selectbox("Ativo Subjacente", root_options, key="opcoes_chain_root")
+            
+            rows = np.flatnonzero(roots[chain.ticker_codes] == root)
+            T_rows = chain.time_to_expiry(as_of)[rows]
+            live = rows[T_rows > 0]
+            if live.size:
+                expiry_days = st.selectbox(
+                    "Vencimento", np.unique(chain.expiry_days[live]).tolist(),
+                    format_func=lambda days: str(np.datetime64(days, 'D')), key="opcoes_chain_expiry"
+                )
+                expiry = np.datetime64(expiry_days, 'D')
+                selected = live[chain.expiry_days[live] == expiry_days]
+                
+                # The smile is inverted at the underlying's own price, inferred by put-call parity
+                T_selected = chain.time_to_expiry(as_of)[selected]
+                strikes_selected = chain.strike[selected].astype(float)
+                inferred_spot = parity_spot(strikes_selected, chain.is_call[selected],
+                                            chain.mid[selected], T_selected, r)
+                if not np.isfinite(inferred_spot) or inferred_spot <= 0:
+                    inferred_spot = float(np.median(strikes_selected))
+                chain_spot = st.number_input(
+                    f"Preço do Ativo Subjacente ({root})", min_value=0.01, value=round(inferred_spot, 2),
+                    step=0.01, format="%.2f", help="Sugerido pela paridade put-call da cadeia",
+                    key=f"opcoes_chain_spot_{root}_{expiry_days}"
+                )
+                iv = implied_volatility(
+                    chain.mid[selected], chain_spot, strikes_selected,
+                    T_selected, r, chain.is_call[selected]
+                )
+                smile = pd.DataFrame({
+                    'Ticker': chain.tickers[selected],
+                    'Tipo': np.where(chain.is_call[selected], 'Call', 'Put'),
+                    'Strike': chain.strike[selected],
+                    'Meio': chain.mid[selected],
+                    'Vol. Implícita (%)': np.where(iv['converged'], iv['sigma'] * 100, np.nan)
+                }).sort_values('Strike')
+                
+                chain_fig = go.Figure()
+                for label, group in smile.groupby('Tipo'):
+                    chain_fig.add_trace(go.Scatter(
+                        x=group['Strike'], y=group['Vol. Implícita (%)'], mode='markers', name=label
+                    ))
+                chain_fig.update_layout(
+                    title=f"Sorriso de Volatilidade - {root} {expiry}",
+                    xaxis_title="Strike", yaxis_title="Volatilidade Implícita (%)", height=400
+                )
+                st.plotly_chart(chain_fig, use_container_width=True)
+                st.dataframe(smile, use_container_width=True, hide_index=True)
+            else:
+                st.info("Nenhuma opção deste ativo vence após a data de referência.")
+            
+            st.caption(f"{len(chain):,} opções carregadas em formato colunar.")
+    
+    cache_stats = get_pricing_cache().stats()
+    st.caption(
+        f"Cache de precificação compartilhado: {cache_stats['hits']:,} acertos, "
+        f"{cache_stats['misses']:,} falhas ({cache_stats['hit_rate']:.0%} de aproveitamento), "
+        f"{cache_stats['size']:,}/{cache_stats['maxsize']:,} entradas"
+    )
 
 
 def render_strategies_tab():
@@ -584,323 +3108,272 @@ def render_strategies_tab():
         T = st.slider("Tempo até o Vencimento (anos)", min_value=0.1, max_value=2.0, value=1.0, step=0.1, key="opcoes_strat_T")
         r = st.slider("Taxa de Juros Livre de Risco (r, %)", min_value=0.0, max_value=20.0, value=10.0, step=0.5, key="opcoes_strat_r") / 100
     
-    # Initialize variables for strategy calculations
-    prices = np.array([])
-    profits = []
-    df = pd.DataFrame()
-    
-    # Strategy-specific parameters and functions
-    if "Compra de Call" in selected_strategy or "Long Call" in selected_strategy:
-        K_call = st.slider("Preço de Exercício da Call", min_value=50.0, max_value=150.0, value=100.0, step=5.0, key="opcoes_K_call_long")
-        call_premium = black_scholes(S, K_call, T, r, sigma, "call")
-        
-        st.markdown(f"""
-        ### Estratégia de Compra de Call (Long Call)
-        
-        **Descrição:** Compra de uma opção de compra, dando a você o direito de comprar o ativo subjacente pelo preço de exercício.
-        
-        **Parâmetros:**
-        - Preço de Exercício da Call: R$ {K_call:.2f}
-        - Prêmio da Call: R$ {call_premium:.2f}
-        
-        **Risco Máximo:** Limitado ao prêmio pago (R$ {call_premium:.2f})
-        
-        **Ganho Máximo:** Ilimitado (conforme o preço do subjacente sobe)
-        
-        **Ponto de Equilíbrio:** Preço de Exercício + Prêmio = R$ {K_call + call_premium:.2f}
-        """)
-        
-        prices = np.linspace(max(1, K_call * 0.5), K_call * 1.5, 100)
-        payoffs = [max(0, price - K_call) for price in prices]
-        profits = [max(0, price - K_call) - call_premium for price in prices]
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Payoff': payoffs, 'Lucro': profits})
-        
-    elif "Compra de Put" in selected_strategy or "Long Put" in selected_strategy:
-        K_put = st.slider("Preço de Exercício da Put", min_value=50.0, max_value=150.0, value=100.0, step=5.0, key="opcoes_K_put_long")
-        put_premium = black_scholes(S, K_put, T, r, sigma, "put")
-        
-        st.markdown(f"""
-        ### Estratégia de Compra de Put (Long Put)
-        
-        **Descrição:** Compra de uma opção de venda, dando a você o direito de vender o ativo subjacente pelo preço de exercício.
-        
-        **Parâmetros:**
-        - Preço de Exercício da Put: R$ {K_put:.2f}
-        - Prêmio da Put: R$ {put_premium:.2f}
-        
-        **Risco Máximo:** Limitado ao prêmio pago (R$ {put_premium:.2f})
-        
-        **Ganho Máximo:** Limitado mas substancial (Preço de Exercício - Prêmio = R$ {K_put - put_premium:.2f})
-        
-        **Ponto de Equilíbrio:** Preço de Exercício - Prêmio = R$ {K_put - put_premium:.2f}
-        """)
-        
-        prices = np.linspace(max(1, K_put * 0.5), K_put * 1.5, 100)
-        payoffs = [max(0, K_put - price) for price in prices]
-        profits = [max(0, K_put - price) - put_premium for price in prices]
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Payoff': payoffs, 'Lucro': profits})
-        
-    elif "Venda de Call" in selected_strategy or "Short Call" in selected_strategy:
-        K_call = st.slider("Preço de Exercício da Call", min_value=50.0, max_value=150.0, value=100.0, step=5.0, key="opcoes_K_call_short")
-        call_premium = black_scholes(S, K_call, T, r, sigma, "call")
-        
-        st.markdown(f"""
-        ### Estratégia de Venda de Call (Short Call)
-        
-        **Descrição:** Venda de uma opção de compra, obrigando você a vender o ativo subjacente pelo preço de exercício se a opção for exercida.
-        
-        **Parâmetros:**
-        - Preço de Exercício da Call: R$ {K_call:.2f}
-        - Prêmio Recebido da Call: R$ {call_premium:.2f}
-        
-        **Risco Máximo:** Ilimitado (conforme o preço do subjacente sobe)
-        
-        **Ganho Máximo:** Limitado ao prêmio recebido (R$ {call_premium:.2f})
-        
-        **Ponto de Equilíbrio:** Preço de Exercício + Prêmio = R$ {K_call + call_premium:.2f}
-        """)
-        
-        prices = np.linspace(max(1, K_call * 0.5), K_call * 1.5, 100)
-        payoffs = [-max(0, price - K_call) for price in prices]
-        profits = [call_premium - max(0, price - K_call) for price in prices]
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Payoff': payoffs, 'Lucro': profits})
-        
-    elif "Venda Coberta de Call" in selected_strategy or "Covered Call" in selected_strategy:
-        K_call = st.slider("Preço de Exercício da Call", min_value=50.0, max_value=150.0, value=110.0, step=5.0, key="opcoes_K_call_covered")
-        call_premium = black_scholes(S, K_call, T, r, sigma, "call")
-        
-        st.markdown(f"""
-        ### Estratégia de Venda Coberta de Call (Covered Call)
-        
-        **Descrição:** Possuir o ativo subjacente e vender uma opção de compra sobre ele.
-        
-        **Parâmetros:**
-        - Preço Atual da Ação: R$ {S:.2f}
-        - Preço de Exercício da Call: R$ {K_call:.2f}
-        - Prêmio Recebido da Call: R$ {call_premium:.2f}
-        
-        **Risco Máximo:** Substancial (Preço da Ação - Prêmio = R$ {S - call_premium:.2f}) se o preço da ação cair a zero
-        
-        **Ganho Máximo:** Limitado (Prêmio da Call + (Strike - Preço da Ação) = R$ {call_premium + (K_call - S):.2f})
-        
-        **Ponto de Equilíbrio:** Preço da Ação - Prêmio = R$ {S - call_premium:.2f}
-        """)
-        
-        prices = np.linspace(max(1, S * 0.5), S * 1.5, 100)
-        profits = []
-        for price in prices:
-            stock_profit = price - S
-            call_profit = call_premium - max(0, price - K_call)
-            total_profit = stock_profit + call_profit
-            profits.append(total_profit)
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Lucro': profits})
-        
-    elif "Trava de Alta com Calls" in selected_strategy or "Bull Call Spread" in selected_strategy:
-        K_long = st.slider("Preço de Exercício da Call Comprada", min_value=50.0, max_value=150.0, value=95.0, step=5.0, key="opcoes_K_long_bull")
-        K_short = st.slider("Preço de Exercício da Call Vendida", min_value=K_long, max_value=150.0, value=110.0, step=5.0, key="opcoes_K_short_bull")
-        
-        long_premium = black_scholes(S, K_long, T, r, sigma, "call")
-        short_premium = black_scholes(S, K_short, T, r, sigma, "call")
-        net_premium = long_premium - short_premium
-        
-        st.markdown(f"""
-        ### Estratégia de Trava de Alta com Calls (Bull Call Spread)
-        
-        **Descrição:** Comprar uma opção de compra com strike menor e vender uma opção de compra com strike maior.
-        
-        **Parâmetros:**
-        - Preço de Exercício da Call Comprada: R$ {K_long:.2f} (Prêmio: R$ {long_premium:.2f})
-        - Preço de Exercício da Call Vendida: R$ {K_short:.2f} (Prêmio: R$ {short_premium:.2f})
-        - Prêmio Líquido Pago: R$ {net_premium:.2f}
-        
-        **Risco Máximo:** Limitado ao prêmio líquido pago (R$ {net_premium:.2f})
-        
-        **Ganho Máximo:** Limitado à diferença entre os strikes menos o prêmio líquido (R$ {K_short - K_long - net_premium:.2f})
-        
-        **Ponto de Equilíbrio:** Strike Menor + Prêmio Líquido = R$ {K_long + net_premium:.2f}
-        """)
-        
-        prices = np.linspace(max(1, K_long * 0.8), K_short * 1.2, 100)
-        profits = []
-        for price in prices:
-            long_profit = max(0, price - K_long) - long_premium
-            short_profit = short_premium - max(0, price - K_short)
-            total_profit = long_profit + short_profit
-            profits.append(total_profit)
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Lucro': profits})
-        
-    elif "Trava de Baixa com Puts" in selected_strategy or "Bear Put Spread" in selected_strategy:
-        K_long = st.slider("Preço de Exercício da Put Comprada", min_value=50.0, max_value=150.0, value=110.0, step=5.0, key="opcoes_K_long_bear")
-        K_short = st.slider("Preço de Exercício da Put Vendida", min_value=50.0, max_value=K_long, value=95.0, step=5.0, key="opcoes_K_short_bear")
-        
-        long_premium = black_scholes(S, K_long, T, r, sigma, "put")
-        short_premium = black_scholes(S, K_short, T, r, sigma, "put")
-        net_premium = long_premium - short_premium
-        
-        st.markdown(f"""
-        ### Estratégia de Trava de Baixa com Puts (Bear Put Spread)
-        
-        **Descrição:** Comprar uma opção de venda com strike maior e vender uma opção de venda com strike menor.
-        
-        **Parâmetros:**
-        - Preço de Exercício da Put Comprada: R$ {K_long:.2f} (Prêmio: R$ {long_premium:.2f})
-        - Preço de Exercício da Put Vendida: R$ {K_short:.2f} (Prêmio: R$ {short_premium:.2f})
-        - Prêmio Líquido Pago: R$ {net_premium:.2f}
-        
-        **Risco Máximo:** Limitado ao prêmio líquido pago (R$ {net_premium:.2f})
-        
-        **Ganho Máximo:** Limitado à diferença entre os strikes menos o prêmio líquido (R$ {K_long - K_short - net_premium:.2f})
-        
-        **Ponto de Equilíbrio:** Strike Maior - Prêmio Líquido = R$ {K_long - net_premium:.2f}
-        """)
-        
-        prices = np.linspace(max(1, K_short * 0.8), K_long * 1.2, 100)
-        profits = []
-        for price in prices:
-            long_profit = max(0, K_long - price) - long_premium
-            short_profit = short_premium - max(0, K_short - price)
-            total_profit = long_profit + short_profit
-            profits.append(total_profit)
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Lucro': profits})
-        
-    elif "Compra de Straddle" in selected_strategy or "Long Straddle" in selected_strategy:
-        K = st.slider("Preço de Exercício", min_value=50.0, max_value=150.0, value=100.0, step=5.0, key="opcoes_K_straddle")
-        
-        call_premium = black_scholes(S, K, T, r, sigma, "call")
-        put_premium = black_scholes(S, K, T, r, sigma, "put")
-        total_premium = call_premium + put_premium
-        
-        st.markdown(f"""
-        ### Estratégia de Compra de Straddle (Long Straddle)
-        
-        **Descrição:** Comprar tanto uma call quanto uma put no mesmo preço de exercício, lucrando com grandes movimentos de preço em qualquer direção.
-        
-        **Parâmetros:**
-        - Preço de Exercício: R$ {K:.2f}
-        - Prêmio da Call: R$ {call_premium:.2f}
-        - Prêmio da Put: R$ {put_premium:.2f}
-        - Prêmio Total: R$ {total_premium:.2f}
-        
-        **Risco Máximo:** Limitado ao prêmio total pago (R$ {total_premium:.2f})
-        
-        **Ganho Máximo:** Ilimitado (conforme o preço se afasta do strike em qualquer direção)
-        
-        **Pontos de Equilíbrio:** 
-        - Para cima: Strike + Prêmio Total = R$ {K + total_premium:.2f}
-        - Para baixo: Strike - Prêmio Total = R$ {K - total_premium:.2f}
-        """)
-        
-        prices = np.linspace(max(1, K * 0.5), K * 1.5, 100)
-        profits = []
-        for price in prices:
-            call_profit = max(0, price - K) - call_premium
-            put_profit = max(0, K - price) - put_premium
-            total_profit = call_profit + put_profit
-            profits.append(total_profit)
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Lucro': profits})
-        
-    elif "Condor de Ferro" in selected_strategy or "Iron Condor" in selected_strategy:
+    # Strike selection for every leg of the chosen strategy
+    template = STRATEGY_TEMPLATES[selected_strategy]
+    strategy_index = list(STRATEGY_TEMPLATES).index(selected_strategy)
+    strike_columns = st.columns(max(1, len(template["strikes"])))
+    strikes = {}
+    for column, (strike_key, (label, default)) in zip(strike_columns, template["strikes"].items()):
+        with column:
+            strikes[strike_key] = st.slider(
+                label, min_value=50.0, max_value=150.0, value=default, step=5.0,
+                key=f"opcoes_strategy{strategy_index}_{strike_key}"
+            )
+    
+    try:
+        strategy = build_strategy(selected_strategy, strikes, T)
+    except ValueError as error:
+        st.error(f"Strikes inválidos para {selected_strategy}: {error}")
+        render_portfolio_section(S, r, sigma)
+        return
+    leg_types, leg_strikes, leg_expiries, leg_quantities = strategy.leg_arrays()
+    option_strikes = leg_strikes[leg_types != 'stock']
+    
+    # Optional smile: each leg is priced at the surface vol of its strike and expiry
+    use_smile = st.checkbox("Usar Sorriso de Volatilidade (SVI)", value=False, key="opcoes_strat_smile")
+    leg_sigma = sigma
+    if use_smile:
         col1, col2 = st.columns(2)
-        
         with col1:
-            K_put_long = st.slider("Strike da Put Comprada", min_value=50.0, max_value=90.0, value=80.0, step=5.0, key="opcoes_K_put_long_ic")
-            K_put_short = st.slider("Strike da Put Vendida", min_value=K_put_long, max_value=100.0, value=90.0, step=5.0, key="opcoes_K_put_short_ic")
-        
+            skew = st.slider("Inclinação do Sorriso (Skew)", min_value=-0.5, max_value=0.5, value=-0.1, step=0.05, key="opcoes_strat_skew")
         with col2:
-            K_call_short = st.slider("Strike da Call Vendida", min_value=K_put_short, max_value=150.0, value=110.0, step=5.0, key="opcoes_K_call_short_ic")
-            K_call_long = st.slider("Strike da Call Comprada", min_value=K_call_short, max_value=150.0, value=120.0, step=5.0, key="opcoes_K_call_long_ic")
-        
-        put_long_premium = black_scholes(S, K_put_long, T, r, sigma, "put")
-        put_short_premium = black_scholes(S, K_put_short, T, r, sigma, "put")
-        call_short_premium = black_scholes(S, K_call_short, T, r, sigma, "call")
-        call_long_premium = black_scholes(S, K_call_long, T, r, sigma, "call")
-        
-        net_premium = put_short_premium + call_short_premium - put_long_premium - call_long_premium
-        max_profit = net_premium
-        max_risk = (K_put_short - K_put_long) - net_premium
-        
-        st.markdown(f"""
-        ### Estratégia Condor de Ferro (Iron Condor)
-        
-        **Descrição:** Uma estratégia neutra de mercado que lucra quando o preço do subjacente permanece dentro de uma faixa.
-        
-        **Parâmetros:**
-        - Strike da Put Comprada: R$ {K_put_long:.2f} (Prêmio: R$ {put_long_premium:.2f})
-        - Strike da Put Vendida: R$ {K_put_short:.2f} (Prêmio: R$ {put_short_premium:.2f})
-        - Strike da Call Vendida: R$ {K_call_short:.2f} (Prêmio: R$ {call_short_premium:.2f})
-        - Strike da Call Comprada: R$ {K_call_long:.2f} (Prêmio: R$ {call_long_premium:.2f})
-        - Prêmio Líquido Recebido: R$ {net_premium:.2f}
-        
-        **Risco Máximo:** Limitado à largura de qualquer spread menos o prêmio líquido (R$ {max_risk:.2f})
-        
-        **Ganho Máximo:** Limitado ao prêmio líquido recebido (R$ {max_profit:.2f})
-        
-        **Pontos de Equilíbrio:** 
-        - Inferior: Strike da Put Vendida - Prêmio Líquido = R$ {K_put_short - net_premium:.2f}
-        - Superior: Strike da Call Vendida + Prêmio Líquido = R$ {K_call_short + net_premium:.2f}
-        """)
-        
-        prices = np.linspace(max(1, K_put_long * 0.8), K_call_long * 1.2, 100)
-        profits = []
-        for price in prices:
-            put_long_profit = max(0, K_put_long - price) - put_long_premium
-            put_short_profit = put_short_premium - max(0, K_put_short - price)
-            call_short_profit = call_short_premium - max(0, price - K_call_short)
-            call_long_profit = max(0, price - K_call_long) - call_long_premium
-            total_profit = put_long_profit + put_short_profit + call_short_profit + call_long_profit
-            profits.append(total_profit)
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Lucro': profits})
-    
+            convexity = st.slider("Convexidade do Sorriso", min_value=0.0, max_value=0.5, value=0.05, step=0.05, key="opcoes_strat_convexity")
+        
+        quote_strikes = tuple(np.linspace(0.5, 1.5, 11) * S)
+        quote_expiries = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0)
+        quote_vols = parametric_smile(S, r, quote_strikes, quote_expiries, sigma, skew, convexity)
+        surface = get_vol_surface(S, r, quote_strikes, quote_expiries, tuple(quote_vols.ravel()))
+        leg_sigma = np.where(leg_types == 'stock', sigma, surface.vol(leg_strikes, leg_expiries))
+        
+        with st.expander("Sorriso de Volatilidade"):
+            smile_strikes = np.linspace(quote_strikes[0], quote_strikes[-1], 201)
+            smile_fig = go.Figure()
+            for expiry in sorted(set(leg_expiries[leg_types != 'stock'])):
+                smile_fig.add_trace(go.Scatter(
+                    x=smile_strikes, y=surface.vol(smile_strikes, expiry) * 100,
+                    mode='lines', name=f"SVI {expiry:.2f} anos"
+                ))
+            smile_fig.add_trace(go.Scatter(
+                x=option_strikes, y=leg_sigma[leg_types != 'stock'] * 100,
+                mode='markers', name='Pernas da Estratégia', marker=dict(size=10)
+            ))
+            smile_fig.update_layout(
+                xaxis_title="Strike", yaxis_title="Volatilidade Implícita (%)", height=350
+            )
+            st.plotly_chart(smile_fig, use_container_width=True)
+            st.caption(
+                "Superfície ajustada por SVI em cada vencimento e interpolada em variância total. "
+                f"Erro máximo de ajuste: {surface.fit_errors.max() * 100:.3f} pontos de volatilidade."
+            )
+    
+    # One batched pricing pass for every leg over the whole price grid
+    price_low = max(1, min(option_strikes.min(), S) * 0.5)
+    price_high = max(option_strikes.max(), S) * 1.5
+    prices = np.linspace(price_low, price_high, CHART_POINTS)
+    profile = strategy_profile(strategy, prices, S, r, leg_sigma)
+    pricing = profile['pricing']
+    profits = profile['profit']
+    net_premium = pricing['net_premium']
+    
+    leg_lines = []
+    for leg, premium in zip(strategy.legs, pricing['premiums']):
+        action = "Compra" if leg.side == 'buy' else "Venda"
+        if leg.option_type == 'stock':
+            leg_lines.append(f"- {action} de {leg.quantity:g} ação(ões) a R$ {premium:.2f}")
+        else:
+            leg_lines.append(
+                f"- {action} de {leg.quantity:g} {leg.option_type.capitalize()} com strike R$ {leg.strike:.2f} "
+                f"e vencimento em {leg.expiry:.2f} anos (Prêmio: R$ {premium:.2f})"
+            )
+    
+    max_profit = "Ilimitado" if np.isinf(profile['max_profit']) else f"R$ {profile['max_profit']:.2f}"
+    max_risk = "Ilimitado" if np.isinf(profile['max_loss']) else f"R$ {profile['max_loss']:.2f}"
+    if len(profile['break_evens']):
+        break_even_text = ", ".join(f"R$ {be:.2f}" for be in profile['break_evens'])
     else:
-        # Default case for strategies not yet implemented
-        st.info("Esta estratégia será implementada em breve. Por favor, selecione outra estratégia.")
-        prices = np.linspace(50, 150, 100)
-        profits = [0] * 100
-        df = pd.DataFrame({'Preço do Subjacente': prices, 'Lucro': profits})
-    
-    # Display chart for all strategies
-    if len(profits) > 0:
-        fig = go.Figure()
-        
-        fig.add_trace(go.Scatter(
-            x=df['Preço do Subjacente'] if 'Preço do Subjacente' in df.columns else df.iloc[:, 0],
-            y=df['Lucro'],
-            mode='lines',
-            name='Lucro',
-            line=dict(color='green', width=2)
-        ))
-        
-        # Add zero line
-        fig.add_shape(
-            type="line",
-            x0=min(prices),
-            y0=0,
-            x1=max(prices),
-            y1=0,
-            line=dict(color="black", width=1, dash="dash")
+        break_even_text = "Nenhum"
+    premium_label = "Prêmio Líquido Pago" if net_premium >= 0 else "Prêmio Líquido Recebido"
+    leg_text = "\n".join(leg_lines)
+    
+    st.markdown(f"""
+### Estratégia {selected_strategy}
+
+**Descrição:** {template["description"]}
+
+**Parâmetros:**
+{leg_text}
+- {premium_label}: R$ {abs(net_premium):.2f}
+
+**Risco Máximo:** {max_risk}
+
+**Ganho Máximo:** {max_profit}
+
+**Pontos de Equilíbrio:** {break_even_text}
+""")
+    
+    if profile['horizon'] < leg_expiries.max():
+        st.caption(
+            f"Resultado avaliado no primeiro vencimento ({profile['horizon']:.2f} anos); "
+            "as pernas mais longas são marcadas pelo modelo de Black-Scholes."
         )
-        
-        # Add current price marker
-        fig.add_trace(go.Scatter(
-            x=[S],
-            y=[0],
-            mode='markers',
-            name='Preço Atual',
-            marker=dict(color='blue', size=10)
+    
+    # Position Greeks aggregated over all legs
+    position_greeks = pricing['greeks']
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Delta", f"{position_greeks['delta']:.4f}")
+    col2.metric("Gamma", f"{position_greeks['gamma']:.4f}")
+    col3.metric("Theta (diário)", f"{position_greeks['theta'] / 365:.4f}")
+    col4.metric("Vega (1%)", f"{position_greeks['vega'] * 0.01:.4f}")
+    col5.metric("Rho (1%)", f"{position_greeks['rho'] * 0.01:.4f}")
+    
+    # Display chart for the strategy
+    fig = go.Figure()
+    
+    fig.add_trace(go.Scatter(
+        x=prices,
+        y=profits,
+        mode='lines',
+        name='Lucro no Vencimento',
+        line=dict(color='green', width=2)
+    ))
+    
+    fig.add_trace(go.Scatter(
+        x=prices,
+        y=profile['profit_today'],
+        mode='lines',
+        name='Lucro Hoje (Marcação a Mercado)',
+        line=dict(color='gray', width=2, dash='dot')
+    ))
+    
+    # Add zero line
+    fig.add_shape(
+        type="line",
+        x0=prices.min(),
+        y0=0,
+        x1=prices.max(),
+        y1=0,
+        line=dict(color="black", width=1, dash="dash")
+    )
+    
+    # Add current price marker
+    fig.add_trace(go.Scatter(
+        x=[S],
+        y=[0],
+        mode='markers',
+        name='Preço Atual',
+        marker=dict(color='blue', size=10)
+    ))
+    
+    fig.update_layout(
+        title=f"{selected_strategy} - Diagrama de Lucro/Prejuízo",
+        xaxis_title="Preço do Subjacente no Vencimento",
+        yaxis_title="Lucro/Prejuízo",
+        height=500,
+        hovermode="x unified"
+    )
+    
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # What-if scenarios: full revaluation over spot, vol and time
+    with st.expander("Análise de Cenários (Preço × Volatilidade × Tempo)"):
+        horizon_days = int(round(profile['horizon'] * 365))
+        elapsed_days = np.unique(np.linspace(0, horizon_days, 31).round().astype(int))
+        scenarios = cached_scenario_grid(
+            strategy, S, r, tuple(np.atleast_1d(leg_sigma)),
+            tuple(np.linspace(-0.3, 0.3, 61)), tuple(np.arange(-10, 11) / 100),
+            tuple(elapsed_days / 365)
+        )
+        day = st.select_slider(
+            "Dias Decorridos", options=elapsed_days.tolist(), value=int(elapsed_days[0]), key="opcoes_scenario_day"
+        )
+        day_index = int(np.searchsorted(elapsed_days, day))
+        
+        heatmap = go.Figure(go.Heatmap(
+            x=scenarios['spots'],
+            y=scenarios['vol_shocks'] * 100,
+            z=scenarios['pnl'][day_index],
+            colorscale='RdYlGn',
+            zmid=0,
+            colorbar=dict(title="Lucro/Prejuízo")
         ))
-        
-        fig.update_layout(
-            title=f"{selected_strategy} - Diagrama de Lucro/Prejuízo",
-            xaxis_title="Preço do Subjacente no Vencimento",
-            yaxis_title="Lucro/Prejuízo",
-            height=500,
-            hovermode="x unified"
+        heatmap.update_layout(
+            title=f"Lucro/Prejuízo após {day} dias (restam {horizon_days - day} até o primeiro vencimento)",
+            xaxis_title="Preço do Subjacente",
+            yaxis_title="Choque de Volatilidade (pontos)",
+            height=450
+        )
+        st.plotly_chart(heatmap, use_container_width=True)
+        st.caption(
+            "Cada cenário reavalia todas as pernas por Black-Scholes; "
+            "o resultado é medido contra o custo atual da estratégia."
         )
-        
-        st.plotly_chart(fig, use_container_width=True)
     
     # Strategy advantages and disadvantages
     render_strategy_analysis(selected_strategy)
+    
+    # Desk exercise: aggregate risk of a large random book
+    render_portfolio_section(S, r, sigma)
+
+def render_portfolio_section(S, r, sigma):
+    """Render the random desk book with its aggregate Greeks and VaR/ES."""
+    st.markdown("### Carteira de Opções (Risco Agregado)")
+    
+    with st.expander("Simular Carteira de Mesa de Operações"):
+        n_positions = st.select_slider(
+            "Número de Posições", options=[100, 1_000, 10_000, 50_000], value=1_000, key="opcoes_book_size"
+        )
+        book_seed = st.number_input("Semente Aleatória", min_value=0, value=7, step=1, key="opcoes_book_seed")
+        book = random_portfolio(n_positions, seed=int(book_seed))
+        book_risk = book.risk({underlying: S for underlying in book.underlyings}, r, sigma)
+        totals = book_risk['totals']
+        
+        col1, col2, col3, col4, col5, col6 = st.columns(6)
+        col1.metric("Valor de Mercado", f"R$ {totals['value']:,.0f}")
+        col2.metric("Delta", f"{totals['delta']:,.1f}")
+        col3.metric("Gamma", f"{totals['gamma']:,.2f}")
+        col4.metric("Theta (diário)", f"{totals['theta'] / 365:,.1f}")
+        col5.metric("Vega (1%)", f"{totals['vega'] * 0.01:,.1f}")
+        col6.metric("Rho (1%)", f"{totals['rho'] * 0.01:,.1f}")
+        
+        group_by = st.multiselect(
+            "Agrupar por", ['underlying', 'expiry', 'option_type'], default=['underlying'],
+            format_func={'underlying': 'Ativo', 'expiry': 'Vencimento', 'option_type': 'Tipo'}.get,
+            key="opcoes_book_group"
+        )
+        if group_by:
+            st.dataframe(book.group(book_risk, by=tuple(group_by)), use_container_width=True, hide_index=True)
+        st.caption(
+            f"{len(book):,} posições avaliadas em uma única passagem vetorizada; todos os ativos "
+            "usam o preço, a volatilidade e a taxa escolhidos acima."
+        )
+        
+        st.markdown("#### Value-at-Risk e Expected Shortfall")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            confidence = st.selectbox("Nível de Confiança", [0.95, 0.99], index=1,
+                                      format_func=lambda c: f"{c:.0%}", key="opcoes_var_confidence")
+        with col2:
+            horizon_days = st.selectbox("Horizonte (dias úteis)", [1, 5, 10], index=0, key="opcoes_var_horizon")
+        with col3:
+            correlation = st.slider("Correlação entre Ativos", min_value=0.0, max_value=0.9, value=0.5,
+                                    step=0.1, key="opcoes_var_correlation")
+        with col4:
+            n_scenarios = st.select_slider("Cenários Monte Carlo", options=[100_000, 1_000_000],
+                                           value=100_000, key="opcoes_var_scenarios")
+        
+        if st.button("Calcular VaR", key="opcoes_var_run"):
+            spots = {underlying: S for underlying in book.underlyings}
+            labels = {'delta_normal': "Delta-Normal", 'delta_gamma': "Delta-Gamma (Cornish-Fisher)",
+                      'monte_carlo': "Monte Carlo (Reavaliação Completa)"}
+            rows = []
+            for method, label in labels.items():
+                result = value_at_risk(book, spots, r, sigma, method=method, confidence=confidence,
+                                       horizon=horizon_days / 252, correlation=correlation,
+                                       n_scenarios=n_scenarios, seed=42)
+                rows.append({'Método': label, 'VaR (R$)': result['var'], 'ES (R$)': result['es'],
+                             'Média (R$)': result['mean'], 'Desvio Padrão (R$)': result['std']})
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+            st.caption("Perdas positivas; a reavaliação completa captura a convexidade que o método delta-normal ignora.")
 
 
 def render_strategy_analysis(selected_strategy):
@@ -955,6 +3428,36 @@ def render_strategy_analysis(selected_strategy):
             "Prêmio recebido antecipadamente",
             "Risco e recompensa definidos",
             "Beneficia-se do decaimento temporal"
+        ],
+        "Venda de Straddle (Short Straddle)": [
+            "Recebe dois prêmios antecipadamente",
+            "Lucro máximo quando o preço termina exatamente no strike",
+            "Beneficia-se do decaimento temporal",
+            "Beneficia-se da queda da volatilidade implícita"
+        ],
+        "Venda de Strangle (Short Strangle)": [
+            "Faixa de lucro mais larga que a do short straddle",
+            "Prêmio recebido antecipadamente",
+            "Beneficia-se do decaimento temporal",
+            "Maior probabilidade de lucro que o short straddle"
+        ],
+        "Borboleta (Butterfly Spread)": [
+            "Custo inicial baixo",
+            "Risco limitado ao prêmio líquido pago",
+            "Retorno elevado em relação ao custo se o preço terminar no strike central",
+            "Beneficia-se do decaimento temporal perto do strike central"
+        ],
+        "Borboleta de Ferro (Iron Butterfly)": [
+            "Prêmio líquido recebido antecipadamente",
+            "Risco e recompensa definidos",
+            "Lucro máximo maior que o do condor de ferro",
+            "Beneficia-se do decaimento temporal e da queda da volatilidade"
+        ],
+        "Spread de Calendário (Calendar Spread)": [
+            "A opção curta perde valor mais rápido que a longa",
+            "Risco limitado ao prêmio líquido pago",
+            "Beneficia-se de aumento da volatilidade implícita no vencimento longo",
+            "Pode ser rolado vendendo novas opções curtas"
         ]
     }
     
@@ -1006,6 +3509,36 @@ def render_strategy_analysis(selected_strategy):
             "Risco de perda significativa se o preço ultrapassar qualquer strike vendido",
             "Múltiplas pernas aumentam custos de transação",
             "Complexo de gerenciar"
+        ],
+        "Venda de Straddle (Short Straddle)": [
+            "Risco ilimitado de alta e substancial de queda",
+            "Requer margem (garantia)",
+            "Faixa de lucro estreita",
+            "Aumento de volatilidade prejudica a posição"
+        ],
+        "Venda de Strangle (Short Strangle)": [
+            "Risco ilimitado se o preço subir acentuadamente",
+            "Prêmio recebido menor que o do short straddle",
+            "Requer margem (garantia)",
+            "Grandes movimentos de preço geram perdas rápidas"
+        ],
+        "Borboleta (Butterfly Spread)": [
+            "Potencial de lucro limitado",
+            "Lucro máximo só ocorre em uma faixa estreita de preço",
+            "Múltiplas pernas aumentam custos de transação",
+            "Pouco lucrativa se o preço se afastar do strike central"
+        ],
+        "Borboleta de Ferro (Iron Butterfly)": [
+            "Faixa de lucro estreita em torno do strike central",
+            "Múltiplas pernas aumentam custos de transação",
+            "Perdas se o preço se mover significativamente em qualquer direção",
+            "Complexo de gerenciar"
+        ],
+        "Spread de Calendário (Calendar Spread)": [
+            "Perde se o preço se afastar muito do strike",
+            "Sensível a mudanças na estrutura a termo da volatilidade",
+            "Resultado no primeiro vencimento depende do valor da opção longa",
+            "Gestão mais complexa que spreads de mesmo vencimento"
         ]
     }
     
@@ -1024,14 +3557,14 @@ def render_strategy_analysis(selected_strategy):
         "Venda Coberta de Put (Covered Put)": "Venda de Call (Short Call)",
         "Venda de Call (Short Call)": "Venda de Call (Short Call)",
         "Condor de Ferro (Iron Condor)": "Condor de Ferro (Iron Condor)",
-        "Venda de Straddle (Short Straddle)": "Condor de Ferro (Iron Condor)",
-        "Venda de Strangle (Short Strangle)": "Condor de Ferro (Iron Condor)",
-        "Borboleta (Butterfly Spread)": "Condor de Ferro (Iron Condor)",
+        "Venda de Straddle (Short Straddle)": "Venda de Straddle (Short Straddle)",
+        "Venda de Strangle (Short Strangle)": "Venda de Strangle (Short Strangle)",
+        "Borboleta (Butterfly Spread)": "Borboleta (Butterfly Spread)",
         "Compra de Straddle (Long Straddle)": "Compra de Straddle (Long Straddle)",
         "Compra de Strangle (Long Strangle)": "Compra de Straddle (Long Straddle)",
         "Long Guts": "Compra de Straddle (Long Straddle)",
-        "Borboleta de Ferro (Iron Butterfly)": "Condor de Ferro (Iron Condor)",
-        "Spread de Calendário (Calendar Spread)": "Condor de Ferro (Iron Condor)"
+        "Borboleta de Ferro (Iron Butterfly)": "Borboleta de Ferro (Iron Butterfly)",
+        "Spread de Calendário (Calendar Spread)": "Spread de Calendário (Calendar Spread)"
     }
     
     strategy_key = strategy_key_map.get(selected_strategy, selected_strategy)
@@ -1107,6 +3640,36 @@ def render_strategy_analysis(selected_strategy):
         - Quando você quer lucrar com o decaimento temporal
         - Em ambientes de baixa volatilidade onde os preços tendem a andar de lado
         - Quando você quer risco e recompensa definidos
+        """,
+        "Venda de Straddle (Short Straddle)": """
+        - Quando você espera que o preço fique muito próximo do strike até o vencimento
+        - Quando a volatilidade implícita está alta e você espera que ela caia
+        - Após eventos importantes, quando a incerteza do mercado diminui
+        - Quando você tem capacidade de suportar margem e perdas potencialmente grandes
+        """,
+        "Venda de Strangle (Short Strangle)": """
+        - Quando você espera que o preço permaneça entre os dois strikes
+        - Quando a volatilidade implícita está alta
+        - Quando você quer uma faixa de lucro mais larga que a do short straddle
+        - Quando você tem capacidade de suportar margem e perdas potencialmente grandes
+        """,
+        "Borboleta (Butterfly Spread)": """
+        - Quando você espera que o preço termine próximo de um valor específico
+        - Quando você quer uma aposta de baixo custo em pouca movimentação
+        - Quando você quer risco limitado ao prêmio pago
+        - Quando a volatilidade implícita está alta no strike central
+        """,
+        "Borboleta de Ferro (Iron Butterfly)": """
+        - Quando você espera pouca movimentação em torno do preço atual
+        - Quando a volatilidade implícita está alta e deve cair
+        - Quando você quer receber prêmio com risco definido
+        - Quando você quer lucrar com o decaimento temporal
+        """,
+        "Spread de Calendário (Calendar Spread)": """
+        - Quando você espera que o preço fique próximo do strike no curto prazo
+        - Quando a volatilidade implícita do vencimento curto está alta em relação ao longo
+        - Quando você quer lucrar com o decaimento temporal mais rápido da opção curta
+        - Quando você espera aumento de volatilidade no vencimento mais longo
         """
     }
     
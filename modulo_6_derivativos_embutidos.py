@@ -5,6 +5,9 @@ Visualização e explicação de derivativos embutidos em produtos estruturados.
 
 import streamlit as st
 import streamlit.components.v1 as components
+import numpy as np
+
+from modulo_5_opcoes import black_scholes_vectorized, greeks
 
 
 # Dictionary with alternatives, descriptions, and file paths
@@ -168,6 +171,613 @@ DERIVATIVES_INFO = {
 }
 
 
+# One basis point, the bump used for rate and spread sensitivities
+BASIS_POINT = 1e-4
+
+
+def _coupon_schedule(face, coupon_rate, T, frequency):
+    """Payment times and cash flows of a bullet bond (the last coupon carries the face)."""
+    n_payments = max(1, int(np.ceil(T * frequency - 1e-9)))
+    times = T - np.arange(n_payments)[::-1] / frequency
+    cash_flows = np.full(n_payments, face * coupon_rate / frequency)
+    cash_flows[-1] += face
+    return times, cash_flows
+
+
+def _present_value(times, cash_flows, rate):
+    """Present value of cash flows at continuously compounded rates (broadcast over rate)."""
+    rate = np.asarray(rate, dtype=float)[..., None]
+    return (cash_flows * np.exp(-rate * times)).sum(axis=-1)
+
+
+def price_coe(notional, T, r, S, sigma, participation, protection=1.0, cap=None):
+    """
+    Price a capital-protected COE as a zero-coupon bond plus a call spread.
+    
+    At maturity the note pays notional x (protection + participation x
+    max(min(S_T / S - 1, cap), 0)): the bond guarantees the protected amount
+    and participation / S calls struck at S (less the same calls struck at
+    S (1 + cap) when capped) deliver the upside.
+    
+    Parameters:
+    notional: Amount invested
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual, continuous)
+    S: Current level of the reference asset
+    sigma: Volatility of the reference asset
+    participation: Share of the asset's rise paid to the investor
+    protection: Fraction of the notional guaranteed at maturity
+    cap: Maximum rise paid (e.g. 0.3 for 30%); None for no cap
+    
+    Returns:
+    result: Dictionary with the 'fair_value', 'bond_value', 'option_value',
+    the 'par_participation' that makes the fair value equal the notional,
+    the 'issuer_margin' (notional minus fair value) and the sensitivities
+    'delta' (per 1% move of the asset), 'vega' (per vol point) and 'rho'
+    (per basis point)
+    """
+    bond_value = notional * protection * np.exp(-r * T)
+    
+    strikes = np.array([S, S * (1 + cap)]) if cap is not None else np.array([S])
+    weights = np.array([1.0, -1.0])[:strikes.size]
+    legs = greeks(S, strikes, T, r, sigma, 'call', which=('price', 'delta', 'vega', 'rho'))
+    units = notional / S
+    unit_option = units * float(weights @ np.atleast_1d(legs['price']))
+    
+    option_value = participation * unit_option
+    leg_sum = {name: participation * units * float(weights @ np.atleast_1d(legs[name])) for name in ('delta', 'vega', 'rho')}
+    
+    return {
+        'fair_value': float(bond_value + option_value),
+        'bond_value': float(bond_value),
+        'option_value': float(option_value),
+        'par_participation': float((notional - bond_value) / unit_option) if unit_option > 0 else np.inf,
+        'issuer_margin': float(notional - bond_value - option_value),
+        'delta': leg_sum['delta'] * S * 0.01,
+        'vega': leg_sum['vega'] * 0.01,
+        'rho': float(leg_sum['rho'] - T * bond_value) * BASIS_POINT
+    }
+
+
+def _callable_components(face, coupon_rate, T, r, yield_vol, call_price, call_time, frequency):
+    """Straight bond and embedded call values, vectorized over r."""
+    times, cash_flows = _coupon_schedule(face, coupon_rate, T, frequency)
+    r = np.asarray(r, dtype=float)
+    straight = _present_value(times, cash_flows, r)
+    
+    # Forward price at the call date of the cash flows that remain after it
+    after = times > call_time
+    forward_times = times[after] - call_time
+    forward = _present_value(forward_times, cash_flows[after], r)
+    duration = _present_value(forward_times, cash_flows[after] * forward_times, r) / forward
+    
+    # Black's model on the bond: price vol = duration x yield x yield vol
+    price_vol = np.maximum(duration * r * yield_vol, 1e-8)
+    option = np.exp(-r * call_time) * black_scholes_vectorized(forward, call_price, call_time, 0.0, price_vol, True)
+    return straight, option
+
+
+def price_callable_bond(face, coupon_rate, T, r, yield_vol, call_price, call_time, frequency=1):
+    """
+    Price a callable bond as a straight bond minus the issuer's call option.
+    
+    The call is European at call_time and valued with Black's model on the
+    forward price of the remaining cash flows (Hull's bond option approach).
+    
+    Parameters:
+    face: Face value
+    coupon_rate: Annual coupon rate
+    T: Time to maturity (in years)
+    r: Flat market interest rate (annual, continuous)
+    yield_vol: Volatility of the forward yield
+    call_price: Price the issuer pays to redeem the bond
+    call_time: Date the issuer can call the bond (in years)
+    frequency: Coupons per year
+    
+    Returns:
+    result: Dictionary with the 'fair_value' of the callable, the
+    'straight_value', the 'option_value' held by the issuer, the 'dv01' of
+    the callable and of the straight bond ('straight_dv01') per basis point
+    and the callable's 'vega' per vol point of yield vol
+    """
+    rates = r + np.array([0.0, -BASIS_POINT, BASIS_POINT])
+    straight, option = _callable_components(face, coupon_rate, T, rates, yield_vol, call_price, call_time, frequency)
+    callable_value = straight - option
+    _, option_up = _callable_components(face, coupon_rate, T, r, yield_vol + 0.01, call_price, call_time, frequency)
+    
+    return {
+        'fair_value': float(callable_value[0]),
+        'straight_value': float(straight[0]),
+        'option_value': float(option[0]),
+        'dv01': float(callable_value[1] - callable_value[2]) / 2,
+        'straight_dv01': float(straight[1] - straight[2]) / 2,
+        'vega': float(option[0] - option_up)
+    }
+
+
+def price_convertible(face, coupon_rate, T, r, credit_spread, S, sigma, conversion_price, frequency=1):
+    """
+    Price a convertible debenture as a risky bond plus calls on the stock.
+    
+    Converting at maturity pays max(ratio x S_T, face) = face + ratio x
+    max(S_T - conversion_price, 0) with ratio = face / conversion_price, so
+    the debenture is the bond discounted at r + credit_spread plus ratio
+    European calls struck at the conversion price.
+    
+    Parameters:
+    face: Face value
+    coupon_rate: Annual coupon rate
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual, continuous)
+    credit_spread: Issuer credit spread over r
+    S: Current stock price
+    sigma: Stock volatility
+    conversion_price: Stock price implied by the conversion ratio
+    frequency: Coupons per year
+    
+    Returns:
+    result: Dictionary with the 'fair_value', 'bond_value', 'option_value',
+    'conversion_ratio', 'parity' (value if converted now), 'conversion_premium'
+    over parity, and the sensitivities 'delta' (shares), 'gamma', 'vega'
+    (per vol point) and 'rho' (per basis point)
+    """
+    times, cash_flows = _coupon_schedule(face, coupon_rate, T, frequency)
+    bond_value = float(_present_value(times, cash_flows, r + credit_spread))
+    bond_rho = -float(_present_value(times, cash_flows * times, r + credit_spread))
+    
+    ratio = face / conversion_price
+    call = greeks(S, conversion_price, T, r, sigma, 'call', which=('price', 'delta', 'gamma', 'vega', 'rho'))
+    option_value = ratio * float(call['price'])
+    parity = ratio * S
+    
+    return {
+        'fair_value': bond_value + option_value,
+        'bond_value': bond_value,
+        'option_value': option_value,
+        'conversion_ratio': ratio,
+        'parity': parity,
+        'conversion_premium': (bond_value + option_value) / parity - 1,
+        'delta': ratio * float(call['delta']),
+        'gamma': ratio * float(call['gamma']),
+        'vega': ratio * float(call['vega']) * 0.01,
+        'rho': (bond_rho + ratio * float(call['rho'])) * BASIS_POINT
+    }
+
+
+def _cln_value(face, coupon_rate, T, r, hazard, recovery, frequency):
+    """Credit-linked note value with a constant hazard rate (vectorized over r and hazard)."""
+    times, cash_flows = _coupon_schedule(face, coupon_rate, T, frequency)
+    r, hazard = np.broadcast_arrays(np.asarray(r, dtype=float), np.asarray(hazard, dtype=float))
+    survival_discounted = _present_value(times, cash_flows, r + hazard)
+    
+    # Recovery paid at default: integral of R face h exp(-(r + h) t) over [0, T]
+    total = r + hazard
+    recovery_leg = recovery * face * np.where(total > 0, hazard / np.where(total > 0, total, 1.0) * (1 - np.exp(-total * T)), 0.0)
+    return survival_discounted + recovery_leg
+
+
+def price_credit_linked_note(face, coupon_rate, T, r, credit_spread, recovery=0.4, frequency=2):
+    """
+    Price a credit-linked note as a risk-free bond minus the protection sold.
+    
+    Default arrives with a constant hazard rate h = credit_spread / (1 - recovery)
+    (the credit triangle); coupons stop at default and the investor
+    recovers recovery x face.
+    
+    Parameters:
+    face: Face value
+    coupon_rate: Annual coupon rate
+    T: Time to maturity (in years)
+    r: Risk-free interest rate (annual, continuous)
+    credit_spread: CDS spread of the reference entity
+    recovery: Recovery rate on default
+    frequency: Coupons per year
+    
+    Returns:
+    result: Dictionary with the 'fair_value', the 'riskfree_value' of the
+    same cash flows, the 'protection_value' sold by the investor, the
+    'par_coupon' that prices the note at face, the 'default_probability'
+    over the life, and the 'dv01' and 'cs01' per basis point of rate and spread
+    """
+    hazard = credit_spread / (1 - recovery)
+    # Base, rate bumped and spread bumped in one vectorized valuation
+    values = _cln_value(face, coupon_rate, T, r + np.array([0.0, BASIS_POINT, 0.0]),
+                        hazard + np.array([0.0, 0.0, BASIS_POINT / (1 - recovery)]), recovery, frequency)
+    riskfree = float(_cln_value(face, coupon_rate, T, r, 0.0, recovery, frequency))
+    
+    # The value is linear in the coupon: V(c) = V(0) + c (V(1) - V(0))
+    no_coupon = float(_cln_value(face, 0.0, T, r, hazard, recovery, frequency))
+    unit_coupon = float(_cln_value(face, 1.0, T, r, hazard, recovery, frequency))
+    
+    return {
+        'fair_value': float(values[0]),
+        'riskfree_value': riskfree,
+        'protection_value': riskfree - float(values[0]),
+        'par_coupon': (face - no_coupon) / (unit_coupon - no_coupon),
+        'default_probability': float(1 - np.exp(-hazard * T)),
+        'dv01': float(values[0] - values[1]),
+        'cs01': float(values[0] - values[2])
+    }
+
+
+class HullWhiteTree:
+    """
+    Hull-White trinomial tree for the short rate, fitted to a zero curve.
+    
+    dr = (theta(t) - a r) dt + sigma dW is discretized on a grid of
+    2 j_max + 1 rate nodes per step (Hull and White, 1994). Branching
+    probabilities depend only on the node and are stored once; the drift
+    alpha of each step is fitted by forward induction of Arrow-Debreu prices
+    so the tree reprices every zero-coupon bond of the curve. Contracts are
+    then valued by backward induction over whole node slices.
+    
+    Parameters:
+    zero_rate: Continuously compounded zero rate (scalar for a flat curve or
+    a function of maturity in years)
+    a: Mean reversion speed
+    sigma: Absolute volatility of the short rate
+    T: Horizon of the tree (in years)
+    n_steps: Number of time steps
+    """
+    
+    def __init__(self, zero_rate, a, sigma, T, n_steps):
+        self.a, self.sigma, self.T, self.n_steps = float(a), float(sigma), float(T), int(n_steps)
+        self.dt = dt = self.T / self.n_steps
+        self.dx = sigma * np.sqrt(3 * dt)
+        curve = zero_rate if callable(zero_rate) else (lambda t: zero_rate + 0.0 * np.asarray(t, dtype=float))
+        self.zero_rate = curve
+        
+        j_max = max(1, int(np.ceil(0.1835 / (a * dt))))
+        self.j = j = np.arange(-j_max, j_max + 1)
+        M = -a * dt
+        jM, j2M2 = j * M, (j * M) ** 2
+        
+        # Normal branching in the middle, turned inwards at the edges
+        p_up = 1 / 6 + (j2M2 + jM) / 2
+        p_mid = 2 / 3 - j2M2
+        p_down = 1 / 6 + (j2M2 - jM) / 2
+        top, bottom = j == j_max, j == -j_max
+        p_up = np.where(top, 7 / 6 + (j2M2 + 3 * jM) / 2, np.where(bottom, 1 / 6 + (j2M2 - jM) / 2, p_up))
+        p_mid = np.where(top, -1 / 3 - j2M2 - 2 * jM, np.where(bottom, -1 / 3 - j2M2 + 2 * jM, p_mid))
+        p_down = np.where(top, 1 / 6 + (j2M2 + jM) / 2, np.where(bottom, 7 / 6 + (j2M2 - 3 * jM) / 2, p_down))
+        self.probabilities = np.stack([p_up, p_mid, p_down])
+        
+        # Index of the middle successor of each node (shifted inwards at the edges)
+        middle = np.arange(j.size) - top + bottom
+        self.successors = np.stack([middle + 1, middle, middle - 1])
+        
+        # Forward induction: fit alpha_i to the discount factor at (i + 1) dt
+        times = np.arange(1, self.n_steps + 1) * dt
+        discount = np.exp(-curve(times) * times)
+        self.alpha = np.empty(self.n_steps)
+        arrow_debreu = np.zeros(j.size)
+        arrow_debreu[j_max] = 1.0
+        for i in range(self.n_steps):
+            self.alpha[i] = (np.log(arrow_debreu @ np.exp(-j * self.dx * dt)) - np.log(discount[i])) / dt
+            flows = arrow_debreu * np.exp(-(self.alpha[i] + j * self.dx) * dt)
+            arrow_debreu = np.bincount(self.successors.ravel(), weights=(self.probabilities * flows).ravel(),
+                                       minlength=j.size)
+        
+        # Short rate at every (step, node)
+        self.rates = self.alpha[:, None] + j[None, :] * self.dx
+    
+    def step_of(self, t):
+        """Nearest tree step of time t."""
+        return np.rint(np.asarray(t, dtype=float) / self.dt).astype(int)
+    
+    def expectation(self, values):
+        """Expected next-step values seen from each node (last axis indexes the rate nodes)."""
+        return sum(p * values[..., k] for p, k in zip(self.probabilities, self.successors))
+
+
+@st.cache_resource(max_entries=32)
+def get_hull_white_tree(zero_rate, a, sigma, T, n_steps=200):
+    """Return the calibrated Hull-White tree for a flat curve, shared across reruns."""
+    return HullWhiteTree(zero_rate, a, sigma, T, n_steps)
+
+
+def price_bond_on_tree(tree, face, coupon_rate, T, frequency=1, call_price=None, call_start=0.0,
+                       put_price=None, put_start=0.0):
+    """
+    Price callable and/or putable fixed-coupon bonds on a Hull-White tree.
+    
+    Call and put decisions are taken at the coupon dates from call_start and
+    put_start on, on clean (ex-coupon) values: the issuer calls when the bond
+    is worth more than call_price and the holder puts when it is worth less
+    than put_price. coupon_rate, call_price and put_price may be arrays: every
+    variant is valued in the same backward induction on the same tree.
+    
+    Parameters:
+    tree: HullWhiteTree whose horizon covers T
+    face: Face value
+    coupon_rate: Annual coupon rate (scalar or one per variant)
+    T: Time to maturity (in years)
+    frequency: Coupons per year
+    call_price: Issuer's call price (None for not callable)
+    call_start: First date the bond can be called
+    put_price: Holder's put price (None for not putable)
+    put_start: First date the bond can be put
+    
+    Returns:
+    result: Dictionary with the 'fair_value' and the 'straight_value' of the
+    same bond without options, and the 'option_value' (straight minus fair
+    value: positive for the issuer's call, negative for the holder's put);
+    arrays when any term is an array
+    """
+    coupon_rate, call_price, put_price = np.broadcast_arrays(
+        np.asarray(coupon_rate, dtype=float),
+        np.asarray(np.inf if call_price is None else call_price, dtype=float),
+        np.asarray(-np.inf if put_price is None else put_price, dtype=float)
+    )
+    shape = coupon_rate.shape
+    coupon = (face * coupon_rate / frequency).reshape(-1, 1)
+    call_price, put_price = call_price.reshape(-1, 1), put_price.reshape(-1, 1)
+    
+    maturity_step = int(tree.step_of(T))
+    if maturity_step > tree.n_steps:
+        raise ValueError("The tree horizon is shorter than the bond maturity")
+    coupon_times = T - np.arange(max(1, int(np.ceil(T * frequency - 1e-9))))[::-1] / frequency
+    coupon_steps = set(tree.step_of(coupon_times).tolist())
+    call_from, put_from = int(tree.step_of(call_start)), int(tree.step_of(put_start))
+    
+    # Straight and optional bond valued side by side: axis 0 is (straight, variants...)
+    n_nodes = tree.j.size
+    value = np.broadcast_to(face + coupon, (coupon.shape[0], n_nodes)).copy()
+    straight = value.copy()
+    for i in range(maturity_step - 1, -1, -1):
+        discount = np.exp(-tree.rates[i] * tree.dt)
+        value = discount * tree.expectation(value)
+        straight = discount * tree.expectation(straight)
+        if i in coupon_steps and i > 0:
+            if i >= call_from:
+                value = np.minimum(value, call_price)
+            if i >= put_from:
+                value = np.maximum(value, put_price)
+            value = value + coupon
+            straight = straight + coupon
+    
+    center = tree.j.size // 2
+    fair, plain = value[:, center].reshape(shape), straight[:, center].reshape(shape)
+    return {'fair_value': fair[()], 'straight_value': plain[()], 'option_value': (plain - fair)[()]}
+
+
+def price_convertible_on_tree(tree, face, coupon_rate, T, S, sigma, conversion_price, credit_spread=0.0,
+                              call_price=None, call_start=0.0, frequency=1):
+    """
+    Price a convertible bond on the product of the rate tree and a stock tree.
+    
+    The stock follows a CRR binomial tree on the same time steps whose
+    up-probability at each rate node makes it drift at that node's short
+    rate; stock and rate shocks are independent. Following
+    Tsiveriotis-Fernandes, the value is split into an equity part discounted
+    at the short rate and a cash part discounted at the short rate plus the
+    credit spread. At every step the holder may convert and, from call_start,
+    the issuer may call (the holder then converts if that is worth more).
+    
+    Parameters:
+    tree: HullWhiteTree whose horizon covers T
+    face: Face value
+    coupon_rate: Annual coupon rate
+    T: Time to maturity (in years)
+    S: Current stock price
+    sigma: Stock volatility
+    conversion_price: Stock price implied by the conversion ratio
+    credit_spread: Issuer credit spread applied to the cash part
+    call_price: Issuer's call price (None for not callable)
+    call_start: First date the bond can be called
+    frequency: Coupons per year
+    
+    Returns:
+    result: Dictionary with the 'fair_value', its 'equity_part' and
+    'cash_part', and the 'conversion_ratio'
+    """
+    n_steps = int(tree.step_of(T))
+    if n_steps > tree.n_steps:
+        raise ValueError("The tree horizon is shorter than the bond maturity")
+    dt = tree.dt
+    ratio = face / conversion_price
+    call_price = np.inf if call_price is None else call_price
+    coupon = face * coupon_rate / frequency
+    coupon_times = T - np.arange(max(1, int(np.ceil(T * frequency - 1e-9))))[::-1] / frequency
+    coupon_steps = set(tree.step_of(coupon_times).tolist())
+    call_from = int(tree.step_of(call_start))
+    
+    up = np.exp(sigma * np.sqrt(dt))
+    # Risk-neutral up-probability of the stock at every (step, rate node)
+    p_up = np.clip((np.exp(tree.rates * dt) - 1 / up) / (up - 1 / up), 0.0, 1.0)
+    
+    def stock(i):
+        return S * up ** (2 * np.arange(i + 1) - i)
+    
+    # Arrays are (stock nodes, rate nodes); at maturity take the better of conversion and redemption
+    conversion = (ratio * stock(n_steps))[:, None] * np.ones(tree.j.size)
+    converts = conversion >= face + coupon
+    equity = np.where(converts, conversion, 0.0)
+    cash = np.where(converts, 0.0, face + coupon)
+    
+    for i in range(n_steps - 1, -1, -1):
+        rate, p = tree.rates[i], p_up[i]
+        # Rate branching first, so the stock move is weighted with the current node's probability
+        equity = np.exp(-rate * dt) * (p * tree.expectation(equity[1:]) + (1 - p) * tree.expectation(equity[:-1]))
+        cash = np.exp(-(rate + credit_spread) * dt) * (p * tree.expectation(cash[1:]) + (1 - p) * tree.expectation(cash[:-1]))
+        
+        conversion = (ratio * stock(i))[:, None] * np.ones(tree.j.size)
+        if i >= call_from and i > 0:
+            called = equity + cash > call_price
+            # When called the holder takes the better of the call price and conversion
+            take_shares = called & (conversion >= call_price)
+            equity = np.where(called, np.where(take_shares, conversion, 0.0), equity)
+            cash = np.where(called, np.where(take_shares, 0.0, call_price), cash)
+        converts = conversion > equity + cash
+        equity = np.where(converts, conversion, equity)
+        cash = np.where(converts, 0.0, cash)
+        if i in coupon_steps and i > 0:
+            cash = cash + np.where(converts, 0.0, coupon)
+    
+    center = tree.j.size // 2
+    return {
+        'fair_value': float(equity[0, center] + cash[0, center]),
+        'equity_part': float(equity[0, center]),
+        'cash_part': float(cash[0, center]),
+        'conversion_ratio': ratio
+    }
+
+
+# Horizon covering every maturity on the sliders, so one tree serves them all
+TREE_HORIZON = 10.0
+
+
+def render_tree_inputs(prefix):
+    """Render the Hull-White parameters and return (mean reversion, rate vol)."""
+    col1, col2 = st.columns(2)
+    with col1:
+        a = st.slider("Reversão à Média (a)", min_value=0.01, max_value=0.5, value=0.1, step=0.01,
+                      key=f"embutidos_{prefix}_hw_a")
+    with col2:
+        rate_vol = st.slider("Volatilidade da Taxa Curta (p.p.)", min_value=0.1, max_value=5.0, value=1.0,
+                             step=0.1, key=f"embutidos_{prefix}_hw_sigma") / 100
+    return a, rate_vol
+
+
+def render_coe_pricer():
+    """Render the inputs and decomposition of a capital-protected COE."""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        notional = st.number_input("Valor Aplicado (R$)", min_value=100.0, value=1000.0, step=100.0, key="embutidos_coe_notional")
+        T = st.slider("Prazo (anos)", min_value=0.5, max_value=5.0, value=2.0, step=0.5, key="embutidos_coe_T")
+    with col2:
+        r = st.slider("Taxa de Juros (%)", min_value=0.0, max_value=20.0, value=10.0, step=0.25, key="embutidos_coe_r") / 100
+        sigma = st.slider("Volatilidade do Ativo (%)", min_value=5.0, max_value=80.0, value=20.0, step=1.0, key="embutidos_coe_sigma") / 100
+    with col3:
+        participation = st.slider("Participação na Alta (%)", min_value=0.0, max_value=200.0, value=80.0, step=5.0, key="embutidos_coe_participation") / 100
+        cap = st.slider("Teto de Ganho (%, 0 = sem teto)", min_value=0.0, max_value=100.0, value=0.0, step=5.0, key="embutidos_coe_cap") / 100
+    
+    result = price_coe(notional, T, r, 100.0, sigma, participation, cap=cap or None)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Valor Justo", f"R$ {result['fair_value']:,.2f}")
+    col2.metric("Renda Fixa (Proteção)", f"R$ {result['bond_value']:,.2f}")
+    col3.metric("Opções Embutidas", f"R$ {result['option_value']:,.2f}")
+    col4.metric("Margem do Emissor", f"R$ {result['issuer_margin']:,.2f}")
+    st.caption(
+        f"Participação justa (valor justo = aplicado): {result['par_participation']:.1%} | "
+        f"Delta (1% no ativo): R$ {result['delta']:,.2f} | Vega (1 p.p.): R$ {result['vega']:,.2f} | "
+        f"Rho (1 bp): R$ {result['rho']:,.4f}"
+    )
+
+
+def render_callable_pricer():
+    """Render the inputs and decomposition of a callable bond."""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        coupon_rate = st.slider("Cupom (% a.a.)", min_value=0.0, max_value=20.0, value=10.0, step=0.25, key="embutidos_callable_coupon") / 100
+        T = st.slider("Prazo (anos)", min_value=2.0, max_value=10.0, value=5.0, step=1.0, key="embutidos_callable_T")
+    with col2:
+        r = st.slider("Taxa de Mercado (% a.a.)", min_value=1.0, max_value=20.0, value=9.0, step=0.25, key="embutidos_callable_r") / 100
+        yield_vol = st.slider("Volatilidade da Taxa (%)", min_value=1.0, max_value=50.0, value=20.0, step=1.0, key="embutidos_callable_vol") / 100
+    with col3:
+        call_price = st.number_input("Preço de Recompra", min_value=900.0, value=1020.0, step=5.0, key="embutidos_callable_price")
+        call_time = st.slider("Data de Recompra (anos)", min_value=0.5, max_value=float(T) - 0.5, value=min(2.0, float(T) - 0.5), step=0.5, key="embutidos_callable_time")
+    
+    result = price_callable_bond(1000.0, coupon_rate, T, r, yield_vol, call_price, call_time)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Valor Justo (Callable)", f"R$ {result['fair_value']:,.2f}")
+    col2.metric("Título sem Opção", f"R$ {result['straight_value']:,.2f}")
+    col3.metric("Opção do Emissor", f"R$ {result['option_value']:,.2f}")
+    col4.metric("DV01 (1 bp)", f"R$ {result['dv01']:,.4f}", f"{result['dv01'] - result['straight_dv01']:,.4f} vs. sem opção")
+    st.caption(
+        f"Valor de face R$ 1.000 com cupons anuais. Vega (1 p.p. de volatilidade da taxa): R$ {result['vega']:,.4f}"
+    )
+    
+    st.markdown("**Árvore de Hull-White (recompra em qualquer data de cupom a partir da data de recompra)**")
+    a, rate_vol = render_tree_inputs("callable")
+    tree = get_hull_white_tree(r, a, rate_vol, TREE_HORIZON)
+    
+    # One backward induction on the cached tree values every variant
+    call_prices = np.unique([1000.0, 1010.0, 1020.0, 1030.0, 1050.0, call_price])
+    variants = price_bond_on_tree(tree, 1000.0, coupon_rate, T, call_price=call_prices, call_start=call_time)
+    putable = price_bond_on_tree(tree, 1000.0, coupon_rate, T, put_price=1000.0, put_start=call_time)
+    st.dataframe({
+        "Preço de Recompra": [f"R$ {price:,.2f}" for price in call_prices],
+        "Valor do Callable": [f"R$ {value:,.2f}" for value in variants['fair_value']],
+        "Opção do Emissor": [f"R$ {value:,.2f}" for value in variants['option_value']],
+    }, hide_index=True)
+    st.caption(
+        f"Mesmo título com opção de venda do investidor ao par (putable): R$ {putable['fair_value']:,.2f} "
+        f"(opção do investidor: R$ {-putable['option_value']:,.2f})"
+    )
+
+
+def render_convertible_pricer():
+    """Render the inputs and decomposition of a convertible debenture."""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        coupon_rate = st.slider("Cupom (% a.a.)", min_value=0.0, max_value=20.0, value=6.0, step=0.25, key="embutidos_conv_coupon") / 100
+        T = st.slider("Prazo (anos)", min_value=1.0, max_value=10.0, value=3.0, step=1.0, key="embutidos_conv_T")
+        r = st.slider("Taxa Livre de Risco (% a.a.)", min_value=0.0, max_value=20.0, value=10.0, step=0.25, key="embutidos_conv_r") / 100
+    with col2:
+        credit_spread = st.slider("Spread de Crédito (% a.a.)", min_value=0.0, max_value=10.0, value=2.0, step=0.25, key="embutidos_conv_spread") / 100
+        S = st.number_input("Preço da Ação (R$)", min_value=1.0, value=18.0, step=0.5, key="embutidos_conv_S")
+    with col3:
+        sigma = st.slider("Volatilidade da Ação (%)", min_value=5.0, max_value=80.0, value=30.0, step=1.0, key="embutidos_conv_sigma") / 100
+        conversion_price = st.number_input("Preço de Conversão (R$)", min_value=1.0, value=20.0, step=0.5, key="embutidos_conv_price")
+    
+    result = price_convertible(1000.0, coupon_rate, T, r, credit_spread, S, sigma, conversion_price)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Valor Justo", f"R$ {result['fair_value']:,.2f}")
+    col2.metric("Piso de Renda Fixa", f"R$ {result['bond_value']:,.2f}")
+    col3.metric("Opção de Conversão", f"R$ {result['option_value']:,.2f}")
+    col4.metric("Prêmio de Conversão", f"{result['conversion_premium']:.1%}")
+    st.caption(
+        f"{result['conversion_ratio']:,.2f} ações por debênture de R$ 1.000 (paridade R$ {result['parity']:,.2f}) | "
+        f"Delta: {result['delta']:,.2f} ações | Vega (1 p.p.): R$ {result['vega']:,.2f} | Rho (1 bp): R$ {result['rho']:,.4f}"
+    )
+    
+    st.markdown("**Árvore de Hull-White × Árvore da Ação (conversão a qualquer momento)**")
+    a, rate_vol = render_tree_inputs("conv")
+    call_price = st.number_input("Preço de Recompra pelo Emissor (0 = sem recompra)", min_value=0.0, value=0.0,
+                                 step=10.0, key="embutidos_conv_call")
+    tree = get_hull_white_tree(r, a, rate_vol, TREE_HORIZON)
+    lattice = price_convertible_on_tree(tree, 1000.0, coupon_rate, T, S, sigma, conversion_price,
+                                        credit_spread=credit_spread, call_price=call_price or None)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Valor na Árvore", f"R$ {lattice['fair_value']:,.2f}")
+    col2.metric("Parcela em Ações", f"R$ {lattice['equity_part']:,.2f}")
+    col3.metric("Parcela em Caixa", f"R$ {lattice['cash_part']:,.2f}")
+
+
+def render_cln_pricer():
+    """Render the inputs and decomposition of a credit-linked note."""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        coupon_rate = st.slider("Cupom (% a.a.)", min_value=0.0, max_value=25.0, value=14.0, step=0.25, key="embutidos_cln_coupon") / 100
+        T = st.slider("Prazo (anos)", min_value=1.0, max_value=10.0, value=3.0, step=1.0, key="embutidos_cln_T")
+    with col2:
+        r = st.slider("Taxa Livre de Risco (% a.a.)", min_value=0.0, max_value=20.0, value=10.0, step=0.25, key="embutidos_cln_r") / 100
+        credit_spread = st.slider("Spread de CDS da Referência (% a.a.)", min_value=0.0, max_value=15.0, value=3.0, step=0.25, key="embutidos_cln_spread") / 100
+    with col3:
+        recovery = st.slider("Taxa de Recuperação (%)", min_value=0.0, max_value=90.0, value=40.0, step=5.0, key="embutidos_cln_recovery") / 100
+    
+    result = price_credit_linked_note(1000.0, coupon_rate, T, r, credit_spread, recovery)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Valor Justo", f"R$ {result['fair_value']:,.2f}")
+    col2.metric("Mesmo Fluxo sem Risco", f"R$ {result['riskfree_value']:,.2f}")
+    col3.metric("Proteção Vendida (CDS)", f"R$ {result['protection_value']:,.2f}")
+    col4.metric("Prob. de Default", f"{result['default_probability']:.1%}")
+    st.caption(
+        f"Cupom justo (valor = face): {result['par_coupon']:.2%} a.a. | "
+        f"DV01: R$ {result['dv01']:,.4f} | CS01: R$ {result['cs01']:,.4f}"
+    )
+
+
+# Products with a quantitative pricer, keyed like DERIVATIVES_INFO
+PRICER_RENDERERS = {
+    "COE com Proteção de Capital": render_coe_pricer,
+    "Opção de Compra (Call) - Callable Bond": render_callable_pricer,
+    "Opção de Conversão - Debênture Conversível": render_convertible_pricer,
+    "Credit-Linked Note (CLN)": render_cln_pricer,
+}
+
+
 def render():
     """
     Função principal que renderiza o módulo de Derivativos Embutidos.
@@ -186,6 +796,11 @@ def render():
     with st.expander("ℹ️ Explicação sobre " + selected_derivative, expanded=True):
         st.markdown(DERIVATIVES_INFO[selected_derivative]["description"])
     
+    # Fair value and sensitivities for the products with a pricer
+    if selected_derivative in PRICER_RENDERERS:
+        with st.expander("🧮 Precificação Quantitativa", expanded=True):
+            PRICER_RENDERERS[selected_derivative]()
+    
     # Determine appropriate height for the animation
     # The margin effect animation is taller due to its multi-section layout
     animation_height = 1200 if selected_derivative == "Efeito das Margens no Mercado Futuro" else 1100